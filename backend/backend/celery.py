@@ -1,6 +1,7 @@
 import os
 
 from celery import Celery
+from kombu import Queue
 
 # Set the default Django settings module for the "celery" program
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
@@ -13,5 +14,41 @@ app = Celery('backend')
 #   should have a `CELERY_` prefix.
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
+# Очереди: interactive - письма и обработка, которых ждет пользователь, bulk - рассылки и тяжелая обработка,
+# maintenance - резервное копирование и обслуживание. Каждую очередь обслуживает отдельный воркер (docker-compose),
+# поэтому ночная копия базы не задерживает письмо активации
+app.conf.task_queues = (
+    Queue('interactive'),
+    Queue('bulk'),
+    Queue('maintenance'),
+)
+app.conf.task_default_queue = 'interactive'
+
+# Приоритет внутри очереди: в Redis 0 - наивысший, 9 - низший
+app.conf.task_default_priority = 5
+app.conf.broker_transport_options = {
+    'queue_order_strategy': 'priority',
+    'priority_steps': list(range(10)),
+    'sep': ':',
+}
+# Воркер не резервирует задачи заранее: задача с более высоким приоритетом не ждет за уже полученными
+app.conf.worker_prefetch_multiplier = 1
+
+app.conf.task_routes = {
+    'modules.services.tasks.send_activate_email_message_task': {'queue': 'interactive', 'priority': 0},
+    'modules.services.tasks.send_password_reset_email_message_task': {'queue': 'interactive', 'priority': 0},
+    'modules.services.tasks.send_contact_email_message_tasks': {'queue': 'interactive', 'priority': 3},
+    'modules.services.tasks.notify_followers_task': {'queue': 'interactive', 'priority': 7},
+    'modules.services.tasks.generate_image_variants_task': {'queue': 'bulk', 'priority': 3},
+    # Обработка текста статьи создает варианты изображений (Pillow): тяжелая работа для bulk
+    'modules.services.tasks.render_article_body_task': {'queue': 'bulk', 'priority': 3},
+    'modules.services.tasks.send_followers_notification_task': {'queue': 'bulk', 'priority': 5},
+    'modules.services.tasks.send_followers_digest_task': {'queue': 'bulk', 'priority': 7},
+    'modules.services.tasks.render_static_pages_task': {'queue': 'bulk', 'priority': 5},
+    'modules.services.tasks.dbackup_task': {'queue': 'maintenance'},
+    'modules.services.tasks.maintain_viewcount_partitions_task': {'queue': 'maintenance'},
+    'modules.services.tasks.explain_slow_query_task': {'queue': 'maintenance'},
+}
+
 # Load task modules from all registred Django apps
 app.autodiscover_tasks()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 from celery.schedules import crontab
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
     # 'modules.blog',
     'modules.system.apps.SystemConfig',
     'modules.services',
+    'modules.api.apps.ApiConfig',
     'mptt',
     'debug_toolbar',
     'taggit',
@@ -60,7 +62,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'modules.system.middleware.MetricsMiddleware',
+    'modules.system.middleware.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'modules.system.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -113,9 +118,36 @@ DATABASES = {
         'PASSWORD': env('POSTGRES_PASSWORD'),
         'HOST': env('POSTGRES_HOST'),
         'PORT': env('POSTGRES_PORT'),
+        # Постоянные соединения с проверкой перед использованием; время жизни задается для каждого типа процесса
+        'CONN_MAX_AGE': int(env('POSTGRES_CONN_MAX_AGE', default=60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Встроенный пул соединений psycopg 3 (требует Django 5.1+ и psycopg[pool]), заменяет постоянные соединения
+if env.bool('POSTGRES_POOL', default=False):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(env('POSTGRES_POOL_MIN_SIZE', default=1)),
+            'max_size': int(env('POSTGRES_POOL_MAX_SIZE', default=4)),
+        },
+    }
+
+# Реплики только для чтения: список host[:port] с той же базой и пользователем, что и основная
+for number, replica in enumerate(env.list('POSTGRES_REPLICAS', default=[]), start=1):
+    replica_host, _, replica_port = replica.partition(':')
+    DATABASES[f'replica{number}'] = dict(DATABASES['default'], HOST=replica_host,
+                                         PORT=replica_port or DATABASES['default']['PORT'],
+                                         TEST={'MIRROR': 'default'})
+
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['modules.services.routers.PrimaryReplicaRouter']
+
+# Время (в секундах), в течение которого запросы пользователя после записи читают из основной базы
+REPLICA_PIN_SECONDS = int(env('REPLICA_PIN_SECONDS', default=5))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -154,9 +186,51 @@ STATIC_ROOT = (BASE_DIR / 'static')
 
 STATICFILES_DIRS = [BASE_DIR / 'templates/src']
 
+STATICFILES_FINDERS = [
+    'django.contrib.staticfiles.finders.FileSystemFinder',
+    'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+    'modules.services.staticfiles.ScriptBundleFinder',
+]
+
+# Сборки JS: имя файла сборки -> исходные файлы в порядке подключения (склеиваются и минифицируются)
+STATIC_BUNDLES = {
+    'custom/js/site.js': [
+        'custom/js/backend.js',
+        'custom/js/ratings.js',
+        'custom/js/comments.js',
+        'custom/js/profile.js',
+    ],
+}
+
+# Статические файлы с хэшем содержимого в имени и сжатыми копиями (создаются в collectstatic)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'modules.services.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+# Ошибка для статического файла без записи в манифесте collectstatic. Без строгой проверки (разработка, тесты)
+# используется исходное имя файла
+STATIC_MANIFEST_STRICT = int(env('STATIC_MANIFEST_STRICT', default=not DEBUG and sys.argv[1:2] != ['test']))
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = (BASE_DIR / 'media')
 
+# Ширины адаптивных вариантов изображений (генерируются в Celery задаче)
+THUMBNAIL_VARIANT_WIDTHS = (240, 480, 960)
+AVATAR_VARIANT_WIDTHS = (64, 150, 300)
+
+# Обработка изображений в тексте статей: большие изображения заменяются уменьшенными вариантами
+ARTICLE_IMAGE_MAX_WIDTH = 960
+ARTICLE_IMAGE_VARIANT_WIDTHS = (480, 960)
+ARTICLE_IMAGE_SIZES = '(min-width: 992px) 640px, 100vw'
+ARTICLE_EXCERPT_WORDS = 50
+
+# TrueType шрифт для инициалов в аватарах по умолчанию (None - встроенный шрифт Pillow)
+DEFAULT_AVATAR_FONT = env('DEFAULT_AVATAR_FONT', default=None)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -169,6 +243,12 @@ EMAIL_USE_SSL = int(env('EMAIL_USE_SSL', default=1))
 
 EMAIL_HOST_USER = env('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
+EMAIL_TIMEOUT = int(env('EMAIL_TIMEOUT', default=10))
+
+# Уведомления подписчиков о новых статьях: получателей в одной задаче и порог публикаций автора за сутки,
+# после которого уведомления собираются в дайджест
+FOLLOWERS_NOTIFICATION_CHUNK_SIZE = int(env('FOLLOWERS_NOTIFICATION_CHUNK_SIZE', default=500))
+FOLLOWERS_DIGEST_THRESHOLD = int(env('FOLLOWERS_DIGEST_THRESHOLD', default=3))
 
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 SERVER_EMAIL = EMAIL_HOST_USER
@@ -207,7 +287,8 @@ customColorPalette = [
 ]
 
 CKEDITOR_5_CUSTOM_CSS = 'path_to.css'  # optional
-CKEDITOR_5_FILE_STORAGE = 'modules.services.utils.CkeditorCustomStorage'  # optional
+# CkeditorHashedStorage - хранение по хэшу содержимого без дублей, CkeditorCustomStorage - по датам загрузки
+CKEDITOR_5_FILE_STORAGE = env('CKEDITOR_5_FILE_STORAGE', default='modules.services.utils.CkeditorHashedStorage')
 CKEDITOR_5_CONFIGS = {
     'default': {
         'toolbar': ['heading', '|', 'bold', 'italic', 'link',
@@ -279,11 +360,61 @@ CKEDITOR_5_CONFIGS = {
 # Настройки кэширования через redis
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'BACKEND': 'modules.services.cache.InstrumentedRedisCache',
         'LOCATION': env('REDIS_LOCATION'),
     }
 }
 
+# Метрики Prometheus: каталог для объединения метрик процессов gunicorn/celery и адреса, которым доступен /metrics
+METRICS_DIR = env('METRICS_DIR', default=None)
+METRICS_FLUSH_INTERVAL = int(env('METRICS_FLUSH_INTERVAL', default=5))
+# Файлы метрик процессов других узлов без обновлений дольше этого времени (секунды) считаются файлами
+# завершенных процессов (контейнер пересоздан или остановлен без завершения процессов)
+METRICS_SNAPSHOT_MAX_AGE = int(env('METRICS_SNAPSHOT_MAX_AGE', default=24 * 60 * 60))
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=['127.0.0.1'])
+
+# Журнал медленных SQL запросов: порог в мс (0 - отключено) и доля запросов с планом EXPLAIN (только PostgreSQL).
+# EXPLAIN ANALYZE выполняет медленный запрос повторно: каждый запрос с планом удваивает свою нагрузку на базу,
+# поэтому доля держится небольшой (для запросов представлений план получает задача в очереди maintenance);
+# SLOW_QUERY_EXPLAIN_ANALYZE=0 - только оценочный план без выполнения
+SLOW_QUERY_THRESHOLD_MS = int(env('SLOW_QUERY_THRESHOLD_MS', default=200))
+SLOW_QUERY_EXPLAIN_RATE = float(env('SLOW_QUERY_EXPLAIN_RATE', default=0.1))
+SLOW_QUERY_EXPLAIN_ANALYZE = env.bool('SLOW_QUERY_EXPLAIN_ANALYZE', default=True)
+# Журнал пишут все процессы gunicorn и celery: файл только дописывается, а ротацию выполняет внешний logrotate
+# (WatchedFileHandler открывает файл заново после переименования). SLOW_QUERY_LOG_BACKUPS - количество ротированных
+# файлов path.1 ... path.N (rotate в настройках logrotate, без compress), которые читает slow_queries_report
+SLOW_QUERY_LOG = env('SLOW_QUERY_LOG', default=BASE_DIR / 'docker' / 'logs' / 'slow-queries.log')
+SLOW_QUERY_LOG_BACKUPS = int(env('SLOW_QUERY_LOG_BACKUPS', default=5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'encoding': 'utf-8',
+            'delay': True,
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Дополнительные признаки роботов (к спискам modules/services/bots.py): просмотры роботов не записываются
+BOT_EXTRA_USER_AGENTS = env.list('BOT_EXTRA_USER_AGENTS', default=[])
+BOT_EXTRA_SEARCH_ENGINE_USER_AGENTS = env.list('BOT_EXTRA_SEARCH_ENGINE_USER_AGENTS', default=[])
+BOT_EXTRA_NETWORKS = env.list('BOT_EXTRA_NETWORKS', default=[])
+
 AUTHENTICATION_BACKENDS = [
     'modules.system.backends.UserModelBackend'
 ]
@@ -292,7 +423,8 @@ AUTHENTICATION_BACKENDS = [
 
 CELERY_BROKER_URL = env('CELERY_BROKER_URL')
 CELERY_RESULT_BACKEND = env('CELERY_RESULT_BACKEND')
-CELERY_TASK_TRACK_STARTED = True
+# Результаты задач нигде не читаются (письма, превью, рассылки): не записываем их и статус STARTED в backend
+CELERY_TASK_IGNORE_RESULT = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_RESULT_SERIALIZER = 'json'
@@ -302,7 +434,51 @@ CELERY_TIMEZONE = 'Europe/Moscow'
 CELERY_BEAT_SCHEDULE = {
     'backup_database': {
         'task': 'modules.services.tasks.dbackup_task',  # Путь к задаче указанной в tasks
-        'schedule': crontab(hour=0, minute=0), # Резервная копия будет создаваться каждый день в полночь
+        'schedule': crontab(hour=0, minute=0, day_of_week=0),  # Полная резервная копия каждое воскресенье в полночь
+    },
+    'backup_database_incremental': {
+        'task': 'modules.services.tasks.dbackup_task',
+        'schedule': crontab(hour=0, minute=0, day_of_week='1-6'),  # В остальные дни - только измененные записи
+        'kwargs': {'incremental': True},
+    },
+    'followers_digest': {
+        'task': 'modules.services.tasks.send_followers_digest_task',
+        'schedule': crontab(hour=8, minute=0),  # Дайджест новых статей для подписчиков активных авторов
+    },
+    'maintain_viewcount_partitions': {
+        'task': 'modules.services.tasks.maintain_viewcount_partitions_task',
+        'schedule': crontab(hour=3, minute=30),  # Секции просмотров вперед и перенос старых просмотров в итоги
+    },
+    'render_static_pages': {
+        'task': 'modules.services.tasks.render_static_pages_task',
+        'schedule': crontab(minute='*/15'),  # Все заранее отрисованные страницы (блоки боковой колонки, теги)
     },
 }
 
+# Просмотры статей: месячные секции создаются на VIEWCOUNT_PARTITIONS_AHEAD месяцев вперед,
+# просмотры старше VIEWCOUNT_RETENTION_MONTHS месяцев переносятся в помесячные итоги ArticleViewRollup
+VIEWCOUNT_PARTITIONS_AHEAD = int(env('VIEWCOUNT_PARTITIONS_AHEAD', default=3))
+VIEWCOUNT_RETENTION_MONTHS = int(env('VIEWCOUNT_RETENTION_MONTHS', default=12))
+
+# Постраничный вывод больших таблиц (EstimatedCountPaginator): выше порога количество строк берется
+# из статистики PostgreSQL, с фильтрами подсчет ограничен порогом
+ESTIMATED_COUNT_THRESHOLD = int(env('ESTIMATED_COUNT_THRESHOLD', default=10000))
+
+# JSON API (api/v1/): размер страницы по умолчанию и максимальный (параметр limit), время кэширования ответа
+API_PAGE_SIZE = int(env('API_PAGE_SIZE', default=20))
+API_MAX_PAGE_SIZE = int(env('API_MAX_PAGE_SIZE', default=100))
+API_CACHE_SECONDS = int(env('API_CACHE_SECONDS', default=60))
+
+# Страницы для анонимных посетителей, отрисованные заранее (статьи и первые STATIC_PAGES_LIST_PAGES страниц списков):
+# nginx отдает их из STATIC_PAGES_ROOT без Django, задача перерисовывает страницы статьи через STATIC_PAGES_DEBOUNCE
+# секунд после изменения статьи, комментария или оценки. Включается вместе с блоком try_files в docker/nginx/prod
+STATIC_PAGES_ENABLED = int(env('STATIC_PAGES_ENABLED', default=0))
+STATIC_PAGES_ROOT = env('STATIC_PAGES_ROOT', default=BASE_DIR / 'pages')
+STATIC_PAGES_LIST_PAGES = int(env('STATIC_PAGES_LIST_PAGES', default=3))
+STATIC_PAGES_DEBOUNCE = int(env('STATIC_PAGES_DEBOUNCE', default=10))
+
+# Резервное копирование
+DBACKUP_DIR = env('DBACKUP_DIR', default=BASE_DIR / 'backups')
+# Таблицы без поля time_update, записи которых только добавляются (инкрементальная копия по дате создания)
+DBACKUP_APPEND_ONLY_MODELS = ('blog.viewcount', 'system.feedback')
+
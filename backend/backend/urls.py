@@ -22,6 +22,7 @@ from django.contrib.sitemaps.views import sitemap
 
 from modules.blog.sitemaps import StaticSitemap, ArticleSitemap
 from modules.blog.feeds import LatestArticlesFeed
+from modules.system.views import MetricsView
 
 
 sitemaps = {
@@ -38,6 +39,8 @@ urlpatterns = [
     path('ckeditor5/', include('django_ckeditor_5.urls')),
     path('admin/', admin.site.urls),
     path('feeds/latest/', LatestArticlesFeed(), name='latest_articles_feed'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('api/v1/', include('modules.api.urls')),
     path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
     path('', include('modules.blog.urls')),
     path('', include('modules.system.urls')),
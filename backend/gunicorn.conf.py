@@ -0,0 +1,12 @@
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+
+def child_exit(server, worker):
+    """
+    Метрики воркера, завершенного без atexit (таймаут, SIGKILL), переносятся в общий файл завершенных процессов
+    """
+    from modules.services.metrics import get_snapshot_name, retire_snapshot
+
+    retire_snapshot(get_snapshot_name(worker.pid))
@@ -0,0 +1,39 @@
+import base64
+import json
+
+from django.db.models import Q
+
+
+def encode_cursor(obj, ordering):
+    """
+    Курсор следующей страницы: значения полей сортировки последнего объекта страницы
+    """
+    values = [getattr(obj, field.lstrip('-')) for field in ordering]
+    # Даты с микросекундами (DjangoJSONEncoder округляет до миллисекунд, и строки на границе страницы терялись бы)
+    cursor = json.dumps(values, default=lambda value: value.isoformat())
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_cursor(cursor, ordering):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def keyset_filter(ordering, values):
+    """
+    Условие выборки после курсора: (a, b) > (x, y) раскрывается в a > x OR (a = x AND b > y).
+    В отличие от OFFSET, дальние страницы читают столько же строк, сколько первая
+    """
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    return condition
@@ -0,0 +1,178 @@
+from django.urls import reverse
+from taggit.models import Tag
+
+from modules.blog.models import Article, Category, Comment
+from modules.system.models import Profile
+
+
+class ApiField:
+    """
+    Поле ответа API: функция значения, столбцы для only() и связи, которые нужно загрузить для этого поля
+    """
+
+    def __init__(self, get, only=(), select_related=(), prefetch_related=()):
+        self.get = get
+        self.only = only
+        self.select_related = select_related
+        self.prefetch_related = prefetch_related
+
+
+def model_field(name):
+    return ApiField(lambda obj: getattr(obj, name), only=(name,))
+
+
+def get_thumbnail(article):
+    if not article.thumbnail:
+        return None
+    storage = article.thumbnail.storage
+    variants = [
+        {'width': variant['width'], 'height': variant['height'], 'jpeg': storage.url(variant['jpeg']),
+         'webp': storage.url(variant['webp'])}
+        for variant in article.thumbnail_variants.get('variants', [])
+    ]
+    return {'url': article.thumbnail.url, 'variants': variants}
+
+
+class Resource:
+    """
+    Ресурс API: поля ответа, поля по умолчанию (параметр fields выбирает другой набор)
+    и сортировка, значения которой образуют курсор
+    """
+    fields = {}
+    default_fields = ()
+    ordering = ('id',)
+    lookup_field = 'slug'
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get_field_names(self, value):
+        if not value:
+            return list(self.default_fields)
+        names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+        return names
+
+    def prepare(self, queryset, names):
+        """
+        Выборка только столбцов и связей запрошенных полей
+        """
+        only = [field.lstrip('-') for field in self.ordering]
+        select_related, prefetch_related = [], []
+        for name in names:
+            field = self.fields[name]
+            only.extend(field.only)
+            select_related.extend(field.select_related)
+            prefetch_related.extend(field.prefetch_related)
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if select_related:
+            queryset = queryset.select_related(*dict.fromkeys(select_related))
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*dict.fromkeys(prefetch_related))
+        return queryset.only(*dict.fromkeys(only)).order_by(*self.ordering)
+
+    def serialize(self, obj, names):
+        return {name: self.fields[name].get(obj) for name in names}
+
+
+class ArticleResource(Resource):
+    """
+    Опубликованные статьи (ArticleManager.all()); полный текст выбирается только по fields=full_description
+    """
+    fields = {
+        'id': model_field('id'),
+        'title': model_field('title'),
+        'slug': model_field('slug'),
+        'url': ApiField(lambda article: article.get_absolute_url(), only=('slug',)),
+        'short_description': model_field('short_description'),
+        'full_description': ApiField(lambda article: article.full_description_html or article.full_description,
+                                     only=('full_description', 'full_description_html')),
+        'thumbnail': ApiField(get_thumbnail, only=('thumbnail', 'thumbnail_variants')),
+        'time_create': model_field('time_create'),
+        'time_update': model_field('time_update'),
+        'fixed': model_field('fixed'),
+        'author': ApiField(lambda article: {'id': article.author_id, 'username': article.author.username},
+                           only=('author__username',), select_related=('author',)),
+        'category': ApiField(
+            lambda article: {'id': article.category_id, 'title': article.category.title,
+                             'slug': article.category.slug},
+            only=('category__title', 'category__slug'), select_related=('category',)),
+        'tags': ApiField(lambda article: [tag.name for tag in article.tags.all()], prefetch_related=('tags',)),
+        'rating': ApiField(lambda article: article.get_sum_rating(), prefetch_related=('ratings',)),
+        'views': ApiField(lambda article: article.get_view_count()),
+    }
+    default_fields = ('id', 'title', 'slug', 'url', 'short_description', 'thumbnail', 'time_create', 'author',
+                      'category', 'views')
+    # Порядок страницы списка статей, обслуживается индексом (-fixed, -time_create, status)
+    ordering = ('-fixed', '-time_create', '-id')
+
+    def get_queryset(self):
+        return Article.objects.all()
+
+
+class CategoryResource(Resource):
+    fields = {
+        'id': model_field('id'),
+        'title': model_field('title'),
+        'slug': model_field('slug'),
+        'url': ApiField(lambda category: category.get_absolute_url(), only=('slug',)),
+        'description': model_field('description'),
+        'parent': ApiField(lambda category: category.parent_id, only=('parent',)),
+        'level': model_field('level'),
+    }
+    default_fields = tuple(fields)
+    ordering = ('tree_id', 'lft')
+
+    def get_queryset(self):
+        return Category.objects.all()
+
+
+class TagResource(Resource):
+    fields = {
+        'id': model_field('id'),
+        'name': model_field('name'),
+        'slug': model_field('slug'),
+        'url': ApiField(lambda tag: reverse('articles_by_tags', args=[tag.slug]), only=('slug',)),
+    }
+    default_fields = tuple(fields)
+
+    def get_queryset(self):
+        return Tag.objects.all()
+
+
+class CommentResource(Resource):
+    """
+    Опубликованные комментарии в порядке дерева
+    """
+    fields = {
+        'id': model_field('id'),
+        'parent': ApiField(lambda comment: comment.parent_id, only=('parent',)),
+        'level': model_field('level'),
+        'author': ApiField(lambda comment: {'id': comment.author_id, 'username': comment.author.username},
+                           only=('author__username',), select_related=('author',)),
+        'content': model_field('content'),
+        'time_create': model_field('time_create'),
+    }
+    default_fields = tuple(fields)
+    ordering = ('tree_id', 'lft')
+
+    def get_queryset(self):
+        return Comment.objects.filter(status='published')
+
+
+class ProfileResource(Resource):
+    fields = {
+        'id': model_field('id'),
+        'slug': model_field('slug'),
+        'username': ApiField(lambda profile: profile.user.username, only=('user__username',),
+                             select_related=('user',)),
+        'url': ApiField(lambda profile: profile.get_absolute_url(), only=('slug',)),
+        'avatar': ApiField(lambda profile: profile.get_avatar, only=('avatar', 'avatar_variants', 'slug')),
+        'bio': model_field('bio'),
+    }
+    default_fields = tuple(fields)
+
+    def get_queryset(self):
+        return Profile.objects.filter(user__is_active=True)
@@ -0,0 +1,72 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from modules.blog.models import Article
+from modules.services.testing import QueryBudgetTestCase
+from .urls import urlpatterns
+
+# Create your tests here.
+
+# Максимальное количество SQL запросов для каждого адреса api/urls.py
+QUERY_BUDGETS = {
+    'api_articles': 3,
+    'api_articles_detail': 1,
+    'api_article_comments': 1,
+    'api_categories': 1,
+    'api_tags': 1,
+    'api_profiles': 1,
+    'api_profiles_detail': 1,
+}
+
+
+class ApiQueryBudgetTest(QueryBudgetTestCase):
+    """
+    Бюджет SQL запросов, курсор и ETag для JSON API
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.article = Article.objects.filter(status='published', comments__isnull=False).first()
+        cls.profile = cls.article.author.profile
+
+    def test_every_url_has_budget(self):
+        self.assertEqual({pattern.name for pattern in urlpatterns}, set(QUERY_BUDGETS))
+
+    def test_budgets(self):
+        urls = {
+            'api_articles': reverse('api_articles') + '?fields=id,title,author,category,tags,rating,views',
+            'api_articles_detail': reverse('api_articles_detail', args=[self.article.slug]),
+            'api_article_comments': reverse('api_article_comments', args=[self.article.slug]),
+            'api_categories': reverse('api_categories'),
+            'api_tags': reverse('api_tags'),
+            'api_profiles': reverse('api_profiles'),
+            'api_profiles_detail': reverse('api_profiles_detail', args=[self.profile.slug]),
+        }
+        for name, url in urls.items():
+            with self.subTest(name):
+                self.assertQueryBudget(url, QUERY_BUDGETS[name])
+
+    def test_cursor_pagination(self):
+        url, slugs = reverse('api_articles') + '?limit=7&fields=slug', []
+        while url:
+            data = self.client.get(url).json()
+            slugs.extend(article['slug'] for article in data['results'])
+            url = data['next']
+        self.assertEqual(slugs, list(Article.objects.all().order_by('-fixed', '-time_create', '-id')
+                                 .values_list('slug', flat=True)))
+
+    def test_sparse_fields(self):
+        url = reverse('api_articles_detail', args=[self.article.slug])
+        with CaptureQueriesContext(connection) as context:
+            data = self.client.get(url + '?fields=title').json()
+        self.assertEqual(data, {'title': self.article.title})
+        self.assertFalse(any('full_description' in query['sql'] for query in context.captured_queries))
+        self.assertIn('full_description', self.client.get(url + '?fields=full_description').json())
+        self.assertEqual(self.client.get(url + '?fields=password').status_code, 400)
+
+    def test_etag(self):
+        url = reverse('api_articles_detail', args=[self.article.slug])
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
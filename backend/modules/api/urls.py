@@ -0,0 +1,14 @@
+from django.urls import path
+
+from .views import ArticleListApiView, ArticleDetailApiView, ArticleCommentListApiView, CategoryListApiView, \
+    TagListApiView, ProfileListApiView, ProfileDetailApiView
+
+urlpatterns = [
+    path('articles/', ArticleListApiView.as_view(), name='api_articles'),
+    path('articles/<str:slug>/', ArticleDetailApiView.as_view(), name='api_articles_detail'),
+    path('articles/<str:slug>/comments/', ArticleCommentListApiView.as_view(), name='api_article_comments'),
+    path('categories/', CategoryListApiView.as_view(), name='api_categories'),
+    path('tags/', TagListApiView.as_view(), name='api_tags'),
+    path('profiles/', ProfileListApiView.as_view(), name='api_profiles'),
+    path('profiles/<str:slug>/', ProfileDetailApiView.as_view(), name='api_profiles_detail'),
+]
@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, set_response_etag
+from django.views.generic import View
+
+from .pagination import decode_cursor, encode_cursor, keyset_filter
+from .resources import ArticleResource, CategoryResource, CommentResource, ProfileResource, TagResource
+from ..services.routers import get_read_database
+
+
+class ResourceView(View):
+    """
+    Базовое представление API только для чтения: JSON ответ с ETag (304 при совпадении If-None-Match)
+    """
+    resource = None
+    http_method_names = ['get', 'head', 'options']
+
+    def get_queryset(self):
+        return self.resource.get_queryset().using(get_read_database())
+
+    def get_field_names(self):
+        return self.resource.get_field_names(self.request.GET.get('fields'))
+
+    def error(self, message, status=400):
+        return JsonResponse({'error': message}, status=status)
+
+    def render(self, data):
+        response = JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+        patch_cache_control(response, max_age=settings.API_CACHE_SECONDS)
+        set_response_etag(response)
+        return get_conditional_response(self.request, etag=response.headers['ETag'], response=response)
+
+
+class ResourceListView(ResourceView):
+    """
+    Список ресурса с постраничным выводом по курсору (параметры cursor и limit)
+    """
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get('limit', settings.API_PAGE_SIZE))
+        except ValueError:
+            raise ValueError('Invalid limit')
+        if not 1 <= limit <= settings.API_MAX_PAGE_SIZE:
+            raise ValueError(f'Limit must be between 1 and {settings.API_MAX_PAGE_SIZE}')
+        return limit
+
+    def get(self, request, *args, **kwargs):
+        try:
+            names = self.get_field_names()
+            limit = self.get_limit()
+        except ValueError as error:
+            return self.error(str(error))
+
+        ordering = self.resource.ordering
+        queryset = self.resource.prepare(self.get_queryset(), names)
+        if request.GET.get('cursor'):
+            try:
+                queryset = queryset.filter(keyset_filter(ordering, decode_cursor(request.GET['cursor'], ordering)))
+            except (ValueError, TypeError, ValidationError):
+                return self.error('Invalid cursor')
+
+        objects = list(queryset[:limit + 1])
+        next_url = None
+        if len(objects) > limit:
+            objects = objects[:limit]
+            params = request.GET.copy()
+            params['cursor'] = encode_cursor(objects[-1], ordering)
+            next_url = f'{request.path}?{params.urlencode()}'
+        return self.render({
+            'results': [self.resource.serialize(obj, names) for obj in objects],
+            'next': next_url,
+        })
+
+
+class ResourceDetailView(ResourceView):
+
+    def get(self, request, *args, **kwargs):
+        try:
+            names = self.get_field_names()
+        except ValueError as error:
+            return self.error(str(error))
+
+        lookup_field = self.resource.lookup_field
+        obj = self.resource.prepare(self.get_queryset(), names).filter(**{lookup_field: kwargs[lookup_field]}).first()
+        if obj is None:
+            return self.error('Not found', status=404)
+        return self.render(self.resource.serialize(obj, names))
+
+
+class ArticleListApiView(ResourceListView):
+    """
+    Список статей с фильтрами по категории и тегу (параметры category и tag - slug)
+    """
+    resource = ArticleResource()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.GET.get('category'):
+            queryset = queryset.filter(category__slug=self.request.GET['category'])
+        if self.request.GET.get('tag'):
+            queryset = queryset.filter(tags__slug=self.request.GET['tag'])
+        return queryset
+
+
+class ArticleDetailApiView(ResourceDetailView):
+    resource = ArticleResource()
+
+
+class ArticleCommentListApiView(ResourceListView):
+    resource = CommentResource()
+
+    def get_queryset(self):
+        return super().get_queryset().filter(article__slug=self.kwargs['slug'], article__status='published')
+
+
+class CategoryListApiView(ResourceListView):
+    resource = CategoryResource()
+
+
+class TagListApiView(ResourceListView):
+    resource = TagResource()
+
+
+class ProfileListApiView(ResourceListView):
+    resource = ProfileResource()
+
+
+class ProfileDetailApiView(ResourceDetailView):
+    resource = ProfileResource()
@@ -1,8 +1,18 @@
 from django.contrib import admin
-
-from .models import Article, Category, Comment, Rating, ViewCount
+from django.contrib.admin.views.main import ChangeList
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.text import Truncator
+
+from .models import Article, ArticleViewRollup, Category, Comment, Rating, ViewCount
 from mptt.admin import DraggableMPTTAdmin
 
+from modules.services.paginators import EstimatedCountPaginator
+from modules.services.tasks import schedule_static_pages_render
+
 
 # Register your models here.
 
@@ -29,25 +39,130 @@ class ArticleAdmin(admin.ModelAdmin):
 # admin.site.register(Article)
 
 
+class EstimatedCountChangeList(ChangeList):
+    """
+    Список с EstimatedCountPaginator: после точного подсчета строк на странице за пределами таблицы
+    номер страницы и количество результатов берутся из исправленного пагинатора
+    """
+
+    def get_results(self, request):
+        super().get_results(request)
+        if self.result_count != self.paginator.count:
+            self.result_count = self.paginator.count
+            self.multi_page = self.result_count > self.list_per_page
+            self.page_num = min(self.page_num, self.paginator.num_pages)
+
+
+class LargeTableAdminMixin:
+    """
+    Настройки списков больших таблиц: оценка количества строк вместо COUNT(*) по всей таблице,
+    фильтрация только по дате (date_hierarchy) без загрузки значений связанных моделей
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_filter = ()
+    list_per_page = 50
+
+    def get_changelist(self, request, **kwargs):
+        return EstimatedCountChangeList
+
+
 @admin.register(Comment)
-class CommentAdminPage(DraggableMPTTAdmin):
+class CommentAdminPage(LargeTableAdminMixin, admin.ModelAdmin):
     """
-    Админ-панель модели комментариев
+    Админ-панель модели комментариев: список отсортирован по деревьям (новые обсуждения сверху, ответы
+    под родительским комментарием), большое дерево может продолжаться на следующей странице.
+    Ссылка статьи оставляет в списке только ее комментарии. Модерация - действиями над выбранными
+    комментариями одним запросом UPDATE/DELETE
     """
 
-    list_display = ('tree_actions', 'indented_title', 'article', 'author', 'time_create', 'status')
-    mptt_level_indent = 2
-    list_display_links = ('article',)
-    list_filter = ('time_create', 'time_update', 'author')
-    list_editable = ('status',)
+    list_display = ('indented_content', 'article_link', 'author', 'time_create', 'status')
+    list_select_related = ('article', 'author')
+    raw_id_fields = ('article', 'author', 'parent')
+    date_hierarchy = 'time_create'
+    ordering = ('-tree_id', 'lft')
+    actions = ('publish_comments', 'unpublish_comments', 'delete_comments')
+
+    @admin.display(description='Комментарий')
+    def indented_content(self, obj):
+        return format_html('<div style="margin-left: {}em">{}</div>', obj.level * 2,
+                           Truncator(obj.content).chars(100))
+
+    @admin.display(description='Статья', ordering='article')
+    def article_link(self, obj):
+        url = reverse('admin:blog_comment_changelist')
+        return format_html('<a href="{}?article__id__exact={}">{}</a>', url, obj.article_id, obj.article)
+
+    def get_actions(self, request):
+        # Стандартное удаление загружает и удаляет комментарии по одному с перестроением дерева
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    @admin.action(description='Опубликовать выбранные комментарии', permissions=['change'])
+    def publish_comments(self, request, queryset):
+        article_ids = list(queryset.order_by().values_list('article', flat=True).distinct())
+        updated = queryset.update(status='published')
+        schedule_static_pages_render(article_ids)
+        self.message_user(request, f'Опубликовано комментариев: {updated}')
+
+    @admin.action(description='Снять с публикации выбранные комментарии', permissions=['change'])
+    def unpublish_comments(self, request, queryset):
+        article_ids = list(queryset.order_by().values_list('article', flat=True).distinct())
+        updated = queryset.update(status='draft')
+        schedule_static_pages_render(article_ids)
+        self.message_user(request, f'Снято с публикации комментариев: {updated}')
+
+    @admin.action(description='Удалить выбранные комментарии с ответами', permissions=['delete'])
+    def delete_comments(self, request, queryset):
+        """
+        Удаление комментариев вместе с ответами. Деревья с оставшимися комментариями перестраиваются
+        одним запросом UPDATE: lft/rght сдвигаются на ширину удаленных левее поддеревьев.
+        QuerySet.delete отправляет post_delete, перерисовку страниц статей планирует приемник модели
+        """
+        selected = queryset.order_by().values('pk')
+        descendants = Comment.objects.filter(
+            pk__in=selected, tree_id=OuterRef('tree_id'), lft__lte=OuterRef('lft'), rght__gte=OuterRef('rght'))
+        ancestors = Comment.objects.filter(
+            pk__in=selected, tree_id=OuterRef('tree_id'), lft__lt=OuterRef('lft'), rght__gt=OuterRef('rght'))
+        # Выбранные комментарии без выбранных предков: корни удаляемых поддеревьев
+        subtrees = queryset.order_by().filter(~Exists(ancestors))
+        deleted_roots = set(subtrees.filter(level=0).values_list('tree_id', flat=True))
+        tree_ids = set(subtrees.filter(level__gt=0).values_list('tree_id', flat=True)) - deleted_roots
+
+        def gap(field):
+            widths = subtrees.filter(tree_id=OuterRef('tree_id'), rght__lt=OuterRef(field)).values('tree_id') \
+                .annotate(width=Sum(F('rght') - F('lft') + 1)).values('width')
+            return Coalesce(Subquery(widths), 0)
+
+        with transaction.atomic(), Comment.objects.disable_mptt_updates():
+            # Список до сдвига: после него оставшиеся узлы могут попасть в диапазоны удаляемых
+            deleted_ids = list(Comment.objects.filter(Exists(descendants)).values_list('pk', flat=True))
+            Comment.objects.filter(tree_id__in=tree_ids).exclude(pk__in=deleted_ids) \
+                .update(lft=F('lft') - gap('lft'), rght=F('rght') - gap('rght'))
+            _, deleted = Comment.objects.filter(pk__in=deleted_ids).delete()
+        self.message_user(request, f'Удалено комментариев: {deleted.get(Comment._meta.label, 0)}')
 
 
 @admin.register(Rating)
-class RatingAdminPage(admin.ModelAdmin):
+class RatingAdminPage(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('article', 'user', 'value', 'time_create')
+    list_select_related = ('article', 'user')
+    raw_id_fields = ('article', 'user')
+    date_hierarchy = 'time_create'
 
 
 @admin.register(ViewCount)
-class ViewCountAdmin(admin.ModelAdmin):
-    pass
-
+class ViewCountAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('article', 'ip_address', 'viewed_on')
+    list_select_related = ('article',)
+    raw_id_fields = ('article',)
+    date_hierarchy = 'viewed_on'
+
+
+@admin.register(ArticleViewRollup)
+class ArticleViewRollupAdmin(admin.ModelAdmin):
+    list_display = ('article', 'month', 'views')
+    list_select_related = ('article',)
+    raw_id_fields = ('article',)
+    date_hierarchy = 'month'
@@ -1,6 +1,7 @@
 from django.contrib.syndication.views import Feed
 from django.urls import reverse
 from .models import Article
+from ..services.routers import get_read_database
 
 
 class LatestArticlesFeed(Feed):
@@ -9,7 +10,8 @@ class LatestArticlesFeed(Feed):
     description = 'Новые статьи на моем сайте'
 
     def items(self):
-        return Article.objects.order_by('-time_update')[:5]
+        return (Article.objects.using(get_read_database()).only('title', 'slug', 'short_description')
+                .order_by('-time_update')[:5])
 
     def item_title(self, item):
         return item.title
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-19 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_article_thumbnail_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False, verbose_name='Выдержка'),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='full_description_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='Обработанное полное описание'),
+        ),
+    ]
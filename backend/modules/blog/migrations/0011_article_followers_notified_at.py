@@ -0,0 +1,28 @@
+# Generated by Django 5.0.3 on 2026-10-19 01:03
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_published_articles_notified(apps, schema_editor):
+    """
+    Уже опубликованные статьи не должны попасть в первый дайджест
+    """
+    Article = apps.get_model('blog', 'Article')
+    Article.objects.filter(status='published').update(followers_notified_at=F('time_update'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_article_full_description_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='followers_notified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Подписчики уведомлены'),
+        ),
+        migrations.RunPython(mark_published_articles_notified, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,134 @@
+# Generated by Django 5.0.3 on 2026-10-19 01:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import migrations, models
+
+from modules.services.partitions import create_partition, get_month_start, is_partitioned
+
+
+def partition_viewcount(apps, schema_editor):
+    """
+    PostgreSQL: таблица просмотров пересоздается секционированной по месяцам viewed_on.
+    Первичный ключ секционированной таблицы включает ключ секционирования (id, viewed_on), id берется из
+    последовательности, строки вне созданных секций попадают в секцию по умолчанию
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    ViewCount = apps.get_model('blog', 'ViewCount')
+    table = ViewCount._meta.db_table
+    old_table = f'{table}_old'
+    quote = schema_editor.quote_name
+    columns = ', '.join(quote(field.column) for field in ViewCount._meta.concrete_fields)
+    definitions = ', '.join(f'{quote(field.column)} {field.db_type(connection)} NOT NULL'
+                            for field in ViewCount._meta.concrete_fields)
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+        foreign_key = next(name for name, constraint in constraints.items() if constraint['foreign_key'])
+        cursor.execute(f'SELECT min(viewed_on) FROM {quote(table)}')
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old_table)}')
+        cursor.execute(f'CREATE TABLE {quote(table)} ({definitions}) PARTITION BY RANGE (viewed_on)')
+        cursor.execute(f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT')
+        month, last = get_month_start(oldest), get_month_start(months=settings.VIEWCOUNT_PARTITIONS_AHEAD)
+        while month <= last:
+            create_partition(table, 'viewed_on', month, connection)
+            month = get_month_start(month, 1)
+
+        cursor.execute(f'INSERT INTO {quote(table)} ({columns}) SELECT {columns} FROM {quote(old_table)}')
+        # Вместе со старой таблицей удаляются ее индексы и identity последовательность, имена освобождаются
+        cursor.execute(f'DROP TABLE {quote(old_table)}')
+        cursor.execute(f'ALTER TABLE {quote(table)} ADD PRIMARY KEY (id, viewed_on)')
+        article = ViewCount._meta.get_field('article')
+        cursor.execute(
+            f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(foreign_key)} FOREIGN KEY ({quote(article.column)}) '
+            f'REFERENCES {quote(article.related_model._meta.db_table)} (id) DEFERRABLE INITIALLY DEFERRED')
+        sequence = f'{table}_id_seq'
+        cursor.execute(f'CREATE SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.id')
+        cursor.execute(f'SELECT setval(%s, COALESCE(max(id), 0) + 1, false) FROM {quote(table)}', [sequence])
+        cursor.execute(f"ALTER TABLE {quote(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+    for index in ViewCount._meta.indexes:
+        schema_editor.add_index(ViewCount, index)
+
+
+def unpartition_viewcount(apps, schema_editor):
+    """
+    Обратная операция: обычная таблица просмотров с первичным ключом id, строки всех секций переносятся в нее.
+    Имена индексов, первичного ключа и последовательности освобождаются до создания таблицы
+    """
+    connection = schema_editor.connection
+    ViewCount = apps.get_model('blog', 'ViewCount')
+    table = ViewCount._meta.db_table
+    if not is_partitioned(table, connection):
+        return
+    old_table = f'{table}_old'
+    quote = schema_editor.quote_name
+    columns = ', '.join(quote(field.column) for field in ViewCount._meta.concrete_fields)
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old_table)}')
+        cursor.execute(f'ALTER TABLE {quote(old_table)} ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'DROP SEQUENCE IF EXISTS {quote(table + "_id_seq")}')
+        for index in ViewCount._meta.indexes:
+            cursor.execute(f'DROP INDEX IF EXISTS {quote(index.name)}')
+        constraints = connection.introspection.get_constraints(cursor, old_table)
+        primary_key = next(name for name, constraint in constraints.items() if constraint['primary_key'])
+        cursor.execute(f'ALTER TABLE {quote(old_table)} RENAME CONSTRAINT {quote(primary_key)} '
+                       f'TO {quote(old_table + "_pkey")}')
+    # Индексы и внешний ключ создаются сразу, а не в конце миграции: обратные операции AddIndex и AlterField
+    # выполняются следующими и рассчитывают на уже созданную таблицу
+    deferred = len(schema_editor.deferred_sql)
+    schema_editor.create_model(ViewCount)
+    for statement in schema_editor.deferred_sql[deferred:]:
+        schema_editor.execute(statement)
+    del schema_editor.deferred_sql[deferred:]
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {quote(table)} ({columns}) SELECT {columns} FROM {quote(old_table)}')
+        # Вместе с секционированной таблицей удаляются все ее секции
+        cursor.execute(f'DROP TABLE {quote(old_table)}')
+        for sql in connection.ops.sequence_reset_sql(no_style(), [ViewCount]):
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_article_followers_notified_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleViewRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотры')),
+            ],
+            options={
+                'verbose_name': 'Итог просмотров',
+                'verbose_name_plural': 'Итоги просмотров',
+                'ordering': ('-month',),
+            },
+        ),
+        migrations.AlterField(
+            model_name='viewcount',
+            name='article',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='views', to='blog.article'),
+        ),
+        migrations.AddIndex(
+            model_name='viewcount',
+            index=models.Index(fields=['article', 'viewed_on'], name='blog_viewcount_article_viewed'),
+        ),
+        migrations.AddField(
+            model_name='articleviewrollup',
+            name='article',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_rollups', to='blog.article'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='articleviewrollup',
+            unique_together={('article', 'month')},
+        ),
+        migrations.RunPython(partition_viewcount, unpartition_viewcount),
+    ]
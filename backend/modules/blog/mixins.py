@@ -1,6 +1,21 @@
 from .models import ViewCount
+from modules.services.bots import is_bot
 from modules.services.utils import get_client_ip
 
+
+def record_article_view(request, article_id):
+    """
+    Запись просмотра статьи (один просмотр на IP адрес); роботы и предварительная отрисовка не учитываются
+    """
+    # роботы (поисковые и прочие) не учитываются: обход сайта не создает записей в базе
+    if getattr(request, 'prerender', False) or is_bot(request):
+        return
+    # получаем IP-адрес пользователя
+    ip_address = get_client_ip(request)
+    # получаем или создаем запись о просмотре статьи для данного пользователя
+    ViewCount.objects.get_or_create(article_id=article_id, ip_address=ip_address)
+
+
 class ViewCountMixin:
     """
     Миксин для увеличения счетчика просмотров статьи
@@ -8,8 +23,5 @@ class ViewCountMixin:
     def get_object(self):
         # получаем статью из метода родительского класса
         obj = super().get_object()
-        # получаем IP-адрес пользователя
-        ip_address = get_client_ip(self.request)
-        # получаем или создаем запись о просмотре статьи для данного пользователя
-        ViewCount.objects.get_or_create(article=obj, ip_address=ip_address)
-        return obj
\ No newline at end of file
+        record_article_view(self.request, obj.pk)
+        return obj
@@ -1,17 +1,24 @@
-from datetime import date
-
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.core.validators import FileExtensionValidator
 from django.contrib.auth import get_user_model
 from django.db.models import ForeignKey
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
 from mptt.fields import TreeManyToManyField
 from django_ckeditor_5.fields import CKEditor5Field
 
 from mptt.models import MPTTModel, TreeForeignKey
 from taggit.managers import TaggableManager
 
-from modules.services.utils import unique_slugify, image_compress
+from modules.services.utils import unique_slugify
+from modules.services.images import delete_image_variants
+from modules.services.tasks import generate_image_variants_task, render_article_body_task, notify_followers_task, \
+    render_static_pages_task, schedule_static_pages_render
+from modules.services.static_pages import get_list_pages, get_page_file, remove_page
 
 # Create your models here.
 
@@ -28,12 +35,29 @@ class Article(models.Model):
         Кастомный менеджер для модели статей
         """
 
+        # Поля карточки статьи в списках: полный текст не загружается, объем строки не зависит от размера статьи
+        LIST_FIELDS = ('title', 'slug', 'short_description', 'thumbnail', 'thumbnail_variants', 'fixed', 'time_create',
+                       'time_update', 'author__username', 'category__title', 'category__slug')
+
+        def cards(self):
+            """
+            Статьи с полями карточки списка, авторами, категориями, оценками и количеством просмотров (без фильтрации)
+            """
+            ratings = models.Prefetch('ratings', queryset=Rating.objects.only('article', 'value'))
+            return self.get_queryset().select_related('author', 'category').only(*self.LIST_FIELDS).prefetch_related(
+                ratings).annotate(view_count=get_view_count_expression())
+
         def all(self):
             """
             Список статей (SQL запрос с фильтрацией для страницы списка статей)
             """
-            return self.get_queryset().select_related('author', 'category').prefetch_related('ratings', 'views').filter(
-                status='published')
+            return self.cards().filter(status='published')
+
+        def links(self):
+            """
+            Ссылки на опубликованные статьи (карта сайта)
+            """
+            return self.get_queryset().only('slug', 'time_update').filter(status='published')
 
         def detail(self):
             """
@@ -55,12 +79,15 @@ class Article(models.Model):
     slug = models.SlugField(verbose_name='URL', max_length=255, unique=True, blank=True)
     short_description = CKEditor5Field(verbose_name='Краткое описание', max_length=500, config_name='extends')
     full_description = CKEditor5Field(verbose_name='Полное описание', config_name='extends')
+    full_description_html = models.TextField(verbose_name='Обработанное полное описание', blank=True, editable=False)
+    excerpt = models.TextField(verbose_name='Выдержка', blank=True, editable=False)
     thumbnail = models.ImageField(
         verbose_name='Превью поста',
         blank=True,
         upload_to='images/thumbnails/%Y/%m/%d/',
         validators=[FileExtensionValidator(allowed_extensions=['png', 'jpg', 'webp', 'jpeg', 'gif'])],
     )
+    thumbnail_variants = models.JSONField(verbose_name='Варианты превью', default=dict, blank=True, editable=False)
     status = models.CharField(choices=STATUS_OPTIONS, default='published', max_length=10, verbose_name='Статус поста')
     time_create = models.DateTimeField(auto_now_add=True, verbose_name='Время добавления')
     time_update = models.DateTimeField(auto_now=True, verbose_name='Время обновления')
@@ -70,6 +97,8 @@ class Article(models.Model):
                                 related_name='updater_posts', blank=True)
     fixed = models.BooleanField(default=False, verbose_name='Зафиксировано')
     category = TreeForeignKey('Category', verbose_name='Категория', on_delete=models.PROTECT, related_name='articles')
+    followers_notified_at = models.DateTimeField(verbose_name='Подписчики уведомлены', null=True, blank=True,
+                                                 editable=False)
 
     tags = TaggableManager()
     objects = ArticleManager()
@@ -89,7 +118,10 @@ class Article(models.Model):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.__thumbnail = self.thumbnail if self.pk else None
+        deferred_fields = self.get_deferred_fields()
+        self.__thumbnail = self.thumbnail.name if self.pk and 'thumbnail' not in deferred_fields else None
+        self.__full_description = self.full_description if self.pk and 'full_description' not in deferred_fields else None
+        self.__status = self.status if self.pk and 'status' not in deferred_fields else None
 
     def save(self, *args, **kwargs):
         """
@@ -97,26 +129,55 @@ class Article(models.Model):
         """
         if not self.slug:
             self.slug = unique_slugify(self, self.title)
+
+        deferred_fields = self.get_deferred_fields()
+        thumbnail_changed = 'thumbnail' not in deferred_fields and self.__thumbnail != self.thumbnail.name
+        description_changed = ('full_description' not in deferred_fields
+                               and self.__full_description != self.full_description)
+        published = ('status' not in deferred_fields and self.status == 'published'
+                     and self.__status != 'published' and self.followers_notified_at is None)
+        if thumbnail_changed and self.thumbnail_variants:
+            # Старые варианты удаляем после фиксации транзакции, до готовности новых выводится оригинал
+            old_variants, storage = self.thumbnail_variants, self.thumbnail.storage
+            transaction.on_commit(lambda: delete_image_variants(storage, old_variants))
+            self.thumbnail_variants = {}
+        if description_changed:
+            # До завершения пре-рендера выводится исходный текст
+            self.full_description_html = ''
         super().save(*args, **kwargs)
 
-        if self.__thumbnail != self.thumbnail and self.thumbnail:
-            image_compress(self.thumbnail.path, width=500, height=500)
+        if thumbnail_changed and self.thumbnail:
+            transaction.on_commit(lambda: generate_image_variants_task.delay(
+                'blog.Article', self.pk, 'thumbnail', settings.THUMBNAIL_VARIANT_WIDTHS))
+        if thumbnail_changed:
+            self.__thumbnail = self.thumbnail.name
+        if description_changed:
+            transaction.on_commit(lambda: render_article_body_task.delay(self.pk))
+            self.__full_description = self.full_description
+        if published:
+            # Рассылка подписчикам выполняется воркером и не задерживает ответ на запрос публикации
+            transaction.on_commit(lambda: notify_followers_task.delay(self.pk))
+        if 'status' not in deferred_fields:
+            self.__status = self.status
 
     def get_sum_rating(self):
         return sum([rating.value for rating in self.ratings.all()])
 
     def get_view_count(self):
         """
-        Возращает количество просмотров для данной статьи
+        Возращает количество просмотров для данной статьи (включая итоги удаленных месяцев)
         """
-        return self.views.count()
+        if hasattr(self, 'view_count'):
+            return self.view_count
+        return self.views.count() + sum(self.view_rollups.values_list('views', flat=True))
 
     def get_today_view_count(self):
         """
         Возвращает количество просмотров для данной статьи за сегодняшний день
         """
-        today = date.today()
-        return self.views.filter(viewed_on__date=today).count()
+        # Диапазон, а не viewed_on__date: условие использует индекс и читает только секцию текущего месяца
+        today_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        return self.views.filter(viewed_on__gte=today_start).count()
 
 
 class Category(MPTTModel):
@@ -219,17 +280,86 @@ class Rating(models.Model):
 
 class ViewCount(models.Model):
     """
-    Модель просмотров для статей
+    Модель просмотров для статей.
+    В PostgreSQL таблица разбита на месячные секции по viewed_on (первичный ключ - id и viewed_on),
+    просмотры старше VIEWCOUNT_RETENTION_MONTHS переносятся в ArticleViewRollup
     """
-    article = models.ForeignKey('Article', on_delete=models.CASCADE, related_name='views')
+    article = models.ForeignKey('Article', on_delete=models.CASCADE, related_name='views', db_index=False)
     ip_address = models.GenericIPAddressField(verbose_name='IP адрес')
     viewed_on = models.DateTimeField(auto_now_add=True, verbose_name='Дата просмотра')
 
     class Meta:
         ordering = ('-viewed_on',)
-        indexes = [models.Index(fields=['-viewed_on'])]
+        indexes = [
+            models.Index(fields=['-viewed_on']),
+            models.Index(fields=['article', 'viewed_on'], name='blog_viewcount_article_viewed'),
+        ]
         verbose_name = 'Просмотр'
         verbose_name_plural = 'Просмотры'
 
     def __str__(self):
         return self.article.title
+
+
+class ArticleViewRollup(models.Model):
+    """
+    Итоги просмотров статьи за месяц, просмотры которого удалены по сроку хранения
+    """
+    article = models.ForeignKey('Article', on_delete=models.CASCADE, related_name='view_rollups')
+    month = models.DateField(verbose_name='Месяц')
+    views = models.PositiveIntegerField(verbose_name='Просмотры', default=0)
+
+    class Meta:
+        unique_together = ('article', 'month')
+        ordering = ('-month',)
+        verbose_name = 'Итог просмотров'
+        verbose_name_plural = 'Итоги просмотров'
+
+    def __str__(self):
+        return f'{self.article_id}: {self.month:%Y-%m}'
+
+
+def get_view_count_expression(**filters):
+    """
+    Количество просмотров статьи подзапросом (для annotate): без фильтров - за все время вместе с итогами
+    удаленных месяцев. Подзапрос вычисляется только для выбранных строк, в отличие от JOIN с группировкой
+    """
+    views = models.Subquery(ViewCount.objects.filter(article=models.OuterRef('pk'), **filters).order_by()
+                            .values('article').annotate(count=models.Count('id')).values('count'))
+    if filters:
+        return Coalesce(views, 0)
+    rollups = models.Subquery(ArticleViewRollup.objects.filter(article=models.OuterRef('pk')).order_by()
+                              .values('article').annotate(views=models.Sum('views')).values('views'))
+    return Coalesce(views, 0) + Coalesce(rollups, 0)
+
+
+@receiver(post_delete, sender=Article)
+def delete_article_thumbnail_variants(sender, instance, **kwargs):
+    if instance.thumbnail_variants:
+        transaction.on_commit(lambda: delete_image_variants(instance.thumbnail.storage, instance.thumbnail_variants))
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def render_article_static_pages(sender, instance, **kwargs):
+    """
+    Перерисовка предварительно отрисованных страниц статьи после изменения статьи, комментария или оценки
+    """
+    if settings.STATIC_PAGES_ENABLED:
+        article_id = instance.pk if sender is Article else instance.article_id
+        transaction.on_commit(lambda: schedule_static_pages_render([article_id]))
+
+
+@receiver(post_delete, sender=Article)
+def remove_article_static_pages(sender, instance, **kwargs):
+    """
+    Страница удаленной статьи удаляется сразу, списки главной и категории перерисовываются задачей
+    """
+    if settings.STATIC_PAGES_ENABLED:
+        page_file = get_page_file(instance.get_absolute_url())
+        pages = get_list_pages(reverse('home')) + get_list_pages(instance.category.get_absolute_url())
+        transaction.on_commit(lambda: remove_page(page_file))
+        transaction.on_commit(lambda: render_static_pages_task.delay(pages=pages))
@@ -2,6 +2,7 @@ from django.contrib.sitemaps import Sitemap
 from django.urls import reverse
 
 from .models import Article
+from ..services.routers import get_read_database
 
 
 class ArticleSitemap(Sitemap):
@@ -14,7 +15,7 @@ class ArticleSitemap(Sitemap):
     protocol = 'https'
 
     def items(self):
-        return Article.objects.all()
+        return Article.objects.links().using(get_read_database())
 
     def lastmod(self, obj):
         return obj.time_update
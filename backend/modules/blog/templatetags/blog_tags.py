@@ -1,23 +1,33 @@
 from django import template
-from django.db.models import Count, Q
+from django.db.models import Count, FilteredRelation, Q
 from taggit.models import Tag
 from datetime import datetime, date, time, timedelta
 from django.utils import timezone
 
-from ..models import Comment, Article
+from ..models import Comment, Article, Category, get_view_count_expression
+from ...services.routers import get_read_database
 
 register = template.Library()
 
 @register.simple_tag
 def popular_tags():
-    tags = Tag.objects.annotate(num_times=Count('article')).order_by('-num_times')
+    tags = Tag.objects.using(get_read_database()).annotate(num_times=Count('article')).order_by('-num_times')
     tag_list = list(tags.values('name', 'num_times', 'slug'))
     return tag_list
 
 
+@register.simple_tag
+def category_tree():
+    """
+    Дерево категорий для боковой панели (аналог full_tree_for_model с чтением из реплики)
+    """
+    return Category.objects.using(get_read_database()).order_by('tree_id', 'lft')
+
+
 @register.inclusion_tag('includes/latest_comments.html')
 def show_latest_comments(count=5):
-    comments = Comment.objects.select_related('author').filter(status='published').order_by('-time_create')[:count]
+    comments = Comment.objects.using(get_read_database()).select_related('author').filter(
+        status='published').order_by('-time_create')[:count]
     return {'comments': comments}
 
 
@@ -29,12 +39,20 @@ def popular_articles():
     start_date = now - timedelta(days=7)
     # вычисляем дату начала текущего дня (00:00)
     today_start = timezone.make_aware(datetime.combine(date.today(), time.min))
-    # получаем все статьи и количество их просмотров за последние 7 дней
-    articles = Article.objects.annotate(
-        total_view_count=Count('views', filter=Q(views__viewed_on__gte=start_date)),
-        today_view_count=Count('views', filter=Q(views__viewed_on__gte=today_start))
-    ).prefetch_related('views')
-    # сортируем статьи по количеству просмотров в порядке убыавания, сначала статьи за сегодня, затем за все время
-    popular_articles = articles.order_by('-total_view_count', '-today_view_count')[:10]
+    database = get_read_database()
+    # десятка статей по просмотрам за 7 дней: просмотры присоединяются с условием по дате,
+    # поэтому читаются только последние секции таблицы просмотров
+    top_articles = Article.objects.using(database).values('pk').annotate(
+        recent_views=FilteredRelation('views', condition=Q(views__viewed_on__gte=start_date)),
+        recent_view_count=Count('recent_views'),
+        recent_today_view_count=Count('recent_views', filter=Q(recent_views__viewed_on__gte=today_start)),
+    ).order_by('-recent_view_count', '-recent_today_view_count').values('pk')[:10]
+
+    # количество просмотров (за 7 дней, за сегодня и за все время вместе с итогами удаленных месяцев)
+    # считается подзапросами только для отобранных статей, в том же SQL запросе
+    popular_articles = Article.objects.using(database).filter(pk__in=top_articles).only('title', 'slug').annotate(
+        total_view_count=get_view_count_expression(viewed_on__gte=start_date),
+        today_view_count=get_view_count_expression(viewed_on__gte=today_start),
+        view_count=get_view_count_expression(),
+    ).order_by('-total_view_count', '-today_view_count')
     return popular_articles
-
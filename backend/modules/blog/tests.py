@@ -1,3 +1,461 @@
-from django.test import TestCase
+import tempfile
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from modules.services.static_pages import build_page_request, get_all_pages, get_article_pages, get_list_pages, \
+    get_page_file, publish_pages
+from modules.services.richtext import render_article_body
+from modules.services.tasks import STATIC_PAGES_PENDING_MARGIN, get_static_pages_pending_key, \
+    render_article_body_task, render_static_pages_task, schedule_static_pages_render
+from modules.services.testing import QueryBudgetTestCase, eager_celery
+from .models import Article, Category, Comment, Rating, ViewCount
+from .urls import urlpatterns
 
 # Create your tests here.
+
+# Максимальное количество SQL запросов для каждого адреса blog/urls.py
+QUERY_BUDGETS = {
+    'home': 7,
+    'articles_create': 9,
+    'articles_by_signed_user': 11,
+    'articles_update': 12,
+    'articles_delete': 10,
+    'articles_detail': 15,
+    'comment_create_view': 6,
+    'articles_by_tags': 8,
+    'articles_by_category': 8,
+    'search': 7,
+    'rating': 6,
+    'page_view_beacon': 5,
+}
+
+# Максимальное количество SQL запросов для списков больших таблиц в админ-панели
+ADMIN_QUERY_BUDGETS = {
+    'admin:blog_viewcount_changelist': 8,
+    'admin:blog_rating_changelist': 8,
+    'admin:blog_comment_changelist': 8,
+}
+
+BROWSER_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0'
+CRAWLER_USER_AGENT = 'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)'
+
+
+class BlogQueryBudgetTest(QueryBudgetTestCase):
+    """
+    Бюджет SQL запросов для представлений блога
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.article = (Article.objects.filter(status='published').annotate(comment_count=Count('comments'))
+                       .order_by('-comment_count', 'pk').first())
+        cls.author = cls.article.author
+        cls.reader = cls.article.author.profile.followers.select_related('user').first().user
+
+    def test_every_url_has_budget(self):
+        self.assertEqual({pattern.name for pattern in urlpatterns}, set(QUERY_BUDGETS))
+
+    def test_home(self):
+        self.assertQueryBudget(reverse('home'), QUERY_BUDGETS['home'])
+
+    def test_list_projection(self):
+        # Списки и лента не выбирают полный текст статьи
+        for url in (reverse('home'), self.article.category.get_absolute_url(), reverse('latest_articles_feed'),
+                    reverse('django.contrib.sitemaps.views.sitemap')):
+            with self.subTest(url), CaptureQueriesContext(connection) as context:
+                self.client.get(url)
+            self.assertFalse([query['sql'] for query in context.captured_queries if 'full_description' in query['sql']])
+
+    def test_articles_detail(self):
+        self.assertQueryBudget(self.article.get_absolute_url(), QUERY_BUDGETS['articles_detail'],
+                               HTTP_USER_AGENT=BROWSER_USER_AGENT)
+
+    def test_articles_detail_by_crawler(self):
+        views = ViewCount.objects.count()
+        self.assertQueryBudget(self.article.get_absolute_url(), QUERY_BUDGETS['articles_detail'],
+                               HTTP_USER_AGENT=CRAWLER_USER_AGENT)
+        self.assertEqual(ViewCount.objects.count(), views)
+
+    def test_articles_by_tags(self):
+        tag = self.article.tags.first()
+        self.assertQueryBudget(reverse('articles_by_tags', args=[tag.slug]), QUERY_BUDGETS['articles_by_tags'])
+
+    def test_articles_by_category(self):
+        self.assertQueryBudget(self.article.category.get_absolute_url(), QUERY_BUDGETS['articles_by_category'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Полнотекстовый поиск работает только в PostgreSQL')
+    def test_search(self):
+        self.assertQueryBudget(reverse('search') + '?do=django', QUERY_BUDGETS['search'])
+
+    def test_articles_by_signed_user(self):
+        self.client.force_login(self.reader)
+        self.assertQueryBudget(reverse('articles_by_signed_user'), QUERY_BUDGETS['articles_by_signed_user'])
+
+    def test_articles_create(self):
+        self.client.force_login(self.author)
+        self.assertQueryBudget(reverse('articles_create'), QUERY_BUDGETS['articles_create'])
+
+    def test_articles_update(self):
+        self.client.force_login(self.author)
+        self.assertQueryBudget(reverse('articles_update', args=[self.article.slug]), QUERY_BUDGETS['articles_update'])
+
+    def test_articles_delete(self):
+        self.client.force_login(self.author)
+        self.assertQueryBudget(reverse('articles_delete', args=[self.article.slug]), QUERY_BUDGETS['articles_delete'])
+
+    def test_comment_create_view(self):
+        self.client.force_login(self.reader)
+        self.assertQueryBudget(reverse('comment_create_view', args=[self.article.pk]),
+                               QUERY_BUDGETS['comment_create_view'], method='post',
+                               data={'content': 'Комментарий'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_rating(self):
+        self.assertQueryBudget(reverse('rating'), QUERY_BUDGETS['rating'], method='post',
+                               data={'article_id': self.article.pk, 'value': 1}, REMOTE_ADDR='192.168.0.1')
+
+    def test_page_view_beacon(self):
+        views = ViewCount.objects.filter(article=self.article).count()
+        response = self.assertQueryBudget(reverse('page_view_beacon'), QUERY_BUDGETS['page_view_beacon'],
+                                          method='post', data={'article_id': self.article.pk}, status_code=204,
+                                          REMOTE_ADDR='192.168.0.2', HTTP_USER_AGENT=BROWSER_USER_AGENT,
+                                          HTTP_ORIGIN='http://testserver',
+                                          HTTP_REFERER=f'http://testserver{self.article.get_absolute_url()}')
+        self.assertIn('csrftoken', response.cookies)
+        self.assertEqual(ViewCount.objects.filter(article=self.article).count(), views + 1)
+
+    def test_static_pages(self):
+        views = ViewCount.objects.count()
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_PAGES_ROOT=Path(root)):
+            pages = get_article_pages(self.article)
+            # Страницы списков вне диапазона не отрисовываются
+            self.assertTrue(0 < publish_pages(pages) <= len(set(pages)))
+            content = get_page_file(self.article.get_absolute_url()).read_text(encoding='utf-8')
+            self.assertIn(self.article.title, content)
+            self.assertIn(reverse('page_view_beacon'), content)
+            self.assertTrue(get_page_file(reverse('home'), 2).with_suffix('.html.gz').exists())
+        # Отрисовка не является просмотром
+        self.assertEqual(ViewCount.objects.count(), views)
+
+
+class BlogAdminQueryBudgetTest(QueryBudgetTestCase):
+    """
+    Бюджет SQL запросов для списков больших таблиц в админ-панели
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def test_changelists(self):
+        self.client.force_login(self.admin)
+        for name, budget in ADMIN_QUERY_BUDGETS.items():
+            with self.subTest(name):
+                self.assertQueryBudget(reverse(name), budget)
+
+
+class ArticleBodyRenderTest(TestCase):
+    """
+    Пре-рендер полного описания статьи в задаче после сохранения
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = get_user_model().objects.create_user('writer', 'writer@example.com', 'password')
+        cls.category = Category.objects.create(title='Разработка', slug='development', description='Статьи')
+
+    def setUp(self):
+        self.enterContext(eager_celery())
+
+    def create_article(self, full_description):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Article.objects.create(title='Пре-рендер', author=self.author, category=self.category,
+                                          status='draft', short_description='Кратко',
+                                          full_description=full_description)
+
+    def test_render_after_save(self):
+        article = self.create_article('<p>Первый абзац</p><p>Второй абзац</p>')
+        article.refresh_from_db()
+        self.assertEqual(article.full_description_html, '<p>Первый абзац</p><p>Второй абзац</p>')
+        self.assertEqual(article.excerpt, 'Первый абзац Второй абзац')
+
+        # Изменение текста сбрасывает результат до завершения нового пре-рендера
+        article.full_description = '<p>Новый текст</p>'
+        with self.captureOnCommitCallbacks() as callbacks:
+            article.save()
+        self.assertEqual(Article.objects.get(pk=article.pk).full_description_html, '')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Article.objects.get(pk=article.pk).excerpt, 'Новый текст')
+
+    def test_stale_result_is_discarded(self):
+        article = self.create_article('<p>Исходный текст</p>')
+
+        def render_and_edit(source):
+            # Текст статьи изменен, пока задача обрабатывала предыдущую версию
+            Article.objects.filter(pk=article.pk).update(full_description='<p>Отредактировано</p>',
+                                                          full_description_html='', excerpt='')
+            return render_article_body(source)
+
+        with mock.patch('modules.services.tasks.render_article_body', side_effect=render_and_edit):
+            render_article_body_task(article.pk)
+        article.refresh_from_db()
+        self.assertEqual((article.full_description_html, article.excerpt), ('', ''))
+
+    def test_missing_article(self):
+        self.assertIsNone(render_article_body_task(0))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class CommentAdminActionsTest(TestCase):
+    """
+    Модерация комментариев действиями админ-панели: статус одним UPDATE, удаление поддеревьев одним DELETE
+    с перестроением оставшихся деревьев
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        users = get_user_model().objects
+        cls.admin = users.create_superuser('moderator', 'moderator@example.com', 'password')
+        category = Category.objects.create(title='Обсуждения', slug='discussions', description='Обсуждения')
+        cls.article, cls.other_article = (
+            Article.objects.create(title=title, slug=slug, author=cls.admin, category=category, status='published',
+                                   short_description='Кратко', full_description='Текст')
+            for title, slug in (('Обсуждаемая', 'discussed'), ('Другая', 'other'))
+        )
+        # Дерево: root -> (middle -> (leaf, second_leaf), sibling); второй корень со своим ответом
+        cls.root = cls.comment('root')
+        cls.middle = cls.comment('middle', cls.root)
+        cls.leaf = cls.comment('leaf', cls.middle)
+        cls.second_leaf = cls.comment('second_leaf', cls.middle)
+        cls.sibling = cls.comment('sibling', cls.root)
+        cls.other_root = cls.comment('other_root', article=cls.other_article)
+        cls.other_reply = cls.comment('other_reply', cls.other_root, article=cls.other_article)
+
+    @classmethod
+    def comment(cls, content, parent=None, article=None):
+        return Comment.objects.create(article=article or cls.article, author=cls.admin, content=content,
+                                      parent=parent)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.render = self.enterContext(mock.patch('modules.blog.admin.schedule_static_pages_render'))
+
+    def run_action(self, action, *comments):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:blog_comment_changelist'), {
+                'action': action, '_selected_action': [comment.pk for comment in comments],
+            })
+        self.assertEqual(response.status_code, 302)
+
+    def assertTreesConsistent(self):
+        """
+        Поля lft/rght/level совпадают с результатом перестроения каждого дерева по ссылкам parent
+        """
+        fields = ('pk', 'parent', 'tree_id', 'lft', 'rght', 'level')
+        stored = sorted(Comment.objects.values_list(*fields))
+        for tree_id in set(Comment.objects.values_list('tree_id', flat=True)):
+            Comment.objects.partial_rebuild(tree_id)
+        self.assertEqual(stored, sorted(Comment.objects.values_list(*fields)))
+
+    def test_publish_and_unpublish(self):
+        self.run_action('unpublish_comments', self.middle, self.other_reply)
+        self.assertEqual(set(Comment.objects.filter(status='draft').values_list('content', flat=True)),
+                         {'middle', 'other_reply'})
+        self.assertEqual(sorted(self.render.call_args.args[0]), sorted([self.article.pk, self.other_article.pk]))
+
+        self.run_action('publish_comments', self.middle)
+        self.assertEqual(list(Comment.objects.filter(status='draft').values_list('content', flat=True)),
+                         ['other_reply'])
+        self.assertEqual(self.render.call_args.args[0], [self.article.pk])
+
+    def run_delete(self, *comments):
+        with override_settings(STATIC_PAGES_ENABLED=1), \
+                mock.patch('modules.blog.models.schedule_static_pages_render') as render:
+            self.run_action('delete_comments', *comments)
+        # Удаление через QuerySet.delete отправляет post_delete для каждого комментария
+        return {article_id for call in render.call_args_list for article_id in call.args[0]}
+
+    def test_delete_mid_level_node(self):
+        self.assertEqual(self.run_delete(self.middle), {self.article.pk})
+
+        self.assertEqual(set(Comment.objects.values_list('content', flat=True)),
+                         {'root', 'sibling', 'other_root', 'other_reply'})
+        root = Comment.objects.get(pk=self.root.pk)
+        self.assertEqual((root.lft, root.rght), (1, 4))
+        self.assertEqual([child.content for child in root.get_children()], ['sibling'])
+        self.assertTreesConsistent()
+
+    def test_delete_nested_selection(self):
+        # Выбраны и комментарий, и его ответ: ширина поддерева учитывается один раз
+        self.run_delete(self.leaf, self.middle, self.other_reply)
+        self.assertEqual(set(Comment.objects.values_list('content', flat=True)), {'root', 'sibling', 'other_root'})
+        self.assertEqual(Comment.objects.get(pk=self.root.pk).get_descendant_count(), 1)
+        self.assertTrue(Comment.objects.get(pk=self.other_root.pk).is_leaf_node())
+        self.assertTreesConsistent()
+
+    def test_delete_root_and_reply_in_other_tree(self):
+        articles = self.run_delete(self.other_root, self.leaf)
+
+        self.assertEqual(set(Comment.objects.values_list('content', flat=True)),
+                         {'root', 'middle', 'second_leaf', 'sibling'})
+        self.assertEqual(Comment.objects.get(pk=self.root.pk).get_descendant_count(), 3)
+        self.assertTreesConsistent()
+        self.assertEqual(articles, {self.article.pk, self.other_article.pk})
+
+
+@override_settings(ALLOWED_HOSTS=['blog.example'],
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class PageViewBeaconTest(TestCase):
+    """
+    Просмотр статьи с заранее отрисованной страницы: учитывается только запрос со страницы этой статьи
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user('beacon-author')
+        category = Category.objects.create(title='Маяки', slug='beacons', description='Маяки')
+        cls.article, cls.other = (
+            Article.objects.create(title=title, slug=slug, author=author, category=category, status='published',
+                                   short_description='Кратко', full_description='Текст')
+            for title, slug in (('Страница', 'beacon-page'), ('Другая страница', 'other-page'))
+        )
+
+    def send(self, referer, origin='', article=None, address='198.51.100.20'):
+        headers = {'HTTP_REFERER': referer} if referer else {}
+        if origin:
+            headers['HTTP_ORIGIN'] = origin
+        response = self.client.post(reverse('page_view_beacon'), {'article_id': (article or self.article).pk},
+                                    SERVER_NAME='blog.example', REMOTE_ADDR=address,
+                                    HTTP_USER_AGENT=BROWSER_USER_AGENT, **headers)
+        self.assertEqual(response.status_code, 204)
+        self.assertIn('csrftoken', response.cookies)
+        return ViewCount.objects.filter(article=article or self.article).count()
+
+    def test_view_from_article_page(self):
+        page = f'https://blog.example{self.article.get_absolute_url()}'
+        self.assertEqual(self.send(page, origin='https://blog.example'), 1)
+        # Origin не обязателен: Referer проверяется в любом случае
+        self.assertEqual(self.send(page, address='198.51.100.21'), 2)
+
+    def test_rejected_requests(self):
+        path = self.article.get_absolute_url()
+        rejected = (
+            ('', ''),
+            (f'https://evil.example{path}', 'https://evil.example'),
+            (f'https://blog.example{path}', 'https://evil.example'),
+            (f'https://blog.example{self.other.get_absolute_url()}', 'https://blog.example'),
+            ('https://blog.example/', 'https://blog.example'),
+        )
+        for number, (referer, origin) in enumerate(rejected):
+            with self.subTest(referer=referer, origin=origin):
+                self.assertEqual(self.send(referer, origin, address=f'198.51.100.{30 + number}'), 0)
+
+
+@override_settings(STATIC_PAGES_ENABLED=1, STATIC_PAGES_DEBOUNCE=10,
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'static-pages-tests'}})
+class StaticPagesSchedulingTest(TestCase):
+    """
+    Планирование перерисовки страниц: приемники сигналов моделей, отложенная задача и список всех страниц
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = get_user_model().objects.create_user('pages-author')
+        cls.category = Category.objects.create(title='Страницы', slug='pages', description='Страницы')
+        cls.empty_category = Category.objects.create(title='Пустая', slug='empty', description='Пустая')
+        cls.article = cls.create_article('published-page', 'published', 'python')
+        cls.draft = cls.create_article('draft-page', 'draft', 'draft-only')
+
+    @classmethod
+    def create_article(cls, slug, status, tag):
+        article = Article.objects.create(title=slug, slug=slug, author=cls.author, category=cls.category,
+                                         status=status, short_description='Кратко', full_description='Текст')
+        article.tags.add(tag)
+        return article
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        self.cache = cache
+        self.addCleanup(cache.clear)
+        self.apply_async = self.enterContext(mock.patch.object(render_static_pages_task, 'apply_async'))
+
+    def scheduled(self):
+        return [call.kwargs['args'][0] for call in self.apply_async.call_args_list]
+
+    def test_debounce(self):
+        schedule_static_pages_render([self.article.pk])
+        schedule_static_pages_render([self.article.pk, self.draft.pk])
+        self.assertEqual(self.scheduled(), [[self.article.pk], [self.draft.pk]])
+        self.assertEqual(self.apply_async.call_args.kwargs['countdown'], 10)
+
+        # Ключ живет дольше задержки задачи: ожидание в очереди не приводит к повторной задаче
+        with mock.patch.object(self.cache, 'add', wraps=self.cache.add) as add:
+            schedule_static_pages_render([self.article.pk])
+        self.assertEqual(add.call_args.args[2], 10 + STATIC_PAGES_PENDING_MARGIN)
+        self.assertEqual(len(self.scheduled()), 2)
+
+        # Задача снимает ключ перед отрисовкой, следующие изменения снова планируют перерисовку
+        with mock.patch('modules.services.tasks.publish_pages', return_value=0) as publish:
+            render_static_pages_task([self.article.pk])
+        self.assertIn((self.article.get_absolute_url(), 1), publish.call_args.args[0])
+        self.assertIsNone(self.cache.get(get_static_pages_pending_key(self.article.pk)))
+        schedule_static_pages_render([self.article.pk])
+        self.assertEqual(self.scheduled()[-1], [self.article.pk])
+
+    def test_signal_receivers(self):
+        reader = get_user_model().objects.create_user('pages-reader')
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(article=self.article, author=reader, content='Комментарий')
+        self.assertEqual(self.scheduled(), [[self.article.pk]])
+
+        # Изменения до запуска задачи входят в уже запланированную перерисовку
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(article=self.article, user=reader, value=1, ip_address='198.51.100.40')
+            self.article.save()
+        self.assertEqual(len(self.scheduled()), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(article=self.draft, value=-1, ip_address='198.51.100.41').delete()
+        self.assertEqual(self.scheduled(), [[self.article.pk], [self.draft.pk]])
+
+    def test_article_delete_removes_page(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_PAGES_ROOT=Path(root)):
+            page_file = get_page_file(self.article.get_absolute_url())
+            page_file.parent.mkdir(parents=True)
+            page_file.write_text('<html></html>')
+            with mock.patch.object(render_static_pages_task, 'delay') as delay, \
+                    self.captureOnCommitCallbacks(execute=True):
+                self.article.delete()
+            self.assertFalse(page_file.exists())
+        self.assertEqual(set(delay.call_args.kwargs['pages']),
+                         set(get_list_pages(reverse('home')) + get_list_pages(self.category.get_absolute_url())))
+
+    @override_settings(STATIC_PAGES_LIST_PAGES=2)
+    def test_all_pages(self):
+        pages = get_all_pages()
+        self.assertIn((self.article.get_absolute_url(), 1), pages)
+        self.assertNotIn((self.draft.get_absolute_url(), 1), pages)
+        for path in (reverse('home'), self.category.get_absolute_url(), self.empty_category.get_absolute_url(),
+                     reverse('articles_by_tags', args=['python'])):
+            self.assertIn((path, 2), pages)
+        # Теги только черновиков не имеют страниц
+        self.assertNotIn((reverse('articles_by_tags', args=['draft-only']), 1), pages)
+
+    def test_page_request(self):
+        request = build_page_request('/articles/статья/', 2)
+        self.assertTrue(request.is_secure())
+        self.assertEqual(request.get_host(), 'example.com')
+        self.assertEqual(request.path, '/articles/статья/')
+        self.assertEqual(request.GET['page'], '2')
+        self.assertFalse(request.user.is_authenticated)
@@ -1,7 +1,8 @@
 from django.urls import path
 
 from .views import ArticleListView, ArticleDetailView, ArticleByCategoryListView, ArticleCreateView, ArticleUpdateView, \
-    ArticleDeleteView, CommentCreateView, ArticleByTagListView, ArticleSearchResultView, RatingCreateView, ArticleBySignedUser
+    ArticleDeleteView, CommentCreateView, ArticleByTagListView, ArticleSearchResultView, RatingCreateView, \
+    ArticleBySignedUser, PageViewBeaconView
 
 urlpatterns = [
     path('', ArticleListView.as_view(), name='home'),
@@ -16,4 +17,5 @@ urlpatterns = [
     path('category/<str:slug>/', ArticleByCategoryListView.as_view(), name='articles_by_category'),
     path('search/', ArticleSearchResultView.as_view(), name='search'),
     path('rating/', RatingCreateView.as_view(), name='rating'),
+    path('beacon/', PageViewBeaconView.as_view(), name='page_view_beacon'),
 ]
@@ -1,4 +1,10 @@
-from django.http import JsonResponse
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.http.request import split_domain_port, validate_host
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, View
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -14,7 +20,8 @@ from .forms import ArticleCreateForm, ArticleUpdateForm, CommentCreateForm
 from django.shortcuts import render, redirect
 from django.core.paginator import Paginator
 from ..services.utils import get_client_ip
-from .mixins import ViewCountMixin
+from ..services.routers import get_read_database
+from .mixins import ViewCountMixin, record_article_view
 
 
 # Create your views here.
@@ -24,6 +31,9 @@ class ArticleListView(ListView):
     context_object_name = 'articles'
     paginate_by = 3
 
+    def get_queryset(self):
+        return super().get_queryset().using(get_read_database())
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = 'Главная страница'
@@ -40,8 +50,7 @@ class ArticleDetailView(ViewCountMixin, DetailView):
         article_tags_ids = obj.tags.values_list('id', flat=True)
         similar_articles = Article.objects.filter(tags__in=article_tags_ids).exclude(id=obj.id)
         similar_articles = similar_articles.annotate(related_tags=Count('tags')).order_by('-related_tags')
-        similar_articles_list = list(similar_articles.all())
-        return similar_articles_list[:6]
+        return list(similar_articles.only('title', 'slug')[:6])
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -95,6 +104,8 @@ class ArticleUpdateView(AuthorRequiredMixin, SuccessMessageMixin, UpdateView):
     """
 
     model = Article
+    # Форма работает со всеми полями статьи, а не только с полями карточки списка
+    queryset = model.objects.all().defer(None)
     template_name = 'blog/articles_update.html'
     form_class = ArticleUpdateForm
     context_object_name = 'article'
@@ -117,6 +128,7 @@ class ArticleDeleteView(AuthorRequiredMixin, DeleteView):
     Представление для удаления статьи
     """
     model = Article
+    queryset = model.objects.all().defer(None)
     template_name = 'blog/articles_delete.html'
     success_url = reverse_lazy('home')
     context_object_name = 'article'
@@ -197,8 +209,8 @@ class ArticleSearchResultView(ListView):
         search_vector = SearchVector('full_description', weight='B') + SearchVector('title', weight='A')
         search_query = SearchQuery(query)
         return (
-            self.model.objects.annotate(rank=SearchRank(search_vector, search_query)).filter(rank__gte=0.3)).order_by(
-            '-rank')
+            self.model.objects.cards().using(get_read_database()).annotate(
+                rank=SearchRank(search_vector, search_query)).filter(rank__gte=0.3)).order_by('-rank')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -230,6 +242,38 @@ class RatingCreateView(View):
         return JsonResponse({'status': 'created', 'rating_sum': rating.article.get_sum_rating()})
 
 
+@method_decorator([csrf_exempt, ensure_csrf_cookie], name='dispatch')
+class PageViewBeaconView(View):
+    """
+    Запрос со страниц, отрисованных заранее (nginx отдает их без Django): учет просмотра статьи
+    и выдача CSRF cookie для оценок. У страниц нет CSRF токена, поэтому просмотр учитывается только
+    для запроса со страницы этой же статьи: Origin и Referer с адресом из ALLOWED_HOSTS и путем статьи
+    """
+
+    def post(self, request, *args, **kwargs):
+        article_id = request.POST.get('article_id', '')
+        if article_id.isdigit():
+            article = Article.objects.filter(pk=article_id, status='published').only('slug').first()
+            if article is not None and self.is_sent_from(request, article.get_absolute_url()):
+                record_article_view(request, article_id)
+        return HttpResponse(status=204)
+
+    @staticmethod
+    def is_sent_from(request, path):
+        """
+        Запрос отправлен со страницы path сайта: браузер передает Referer (политика same-origin) и Origin
+        """
+        allowed_hosts = settings.ALLOWED_HOSTS
+        if settings.DEBUG and not allowed_hosts:
+            allowed_hosts = ['.localhost', '127.0.0.1', '[::1]']
+        referer = urlsplit(request.META.get('HTTP_REFERER', ''))
+        origin = request.META.get('HTTP_ORIGIN')
+        if origin is not None and urlsplit(origin).netloc != referer.netloc:
+            return False
+        domain, _ = split_domain_port(referer.netloc)
+        return bool(domain) and validate_host(domain, allowed_hosts) and unquote(referer.path) == unquote(path)
+
+
 class ArticleBySignedUser(LoginRequiredMixin, ListView):
     """
     Представление, выводящее список статей авторов, на которые подписан текущий пользователь
@@ -241,8 +285,8 @@ class ArticleBySignedUser(LoginRequiredMixin, ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        authors = self.request.user.profile.following.values_list('id', flat=True)
-        queryset = self.model.objects.all().filter(author__id__in=authors)
+        # Подписки хранятся между профилями: фильтр по подписчикам профиля автора одним JOIN без списка IN
+        queryset = self.model.objects.all().filter(author__profile__followers=self.request.user.profile)
         return queryset
 
     def get_context_data(self, **kwargs):
@@ -0,0 +1,108 @@
+import statistics
+import time
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+# Зарегистрированные замеры: имя -> (функция подготовки, требуется PostgreSQL)
+BENCHMARKS = {}
+
+
+def benchmark(name, postgres_only=False):
+    """
+    Регистрация замера. Функция получает контекст (статья, пользователь) и возвращает вызываемый объект замера
+    """
+
+    def decorator(setup):
+        BENCHMARKS[name] = (setup, postgres_only)
+        return setup
+
+    return decorator
+
+
+def run_benchmark(function, repeat):
+    """
+    Время выполнения (в миллисекундах) и количество SQL запросов одного вызова
+    """
+    # Прогрев: кэши ContentType, шаблонов и URL не должны попадать в замер
+    function()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    with CaptureQueriesContext(connection) as queries:
+        function()
+    timings.sort()
+    return {
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'min_ms': round(timings[0], 3),
+        'p95_ms': round(timings[max(int(len(timings) * 0.95) - 1, 0)], 3),
+        'queries': len(queries),
+    }
+
+
+@benchmark('manager.all')
+def manager_all(context):
+    from modules.blog.models import Article
+    return lambda: [article.get_sum_rating() for article in Article.objects.all()[:10]]
+
+
+@benchmark('manager.detail')
+def manager_detail(context):
+    from modules.blog.models import Article
+    return lambda: Article.objects.detail().get(pk=context['article'].pk)
+
+
+@benchmark('view.get_similar_articles')
+def similar_articles(context):
+    from modules.blog.views import ArticleDetailView
+    return lambda: ArticleDetailView().get_similar_articles(context['article'])
+
+
+@benchmark('tag.popular_articles')
+def popular_articles(context):
+    from modules.blog.templatetags.blog_tags import popular_articles as tag
+    return lambda: [article.get_view_count() for article in tag()]
+
+
+@benchmark('tag.popular_tags')
+def popular_tags(context):
+    from modules.blog.templatetags.blog_tags import popular_tags as tag
+    return tag
+
+
+@benchmark('tag.show_latest_comments')
+def latest_comments(context):
+    from modules.blog.templatetags.blog_tags import show_latest_comments as tag
+    return lambda: list(tag()['comments'])
+
+
+@benchmark('tag.category_tree')
+def category_tree(context):
+    from modules.blog.templatetags.blog_tags import category_tree as tag
+    return lambda: list(tag())
+
+
+@benchmark('view.home')
+def home_view(context):
+    return lambda: Client().get(reverse('home'))
+
+
+@benchmark('view.articles_detail')
+def detail_view(context):
+    return lambda: Client().get(context['article'].get_absolute_url())
+
+
+@benchmark('view.search', postgres_only=True)
+def search_view(context):
+    return lambda: Client().get(reverse('search'), {'do': context['article'].title.split()[0]})
+
+
+@benchmark('view.articles_by_signed_user')
+def signed_view(context):
+    client = Client()
+    client.force_login(context['user'])
+    return lambda: client.get(reverse('articles_by_signed_user'))
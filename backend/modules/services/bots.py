@@ -0,0 +1,92 @@
+import ipaddress
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+from . import metrics
+from .utils import get_client_ip
+
+# Классы посетителей
+HUMAN = 'human'
+SEARCH_ENGINE = 'search_engine'
+BOT = 'bot'
+
+# Поисковые роботы (проверяются первыми) и прочие автоматические клиенты по User-Agent.
+# Только признаки роботов: полные имена, имя с версией через '/' и ссылка '+http' на описание робота.
+# Общие слова (bot без '/', preview, monitor, rss) встречаются в User-Agent браузеров и устройств (CUBOT, Smart Monitor)
+SEARCH_ENGINE_USER_AGENTS = (
+    'googlebot', 'google-inspectiontool', 'adsbot-google', 'mediapartners-google', 'bingbot', 'yandex.com/bots',
+    'duckduckbot', 'baiduspider', 'applebot', 'yahoo! slurp', 'mail.ru_bot', 'petalbot', 'seznambot',
+)
+BOT_USER_AGENTS = (
+    'bot/', '+http', 'crawler', 'spider', 'slackbot', 'telegrambot', 'scrapy', 'curl/', 'wget/', 'python-requests/',
+    'python-urllib/', 'aiohttp/', 'python-httpx/', 'go-http-client/', 'java/', 'okhttp/', 'libwww-perl/',
+    'headlesschrome', 'phantomjs', 'facebookexternalhit/', 'whatsapp/', 'skypeuripreview', 'vkshare', 'embedly',
+    'uptimerobot/', 'pingdom.com_bot', 'statuscake', 'feedfetcher-google', 'feedly/', 'newsblur', 'inoreader',
+)
+
+# Сети поисковых роботов: запросы с подменным User-Agent также не учитываются.
+# Только опубликованные списки адресов роботов (googlebot.json, bingbot.json, applebot.json). Яндекс такого списка
+# не публикует, а его общие сети (87.250.224.0/19, 95.108.128.0/17) включают офисы и сервисы с посетителями-людьми:
+# робот Яндекса определяется только по User-Agent
+SEARCH_ENGINE_NETWORKS = (
+    '66.249.64.0/19',  # Googlebot
+    '157.55.39.0/24', '207.46.13.0/24', '40.77.167.0/24',  # Bingbot
+    '17.241.0.0/16',  # Applebot
+)
+
+
+class BotMatcher:
+    """
+    Классификатор посетителя: одно скомпилированное регулярное выражение на класс и список сетей.
+    Создается один раз на процесс (get_bot_matcher)
+    """
+
+    def __init__(self, search_engine_user_agents, bot_user_agents, search_engine_networks):
+        self.search_engine_pattern = self.compile(search_engine_user_agents)
+        self.bot_pattern = self.compile(bot_user_agents)
+        self.search_engine_networks = tuple(ipaddress.ip_network(network) for network in search_engine_networks)
+
+    @staticmethod
+    def compile(fragments):
+        return re.compile('|'.join(re.escape(fragment) for fragment in fragments), re.IGNORECASE)
+
+    def in_search_engine_network(self, ip):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return any(address in network for network in self.search_engine_networks)
+
+    def classify(self, user_agent, ip):
+        if self.search_engine_pattern.search(user_agent) or self.in_search_engine_network(ip):
+            return SEARCH_ENGINE
+        # Браузер всегда передает User-Agent
+        if not user_agent or self.bot_pattern.search(user_agent):
+            return BOT
+        return HUMAN
+
+
+@lru_cache(maxsize=None)
+def get_bot_matcher():
+    return BotMatcher(
+        SEARCH_ENGINE_USER_AGENTS + tuple(settings.BOT_EXTRA_SEARCH_ENGINE_USER_AGENTS),
+        BOT_USER_AGENTS + tuple(settings.BOT_EXTRA_USER_AGENTS),
+        SEARCH_ENGINE_NETWORKS + tuple(settings.BOT_EXTRA_NETWORKS),
+    )
+
+
+def get_visitor_class(request):
+    """
+    Класс посетителя (human, search_engine, bot); результат сохраняется в запросе
+    """
+    if not hasattr(request, '_visitor_class'):
+        request._visitor_class = get_bot_matcher().classify(request.META.get('HTTP_USER_AGENT', ''),
+                                                            get_client_ip(request) or '')
+        metrics.visitor_requests.inc(visitor_class=request._visitor_class)
+    return request._visitor_class
+
+
+def is_bot(request):
+    return get_visitor_class(request) != HUMAN
@@ -0,0 +1,40 @@
+from django.core.cache.backends.redis import RedisCache
+
+from .metrics import cache_operations, get_request_metrics
+
+_missing = object()
+
+
+def record_cache_lookups(hits, misses):
+    """
+    Учет попаданий и промахов кэша в метриках процесса и текущего запроса
+    """
+    if hits:
+        cache_operations.inc(hits, result='hit')
+    if misses:
+        cache_operations.inc(misses, result='miss')
+    request_metrics = get_request_metrics()
+    if request_metrics is not None:
+        request_metrics.cache_hits += hits
+        request_metrics.cache_misses += misses
+
+
+class InstrumentedCacheMixin:
+    """
+    Миксин бэкенда кэша с подсчетом попаданий и промахов при чтении
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        record_cache_lookups(int(value is not _missing), int(value is _missing))
+        return default if value is _missing else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = super().get_many(keys, version)
+        record_cache_lookups(len(values), len(keys) - len(values))
+        return values
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    pass
@@ -1,4 +1,7 @@
-from django.core.mail import EmailMessage
+import smtplib
+
+from django.apps import apps
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
 from django.conf import settings
 from django.template.loader import render_to_string
 # from django.contrib.auth.models import User
@@ -12,6 +15,82 @@ from django.shortcuts import get_object_or_404
 
 User = get_user_model()
 
+# SMTP соединение процесса (воркера), переиспользуемое между задачами
+_pooled_connection = None
+
+
+def is_connection_alive(connection):
+    """
+    Проверка открытого SMTP соединения командой NOOP
+    """
+    smtp = getattr(connection, 'connection', None)
+    if smtp is None:
+        # Бэкенды без сетевого соединения (locmem, console) или еще не открытое соединение
+        return not hasattr(connection, 'connection')
+    try:
+        return smtp.noop()[0] == 250
+    except (smtplib.SMTPException, OSError):
+        return False
+
+
+def get_pooled_connection():
+    """
+    Постоянное SMTP соединение процесса: открывается один раз и переоткрывается, если сервер его закрыл
+    """
+    global _pooled_connection
+    if _pooled_connection is not None and not is_connection_alive(_pooled_connection):
+        close_pooled_connection()
+    if _pooled_connection is None:
+        _pooled_connection = get_connection(fail_silently=False)
+        _pooled_connection.open()
+    return _pooled_connection
+
+
+def close_pooled_connection():
+    global _pooled_connection
+    if _pooled_connection is not None:
+        try:
+            _pooled_connection.close()
+        except (smtplib.SMTPException, OSError):
+            pass
+        _pooled_connection = None
+
+
+def send_email_messages(messages, connection=None):
+    """
+    Отправка писем по одному через одно SMTP соединение (по умолчанию - постоянное соединение процесса).
+    При разрыве соединения повторяется только письмо, на котором оно оборвалось: отправленные ранее не дублируются
+    """
+    pooled = connection is None
+    if pooled:
+        connection = get_pooled_connection()
+    sent = 0
+    for message in messages:
+        try:
+            sent += connection.send_messages([message]) or 0
+        except smtplib.SMTPServerDisconnected:
+            if not pooled:
+                raise
+            # Сервер закрыл соединение (таймаут простоя, перезапуск): одна повторная попытка с новым соединением
+            close_pooled_connection()
+            connection = get_pooled_connection()
+            sent += connection.send_messages([message]) or 0
+    return sent
+
+
+def build_email_messages(payloads):
+    """
+    Письма из сериализуемых словарей (для передачи в Celery задачи)
+    """
+    messages = []
+    for payload in payloads:
+        message = EmailMultiAlternatives(payload['subject'], payload['body'], payload.get('from_email'),
+                                         payload['to'])
+        if payload.get('html'):
+            message.attach_alternative(payload['html'], 'text/html')
+        messages.append(message)
+    return messages
+
 
 def send_contact_email_message(subject, email, content, ip, user_id):
     """
@@ -26,7 +105,7 @@ def send_contact_email_message(subject, email, content, ip, user_id):
         'user': user,
     })
     email = EmailMessage(subject, message, settings.SERVER_EMAIL, [settings.EMAIL_ADMIN])
-    email.send(fail_silently=False)
+    return send_email_messages([email])
 
 
 def send_activate_email_message(user_id):
@@ -43,4 +122,43 @@ def send_activate_email_message(user_id):
         'user': user,
         'activation_url': f'http://{current_site}{activation_url}',
     })
-    return user.email_user(subject, message)
+    return send_email_messages([EmailMessage(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])])
+
+
+def send_password_reset_email_message(subject_template_name, email_template_name, context, from_email, to_email,
+                                      html_email_template_name=None):
+    """
+    Функция отправки письма для восстановления пароля (аналог PasswordResetForm.send_mail)
+    """
+    context = dict(context, user=User.objects.get(pk=context['user_id']))
+    subject = ''.join(render_to_string(subject_template_name, context).splitlines())
+    body = render_to_string(email_template_name, context)
+    message = EmailMultiAlternatives(subject, body, from_email, [to_email])
+    if html_email_template_name is not None:
+        message.attach_alternative(render_to_string(html_email_template_name, context), 'text/html')
+    return send_email_messages([message])
+
+
+def render_followers_notification(article_ids):
+    """
+    Письмо подписчикам о новых статьях автора (одна статья или дайджест).
+    Рендерится один раз и рассылается всем подписчикам без изменений
+    """
+    articles = list(apps.get_model('blog.Article').objects.filter(pk__in=article_ids).select_related('author')
+                    .only('title', 'slug', 'excerpt', 'time_create', 'author__username', 'author__first_name',
+                          'author__last_name').order_by('time_create'))
+    if not articles:
+        return None
+    author = articles[0].author
+    author_name = author.get_full_name() or author.username
+    if len(articles) == 1:
+        subject = f'Новая статья от {author_name}: {articles[0].title}'
+    else:
+        subject = f'Новые статьи от {author_name} ({len(articles)})'
+    current_site = Site.objects.get_current().domain
+    message = render_to_string('system/email/followers_notification.html', {
+        'author_name': author_name,
+        'articles': articles,
+        'site_url': f'http://{current_site}',
+    })
+    return {'subject': subject, 'body': message, 'from_email': settings.DEFAULT_FROM_EMAIL}
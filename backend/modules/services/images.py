@@ -0,0 +1,148 @@
+import colorsys
+import hashlib
+import os
+import re
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+# Форматы вариантов изображения: ключ манифеста, формат Pillow, расширение файла
+VARIANT_FORMATS = (
+    ('webp', 'WEBP', 'webp'),
+    ('jpeg', 'JPEG', 'jpg'),
+)
+
+
+def get_variant_name(name, width, extension):
+    """
+    Имя файла варианта изображения: images/a.png -> images/a-480w.webp
+    """
+    root, _ = os.path.splitext(name)
+    return f'{root}-{width}w.{extension}'
+
+
+def generate_image_variants(storage, name, widths, quality=80):
+    """
+    Генерация набора уменьшенных копий изображения в WebP и JPEG.
+    Оригинал не изменяется, анимированные изображения не обрабатываются.
+    Возвращает манифест для сохранения в JSON поле модели.
+    """
+    with storage.open(name, 'rb') as file:
+        img = Image.open(file)
+        if getattr(img, 'is_animated', False):
+            return {}
+        img = ImageOps.exif_transpose(img)
+        img.load()
+
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+
+    # Не увеличиваем изображения: ширины больше оригинала заменяются шириной оригинала
+    target_widths = sorted({min(width, img.width) for width in widths})
+
+    variants = []
+    for width in target_widths:
+        height = round(img.height * width / img.width)
+        resized = img.resize((width, height), Image.LANCZOS) if width != img.width else img
+        variant = {'width': width, 'height': height}
+        for key, image_format, extension in VARIANT_FORMATS:
+            output = resized
+            if image_format == 'JPEG' and output.mode == 'RGBA':
+                # JPEG не поддерживает прозрачность, подкладываем белый фон
+                output = Image.new('RGB', resized.size, (255, 255, 255))
+                output.paste(resized, mask=resized.split()[-1])
+            buffer = BytesIO()
+            output.save(buffer, format=image_format, quality=quality, optimize=True)
+            variant_name = get_variant_name(name, width, extension)
+            if storage.exists(variant_name):
+                storage.delete(variant_name)
+            variant[key] = storage.save(variant_name, ContentFile(buffer.getvalue()))
+        variants.append(variant)
+
+    return {
+        'source': name,
+        'width': img.width,
+        'height': img.height,
+        'variants': variants,
+    }
+
+
+def get_or_generate_image_variants(storage, name, widths, quality=80):
+    """
+    Манифест вариантов изображения без повторного кодирования, если все варианты уже сохранены
+    """
+    with storage.open(name, 'rb') as file:
+        img = Image.open(file)
+        if getattr(img, 'is_animated', False):
+            return {}
+        width, height = img.size
+        if img.getexif().get(0x0112) in (5, 6, 7, 8):
+            # Изображение будет повернуто при генерации вариантов
+            width, height = height, width
+
+    variants = []
+    for variant_width in sorted({min(item, width) for item in widths}):
+        variant = {'width': variant_width, 'height': round(height * variant_width / width)}
+        for key, _, extension in VARIANT_FORMATS:
+            variant[key] = get_variant_name(name, variant_width, extension)
+            if not storage.exists(variant[key]):
+                return generate_image_variants(storage, name, widths, quality)
+        variants.append(variant)
+    return {'source': name, 'width': width, 'height': height, 'variants': variants}
+
+
+def delete_image_variants(storage, manifest):
+    """
+    Удаление файлов вариантов изображения по манифесту
+    """
+    for variant in (manifest or {}).get('variants', []):
+        for key, _, _ in VARIANT_FORMATS:
+            if variant.get(key):
+                storage.delete(variant[key])
+
+
+def get_default_avatar_name(slug):
+    """
+    Путь к сгенерированному аватару по умолчанию для профиля
+    """
+    return f'images/avatars/default/{slug}.png'
+
+
+def render_default_avatar(slug, size=300):
+    """
+    Аватар по умолчанию: инициалы на детерминированном цвете, вычисленном из slug профиля
+    """
+    digest = hashlib.md5(slug.encode()).digest()
+    red, green, blue = colorsys.hls_to_rgb(digest[0] / 255, 0.45, 0.55)
+    background = (round(red * 255), round(green * 255), round(blue * 255))
+
+    parts = [part for part in re.split(r'[-_.]+', slug) if part]
+    if len(parts) > 1:
+        initials = parts[0][0] + parts[1][0]
+    else:
+        initials = (parts[0] if parts else '?')[:2]
+
+    img = Image.new('RGB', (size, size), background)
+    draw = ImageDraw.Draw(img)
+    font_size = size * 2 // 5
+    font_path = getattr(settings, 'DEFAULT_AVATAR_FONT', None)
+    font = ImageFont.truetype(font_path, font_size) if font_path else ImageFont.load_default(size=font_size)
+    draw.text((size / 2, size / 2), initials.upper(), fill=(255, 255, 255), font=font, anchor='mm')
+
+    buffer = BytesIO()
+    img.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def save_default_avatar(storage, slug, overwrite=False):
+    """
+    Сохранение аватара по умолчанию в медиа хранилище (один раз для каждого slug)
+    """
+    name = get_default_avatar_name(slug)
+    if storage.exists(name):
+        if not overwrite:
+            return name
+        storage.delete(name)
+    return storage.save(name, ContentFile(render_default_avatar(slug)))
@@ -0,0 +1,195 @@
+import json
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import connections
+from django.utils import timezone
+
+# Канонические запросы: имя -> (функция построения QuerySet, ожидаемый индекс (модель, поля) или None)
+AUDIT_QUERIES = {}
+
+# Узлы плана, читающие индекс
+INDEX_SCAN_NODES = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+
+def audit_query(name, index=None):
+    """
+    Регистрация канонического запроса. Функция получает контекст (статья, пользователь, тег)
+    и возвращает QuerySet; index - поля составного индекса, которым запрос должен обслуживаться
+    """
+
+    def decorator(build):
+        AUDIT_QUERIES[name] = (build, index)
+        return build
+
+    return decorator
+
+
+def walk_plan(node):
+    """
+    Обход узлов плана EXPLAIN (FORMAT JSON)
+    """
+    yield node
+    for child in node.get('Plans', ()):
+        yield from walk_plan(child)
+
+
+def explain_queryset(queryset, analyze=True):
+    """
+    Корневой узел плана и общее время выполнения (мс, только при ANALYZE)
+    """
+    options = {'analyze': True, 'buffers': True} if analyze else {}
+    explain = json.loads(queryset.explain(format='json', **options))[0]
+    return explain['Plan'], explain.get('Execution Time')
+
+
+def get_table_rows(using, tables):
+    """
+    Количество строк таблиц по статистике (pg_stat_user_tables.n_live_tup обновляется и без ANALYZE)
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT relname, n_live_tup FROM pg_stat_user_tables WHERE relname = ANY(%s)', [list(tables)])
+        return dict(cursor.fetchall())
+
+
+def get_unused_indexes(using, tables):
+    """
+    Неиспользуемые индексы (idx_scan = 0 с последнего сброса статистики), кроме первичных ключей и уникальных
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute("""
+            SELECT stat.relname, stat.indexrelname, pg_relation_size(stat.indexrelid)
+            FROM pg_stat_user_indexes stat
+            JOIN pg_index ON pg_index.indexrelid = stat.indexrelid
+            WHERE stat.idx_scan = 0 AND NOT pg_index.indisunique AND NOT pg_index.indisprimary
+                AND stat.relname = ANY(%s)
+            ORDER BY pg_relation_size(stat.indexrelid) DESC
+        """, [list(tables)])
+        return cursor.fetchall()
+
+
+def find_covering_index(using, model, fields):
+    """
+    Имя существующего индекса, первые столбцы которого совпадают с полями (направление сортировки не учитывается)
+    """
+    columns = [model._meta.get_field(field.lstrip('-')).column for field in fields]
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+    for name, constraint in constraints.items():
+        if (constraint['index'] or constraint['unique']) and constraint['columns'][:len(columns)] == columns:
+            return name
+    return None
+
+
+def get_project_tables():
+    """
+    Таблицы моделей проекта (приложения modules.*), включая промежуточные таблицы ManyToMany
+    """
+    tables = set()
+    for model in apps.get_models(include_auto_created=True):
+        if model.__module__.startswith('modules.'):
+            tables.add(model._meta.db_table)
+    return tables
+
+
+@audit_query('manager.all', index=('blog.Article', ['status', '-fixed', '-time_create']))
+def manager_all(context):
+    from modules.blog.models import Article
+    return Article.objects.all()[:10]
+
+
+@audit_query('manager.detail')
+def manager_detail(context):
+    from modules.blog.models import Article
+    return Article.objects.detail().filter(slug=context['article'].slug)
+
+
+@audit_query('view.articles_by_category', index=('blog.Article', ['category', 'status', '-fixed', '-time_create']))
+def articles_by_category(context):
+    from modules.blog.models import Article
+    return Article.objects.all().filter(category__slug=context['article'].category.slug)[:10]
+
+
+@audit_query('view.articles_by_tags')
+def articles_by_tags(context):
+    from modules.blog.models import Article
+    return Article.objects.all().filter(tags__slug=context['tag'].slug)[:10]
+
+
+@audit_query('view.articles_by_signed_user', index=('blog.Article', ['author', 'status', '-fixed', '-time_create']))
+def articles_by_signed_user(context):
+    from modules.blog.models import Article
+    return Article.objects.all().filter(author__profile__followers=context['user'].profile)[:10]
+
+
+@audit_query('view.get_similar_articles')
+def similar_articles(context):
+    from django.db.models import Count
+    from modules.blog.models import Article
+    article = context['article']
+    return (Article.objects.filter(tags__in=article.tags.values_list('id', flat=True)).exclude(id=article.id)
+            .annotate(related_tags=Count('tags')).order_by('-related_tags'))
+
+
+@audit_query('view.article_comments', index=('blog.Comment', ['article', '-time_create']))
+def article_comments(context):
+    from modules.blog.models import Comment
+    return Comment.objects.filter(article=context['article'])
+
+
+@audit_query('mixin.view_count', index=('blog.ViewCount', ['article', 'ip_address']))
+def view_count_lookup(context):
+    from modules.blog.models import ViewCount
+    return ViewCount.objects.filter(article=context['article'], ip_address='127.0.0.1')
+
+
+@audit_query('model.get_today_view_count', index=('blog.ViewCount', ['article', 'viewed_on']))
+def today_view_count(context):
+    from modules.blog.models import ViewCount
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    return ViewCount.objects.filter(article=context['article'], viewed_on__gte=today)
+
+
+@audit_query('view.rating', index=('blog.Rating', ['article', 'ip_address']))
+def rating_lookup(context):
+    from modules.blog.models import Rating
+    return Rating.objects.filter(article=context['article'], ip_address='127.0.0.1')
+
+
+@audit_query('tag.popular_articles', index=('blog.ViewCount', ['article', 'viewed_on']))
+def popular_articles(context):
+    from modules.blog.templatetags.blog_tags import popular_articles as tag
+    return tag()
+
+
+@audit_query('tag.popular_tags')
+def popular_tags(context):
+    from django.db.models import Count
+    from taggit.models import Tag
+    return Tag.objects.annotate(num_times=Count('article')).order_by('-num_times')
+
+
+@audit_query('tag.show_latest_comments', index=('blog.Comment', ['status', '-time_create']))
+def latest_comments(context):
+    from modules.blog.templatetags.blog_tags import show_latest_comments as tag
+    return tag()['comments']
+
+
+@audit_query('feed.latest_articles', index=('blog.Article', ['-time_update']))
+def latest_articles_feed(context):
+    from modules.blog.models import Article
+    return Article.objects.order_by('-time_update')[:5]
+
+
+@audit_query('task.notify_followers', index=('blog.Article', ['author', 'status', 'time_create']))
+def published_today(context):
+    from modules.blog.models import Article
+    return Article.objects.filter(author=context['article'].author, status='published',
+                                  time_create__gte=timezone.now() - timedelta(days=1))
+
+
+@audit_query('view.profile_detail')
+def profile_detail(context):
+    from modules.system.models import Profile
+    return Profile.objects.filter(slug=context['user'].profile.slug).select_related('user')
@@ -0,0 +1,118 @@
+import json
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from modules.blog.models import Article
+from modules.services.benchmarks import BENCHMARKS, run_benchmark
+from modules.services.management.commands.seed_dataset import SEED_PREFIX, flush_dataset
+
+User = get_user_model()
+
+# Объем данных при масштабе 1 (остальные параметры seed_dataset - по умолчанию)
+BASE_VOLUMES = {'users': 100, 'articles': 250, 'tags': 50}
+
+
+class Command(BaseCommand):
+    """
+    Команда для замера менеджеров, тегов шаблонов и представлений на синтетических данных разного объема.
+    Результаты сохраняются в JSON для сравнения между версиями кода
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1,4', help='Масштабы данных через запятую (1 = 250 статей)')
+        parser.add_argument('--repeat', type=int, default=20, help='Количество повторов каждого замера')
+        parser.add_argument('--only', default='', help='Имена замеров через запятую')
+        parser.add_argument('--output', default=None, help='Файл для результатов (по умолчанию benchmark-<дата>.json)')
+        parser.add_argument('--compare', default=None, help='Файл предыдущих результатов для сравнения')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--keep', action='store_true', help='Не удалять сгенерированные данные после замеров')
+        parser.add_argument('--with-cache', action='store_true',
+                            help='Использовать настроенный кэш (по умолчанию кэш отключен)')
+
+    def handle(self, *args, **options):
+        try:
+            scales = [float(scale) for scale in options['scales'].split(',')]
+        except ValueError:
+            raise CommandError('--scales must be a comma separated list of numbers')
+        names = [name for name in options['only'].split(',') if name] or list(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f'Unknown benchmarks: {", ".join(sorted(unknown))}')
+
+        overrides = {'DEBUG': False, 'INTERNAL_IPS': [], 'ALLOWED_HOSTS': ['*']}
+        if not options['with_cache']:
+            overrides['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+        previous = self.load_results(options['compare']) if options['compare'] else None
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'results': [],
+        }
+        try:
+            for scale in scales:
+                volumes = {key: max(int(value * scale), 1) for key, value in BASE_VOLUMES.items()}
+                call_command('seed_dataset', flush=True, seed=options['seed'], stdout=self.stdout, **volumes)
+                with override_settings(**overrides):
+                    results = self.run_scale(names, options['repeat'])
+                report['results'].append({'scale': scale, 'volumes': volumes, 'benchmarks': results})
+        finally:
+            if not options['keep']:
+                flush_dataset()
+
+        output = options['output'] or f'benchmark-{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}.json'
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+        self.stdout.write(self.style.SUCCESS(f'Results saved to {output}'))
+
+        if previous is not None:
+            self.compare(options['compare'], previous, report)
+
+    def get_context(self):
+        """
+        Объекты для замеров: статья с наибольшим числом комментариев и пользователь с наибольшим числом подписок
+        """
+        article = (Article.objects.filter(slug__startswith=f'{SEED_PREFIX}-', status='published')
+                   .annotate(comment_count=Count('comments')).order_by('-comment_count', 'pk').first())
+        user = (User.objects.filter(username__startswith=f'{SEED_PREFIX}_')
+                .annotate(following_count=Count('profile__following')).order_by('-following_count', 'pk').first())
+        return {'article': article, 'user': user}
+
+    def run_scale(self, names, repeat):
+        context = self.get_context()
+        results = {}
+        for name in names:
+            setup, postgres_only = BENCHMARKS[name]
+            if postgres_only and connection.vendor != 'postgresql':
+                self.stdout.write(f'  {name}: skipped (PostgreSQL only)')
+                continue
+            results[name] = run_benchmark(setup(context), repeat)
+            self.stdout.write(f'  {name}: {results[name]["mean_ms"]:.2f}ms, {results[name]["queries"]} queries')
+        return results
+
+    def load_results(self, path):
+        try:
+            with open(path, encoding='utf-8') as file:
+                return {result['scale']: result['benchmarks'] for result in json.load(file)['results']}
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Cannot read benchmark results from {path}: {error}')
+
+    def compare(self, path, previous, report):
+        self.stdout.write(f'Comparison with {path}:')
+        for result in report['results']:
+            for name, current in result['benchmarks'].items():
+                before = previous.get(result['scale'], {}).get(name)
+                if not before:
+                    continue
+                ratio = before['mean_ms'] / current['mean_ms'] if current['mean_ms'] else 0
+                self.stdout.write(
+                    f'  x{result["scale"]:g} {name}: {before["mean_ms"]:.2f}ms -> {current["mean_ms"]:.2f}ms '
+                    f'({ratio:.2f}x), queries {before["queries"]} -> {current["queries"]}')
@@ -0,0 +1,60 @@
+import re
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from modules.blog.models import Article
+from modules.services.utils import CkeditorHashedStorage
+
+DIGEST_PATTERN = re.compile(r'blobs/[0-9a-f]{2}/([0-9a-f]{64})')
+
+
+class Command(BaseCommand):
+    """
+    Команда для удаления загрузок редактора, на которые не ссылается ни одна статья
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age-hours', type=int, default=24,
+                            help='Не удалять файлы моложе указанного возраста (могут использоваться в несохраненных статьях)')
+        parser.add_argument('--dry-run', action='store_true', help='Только вывести список файлов для удаления')
+
+    def count_references(self):
+        """
+        Подсчет ссылок на каждый файл (по хэшу содержимого) во всех статьях
+        """
+        references = Counter()
+        for fields in Article.objects.values_list('short_description', 'full_description').iterator():
+            for value in fields:
+                references.update(DIGEST_PATTERN.findall(value or ''))
+        return references
+
+    def iter_blobs(self, storage):
+        folders, _ = storage.listdir(storage.blobs_folder) if storage.exists(storage.blobs_folder) else ([], [])
+        for folder in folders:
+            _, files = storage.listdir(f'{storage.blobs_folder}/{folder}')
+            for file in files:
+                yield f'{storage.blobs_folder}/{folder}/{file}'
+
+    def handle(self, *args, **options):
+        storage = CkeditorHashedStorage()
+        references = self.count_references()
+        threshold = timezone.now() - timedelta(hours=options['min_age_hours'])
+
+        total, removed = 0, 0
+        for name in self.iter_blobs(storage):
+            total += 1
+            match = DIGEST_PATTERN.match(name)
+            if not match or references[match.group(1)] or storage.get_modified_time(name) > threshold:
+                continue
+            removed += 1
+            if options['dry_run']:
+                self.stdout.write(f'Orphaned: {name}')
+            else:
+                storage.delete(name)
+
+        action = 'Found' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {removed} orphaned of {total} blobs, {len(references)} blobs are referenced'))
@@ -0,0 +1,69 @@
+import statistics
+import time
+
+from django.core.management import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.test import Client
+
+from modules.blog.models import Article
+
+
+class Command(BaseCommand):
+    """
+    Команда для замера задержки запроса с новым соединением с базой на каждый запрос
+    и с постоянными соединениями (или пулом psycopg 3) из настроек DATABASES
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Количество запросов в каждом замере')
+        parser.add_argument('--url', default=None,
+                            help='Адрес страницы для тестового клиента (по умолчанию - только запрос к базе)')
+        parser.add_argument('--database', default='default')
+
+    def request(self, url):
+        """
+        Один цикл запроса: сигналы начала и окончания закрывают устаревшие соединения, как в WSGI обработчике
+        """
+        if url:
+            return Client().get(url)
+        request_started.send(sender=self.__class__)
+        try:
+            list(Article.objects.all()[:10])
+        finally:
+            request_finished.send(sender=self.__class__)
+
+    def measure(self, title, database, conn_max_age, options):
+        connection = connections[database]
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+        # Первый запрос прогревает кэши шаблонов и URL
+        self.request(options['url'])
+        timings = []
+        for _ in range(options['requests']):
+            started = time.perf_counter()
+            self.request(options['url'])
+            timings.append((time.perf_counter() - started) * 1000)
+        connection.close()
+        timings.sort()
+        mean = statistics.fmean(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f'{title}: mean {mean:.2f}ms, p50 {statistics.median(timings):.2f}ms, p95 {p95:.2f}ms')
+        return mean
+
+    def handle(self, *args, **options):
+        database = options['database']
+        settings_dict = connections[database].settings_dict
+        configured_age = settings_dict['CONN_MAX_AGE']
+        if settings_dict.get('OPTIONS', {}).get('pool'):
+            # Пул создается один раз на процесс и не отключается на лету: замеряется только текущая конфигурация
+            self.measure('psycopg pool', database, configured_age, options)
+            return
+        persistent_age = configured_age or None
+        try:
+            without = self.measure('New connection per request', database, 0, options)
+            persistent = self.measure(f'Persistent connection (CONN_MAX_AGE={persistent_age})', database,
+                                      persistent_age, options)
+        finally:
+            settings_dict['CONN_MAX_AGE'] = configured_age
+        self.stdout.write(self.style.SUCCESS(f'Persistent connections are {without / persistent:.1f}x faster'))
@@ -1,13 +1,261 @@
-from django.core.management import call_command, BaseCommand
+import gzip
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from multiprocessing import get_context
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core import serializers
+from django.core.management import call_command, BaseCommand, CommandError
+from django.db import connection, connections, models, transaction
+from django.utils import timezone
+
+# Таблицы, которые не попадают в резервную копию (создаются миграциями, сопоставляются через манифест)
+EXCLUDED_MODELS = ('contenttypes.contenttype', 'admin.logentry', 'auth.permission')
+
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def open_backup_file(path, compression, mode='w'):
+    """
+    Открытие файла резервной копии на запись (mode='w') или чтение (mode='r') с потоковым сжатием
+    """
+    if compression == 'gzip':
+        return gzip.open(path, f'{mode}t', encoding='utf-8', compresslevel=6)
+    if compression == 'zstd':
+        import zstandard
+        if mode == 'r':
+            return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')), encoding='utf-8')
+        return io.TextIOWrapper(zstandard.ZstdCompressor(level=6).stream_writer(open(path, 'wb')), encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def get_incremental_field(model):
+    """
+    Поле времени изменения записи для инкрементальной копии.
+    Дата создания используется только для таблиц, записи которых не изменяются
+    """
+    field_names = {field.name for field in model._meta.concrete_fields}
+    if 'time_update' in field_names:
+        return 'time_update'
+    if model._meta.label_lower in settings.DBACKUP_APPEND_ONLY_MODELS:
+        return next((name for name in ('time_create', 'viewed_on') if name in field_names), None)
+    return None
+
+
+def read_backup_pks(path, compression):
+    """
+    Первичные ключи из файла .pks резервной копии (по одному значению JSON в строке)
+    """
+    with open_backup_file(path, compression, mode='r') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_deleted_pks(model, previous, current):
+    """
+    Ключи предыдущей копии, которых больше нет в таблице. Оба списка упорядочены по первичному ключу в базе:
+    числовые ключи сравниваются слиянием без загрузки в память, остальные (сессии) - через множество
+    """
+    if not isinstance(model._meta.pk, models.IntegerField):
+        present = set(current)
+        yield from (pk for pk in previous if pk not in present)
+        return
+    current = iter(current)
+    head = next(current, None)
+    for pk in previous:
+        while head is not None and head < pk:
+            head = next(current, None)
+        if head != pk:
+            yield pk
+
+
+def dump_model(label, path, compression, since, chunk_size, base_pks=None):
+    """
+    Потоковая выгрузка одной модели в JSON Lines (выполняется в отдельном процессе при --jobs > 1).
+    Рядом записываются все первичные ключи таблицы (.pks), в инкрементальной копии - удаленные после
+    базовой копии записи (.deleted), которые dbrestore удаляет после загрузки измененных.
+    base_pks - путь к файлу .pks базовой копии и его сжатие
+    """
+    model = apps.get_model(label)
+    queryset = model._default_manager.get_queryset().order_by(model._meta.pk.name)
+    m2m_fields = [field.name for field in model._meta.local_many_to_many
+                  if field.remote_field.through._meta.auto_created]
+    if m2m_fields:
+        queryset = queryset.prefetch_related(*m2m_fields)
+
+    incremental_field = get_incremental_field(model) if since else None
+    if incremental_field:
+        queryset = queryset.filter(**{f'{incremental_field}__gte': since})
+
+    stem = os.path.join(os.path.dirname(path), label)
+    extension = os.path.basename(path)[len(label):]
+    pks_path, deleted_path = f'{stem}.pks{extension}', f'{stem}.deleted{extension}'
+    count = 0
+
+    def counted(objects):
+        nonlocal count
+        for obj in objects:
+            count += 1
+            yield obj
+
+    snapshot = connection.vendor == 'postgresql' and not connection.in_atomic_block
+    with transaction.atomic():
+        if snapshot:
+            # Ключи и записи читаются из одного снимка: запись, удаленная между запросами, не потеряет отметку
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        with open_backup_file(pks_path, compression) as file:
+            for pk in model._default_manager.order_by('pk').values_list('pk', flat=True).iterator(chunk_size):
+                file.write(json.dumps(pk) + '\n')
+        with open_backup_file(path, compression) as file:
+            serializers.serialize('jsonl', counted(queryset.iterator(chunk_size=chunk_size)), stream=file)
+
+    result = {
+        'model': label,
+        'file': os.path.basename(path),
+        'objects': count,
+        'incremental': bool(incremental_field),
+        'pks_file': os.path.basename(pks_path),
+        'deleted': None,
+    }
+    if base_pks is not None:
+        deleted = 0
+        with open_backup_file(deleted_path, compression) as file:
+            for pk in iter_deleted_pks(model, read_backup_pks(*base_pks), read_backup_pks(pks_path, compression)):
+                file.write(json.dumps(pk) + '\n')
+                deleted += 1
+        result.update(deleted=deleted, deleted_file=os.path.basename(deleted_path))
+    return result
+
 
 class Command(BaseCommand):
     """
     Команда для создания резервной копии базы данных
     """
 
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default=settings.DBACKUP_DIR, help='Каталог для резервных копий')
+        parser.add_argument('--compress', choices=tuple(COMPRESSION_EXTENSIONS), default='gzip',
+                            help='Сжатие файлов моделей')
+        parser.add_argument('--jobs', type=int, default=1, help='Количество процессов для параллельной выгрузки моделей')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Выгрузить только записи, измененные после предыдущей копии, и ключи записей, '
+                                 'удаленных после нее (dbrestore удаляет их при восстановлении)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Размер пачки записей при чтении из базы')
+        parser.add_argument('--single-file', action='store_true',
+                            help='Старый режим: один JSON файл через dumpdata в текущем каталоге')
+
     def handle(self, *args, **options):
-        self.stdout.write('Waitining for database dump...')
+        if options['single_file']:
+            return self.dump_single_file()
+
+        if options['compress'] == 'zstd':
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                raise CommandError('zstd compression requires the "zstandard" package')
+
+        started_at = timezone.now()
+        output_dir = str(options['output_dir'])
+        base = self.get_latest_manifest(output_dir) if options['incremental'] else None
+        if options['incremental'] and base is None:
+            self.stdout.write('No previous backup found, making a full one')
+        mode = 'incremental' if base else 'full'
+        since = datetime.fromisoformat(base['started_at']) if base else None
+
+        backup_dir = os.path.join(output_dir, f'{started_at.strftime("%Y-%m-%d-%H-%M-%S")}-{mode}')
+        os.makedirs(backup_dir, exist_ok=True)
+
+        extension = '.jsonl' + COMPRESSION_EXTENSIONS[options['compress']]
+        base_pks = self.get_base_pks(output_dir, base) if base else {}
+        jobs = [
+            (label, os.path.join(backup_dir, f'{label}{extension}'), options['compress'], since, options['chunk_size'],
+             base_pks.get(label))
+            for label in self.get_model_labels()
+        ]
+
+        self.stdout.write(f'Waiting for database dump ({mode}, {len(jobs)} models)...')
+        if options['jobs'] > 1:
+            # Дочерние процессы открывают собственные соединения с базой
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['jobs'], mp_context=get_context('fork')) as executor:
+                results = list(executor.map(dump_model, *zip(*jobs)))
+        else:
+            results = [dump_model(*job) for job in jobs]
+
+        manifest = {
+            # Версия 2: файлы первичных ключей (pks_file) и удаленных записей (deleted_file) моделей
+            'version': 2,
+            'mode': mode,
+            'format': 'jsonl',
+            'compression': options['compress'],
+            'started_at': started_at.isoformat(),
+            'finished_at': timezone.now().isoformat(),
+            'since': since.isoformat() if since else None,
+            'base': base['path'] if base else None,
+            'content_types': {
+                content_type.pk: [content_type.app_label, content_type.model]
+                for content_type in ContentType.objects.all()
+            },
+            'permissions': {
+                permission.pk: [permission.content_type.app_label, permission.codename]
+                for permission in Permission.objects.select_related('content_type')
+            },
+            'models': results,
+        }
+        with open(os.path.join(backup_dir, MANIFEST_NAME), 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=4)
+
+        total = sum(result['objects'] for result in results)
+        self.stdout.write(self.style.SUCCESS(f'Database successfully backed up: {total} objects to {backup_dir}'))
+
+    def get_model_labels(self):
+        """
+        Модели для резервного копирования в порядке зависимостей
+        """
+        app_list = [
+            (app_config, [model for model in app_config.get_models()
+                          if model._meta.managed and not model._meta.proxy
+                          and model._meta.label_lower not in EXCLUDED_MODELS])
+            for app_config in apps.get_app_configs()
+        ]
+        return [model._meta.label_lower for model in serializers.sort_dependencies(app_list, allow_cycles=True)]
+
+    def get_base_pks(self, output_dir, base):
+        """
+        Файлы первичных ключей моделей базовой копии. В копиях версии 1 их нет: удаления после такой копии
+        не отслеживаются (deleted: null в манифесте)
+        """
+        base_dir = os.path.dirname(os.path.join(output_dir, base['path']))
+        return {item['model']: (os.path.join(base_dir, item['pks_file']), base['compression'])
+                for item in base['models'] if item.get('pks_file')}
+
+    def get_latest_manifest(self, output_dir):
+        """
+        Манифест последней резервной копии в каталоге
+        """
+        if not os.path.isdir(output_dir):
+            return None
+        for name in sorted(os.listdir(output_dir), reverse=True):
+            path = os.path.join(output_dir, name, MANIFEST_NAME)
+            if os.path.isfile(path):
+                with open(path, encoding='utf-8') as file:
+                    manifest = json.load(file)
+                manifest['path'] = os.path.relpath(path, output_dir)
+                return manifest
+        return None
+
+    def dump_single_file(self):
+        self.stdout.write('Waiting for database dump...')
         call_command(
             'dumpdata',
             '--natural-foreign',
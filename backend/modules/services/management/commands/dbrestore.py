@@ -0,0 +1,352 @@
+import gzip
+import io
+import json
+import os
+from itertools import islice
+
+from django.apps import apps
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from mptt.models import MPTTModel
+
+# Экранирование спецсимволов для текстового формата COPY
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\n': '\\n', '\r': '\\r', '\t': '\\t'})
+
+# Размер блока данных, передаваемого в COPY за один раз
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Строк в одном INSERT (базы без COPY) и значений в одном условии IN
+INSERT_BATCH_SIZE = 500
+
+# Количество конфликтов уникальных полей в сообщении об ошибке
+UNIQUE_CONFLICTS_SHOWN = 5
+
+
+def open_backup_file(path, compression):
+    """
+    Открытие файла резервной копии на чтение с потоковой распаковкой
+    """
+    if compression == 'gzip':
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if compression == 'zstd':
+        import zstandard
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')), encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def to_copy_value(field, value):
+    """
+    Значение поля в текстовом формате COPY
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(field, models.JSONField):
+        value = json.dumps(value, ensure_ascii=False)
+    elif isinstance(value, bool):
+        value = 't' if value else 'f'
+    return str(value).translate(COPY_ESCAPES)
+
+
+class CopyStream(io.RawIOBase):
+    """
+    Файлоподобный объект для cursor.copy_expert, читающий строки COPY из генератора
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self.buffer) < len(target):
+            chunk = ''.join(line for _, line in zip(range(1000), self.lines))
+            if not chunk:
+                break
+            self.buffer += chunk.encode()
+        size = min(len(target), len(self.buffer))
+        target[:size], self.buffer = self.buffer[:size], self.buffer[size:]
+        return size
+
+
+class Command(BaseCommand):
+    """
+    Команда для быстрого восстановления резервной копии dbackup: в PostgreSQL через COPY,
+    в остальных базах (SQLite для разработки и тестов) пачками INSERT.
+    Данные загружаются напрямую в таблицы, минуя save() и сигналы моделей
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', help='Путь к manifest.json резервной копии')
+        parser.add_argument('--truncate', action='store_true',
+                            help='Очистить таблицы перед восстановлением полной копии')
+        parser.add_argument('--no-chain', action='store_true',
+                            help='Не применять базовые копии для инкрементальной копии')
+
+    def handle(self, *args, **options):
+        chain = self.get_manifest_chain(options['manifest'], follow_base=not options['no_chain'])
+        restored_models = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # В SQLite внешние ключи Django и так проверяются при фиксации транзакции
+                with connection.cursor() as cursor:
+                    cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+            if options['truncate']:
+                self.truncate(chain[0])
+            for manifest in chain:
+                direct = manifest['mode'] == 'full' and options['truncate'] and manifest is chain[0]
+                self.stdout.write(f'Restoring {manifest["mode"]} backup {manifest["dir"]}...')
+                remappers = self.get_remappers(manifest)
+                for item in manifest['models']:
+                    model = apps.get_model(item['model'])
+                    count = self.restore_model(manifest, item, model, remappers, direct=direct)
+                    self.stdout.write(f'  {item["model"]}: {count} objects')
+                    if model not in restored_models:
+                        restored_models.append(model)
+                # Записи, удаленные после базовой копии (инкрементальные копии версии 2)
+                for item in reversed(manifest['models']):
+                    if item.get('deleted_file'):
+                        count = self.delete_model_rows(manifest, item, apps.get_model(item['model']))
+                        self.stdout.write(f'  {item["model"]}: {count} deleted')
+            self.finalize(restored_models)
+        self.stdout.write(self.style.SUCCESS(f'Database successfully restored from {len(chain)} backups'))
+
+    def get_manifest_chain(self, path, follow_base=True):
+        """
+        Цепочка манифестов от полной копии до указанной
+        """
+        chain = []
+        while path:
+            if not os.path.isfile(path):
+                raise CommandError(f'Manifest not found: {path}')
+            with open(path, encoding='utf-8') as file:
+                manifest = json.load(file)
+            manifest['dir'] = os.path.dirname(os.path.abspath(path))
+            chain.insert(0, manifest)
+            if not follow_base or not manifest.get('base'):
+                break
+            # Путь к базовой копии хранится относительно каталога резервных копий
+            path = os.path.join(os.path.dirname(manifest['dir']), manifest['base'])
+        return chain
+
+    def truncate(self, manifest):
+        tables = []
+        for item in manifest['models']:
+            model = apps.get_model(item['model'])
+            tables.append(model._meta.db_table)
+            tables.extend(field.remote_field.through._meta.db_table for field in model._meta.local_many_to_many
+                          if field.remote_field.through._meta.auto_created)
+        # PostgreSQL: TRUNCATE ... CASCADE, SQLite: DELETE с таблицами, которые на них ссылаются
+        connection.ops.execute_sql_flush(connection.ops.sql_flush(no_style(), tables, allow_cascade=True))
+
+    def get_remappers(self, manifest):
+        """
+        Сопоставление идентификаторов типов контента и прав из копии с текущей базой
+        """
+        content_types = {(ct.app_label, ct.model): ct.pk for ct in ContentType.objects.all()}
+        permissions = {(p.content_type.app_label, p.codename): p.pk
+                       for p in Permission.objects.select_related('content_type')}
+        content_type_map = {int(pk): content_types.get(tuple(key)) for pk, key in manifest['content_types'].items()}
+        permission_map = {int(pk): permissions.get(tuple(key)) for pk, key in manifest['permissions'].items()}
+        return {ContentType: content_type_map, Permission: permission_map}
+
+    def restore_model(self, manifest, item, model, remappers, direct=False):
+        fields = model._meta.concrete_fields
+        m2m_fields = [field for field in model._meta.local_many_to_many
+                      if field.remote_field.through._meta.auto_created]
+        m2m_rows = {field.name: [] for field in m2m_fields}
+        restored_pks = []
+
+        def rows():
+            with open_backup_file(os.path.join(manifest['dir'], item['file']), manifest['compression']) as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    values = []
+                    for field in fields:
+                        value = record['pk'] if field.primary_key else record['fields'].get(field.name)
+                        if field.is_relation and value is not None and field.related_model in remappers:
+                            value = remappers[field.related_model].get(value)
+                        values.append(value)
+                    for field in m2m_fields:
+                        remapper = remappers.get(field.related_model)
+                        m2m_rows[field.name].extend(
+                            (record['pk'], remapper.get(target) if remapper else target)
+                            for target in record['fields'].get(field.name, []))
+                    if m2m_fields:
+                        restored_pks.append(record['pk'])
+                    yield values
+
+        if direct:
+            count = self.insert(model._meta.db_table, fields, rows())
+        else:
+            count = self.upsert(model, fields, rows())
+
+        for field in m2m_fields:
+            through = field.remote_field.through._meta
+            if not direct:
+                # Набор связей измененных записей заменяется целиком
+                self.delete_rows(through.db_table, field.m2m_column_name(), restored_pks)
+            through_fields = [through.get_field(field.m2m_field_name()),
+                              through.get_field(field.m2m_reverse_field_name())]
+            self.insert(through.db_table, through_fields, ([pk, related] for pk, related in m2m_rows[field.name]
+                                                          if related is not None))
+        return count
+
+    def insert(self, table, fields, rows):
+        """
+        Загрузка строк (значения полей из резервной копии) в таблицу, возвращает количество строк
+        """
+        if connection.vendor == 'postgresql':
+            return self.copy(table, [field.column for field in fields], (
+                '\t'.join(to_copy_value(field, value) for field, value in zip(fields, values)) + '\n'
+                for values in rows))
+
+        quote = connection.ops.quote_name
+        sql = (f'INSERT INTO {quote(table)} ({", ".join(quote(field.column) for field in fields)}) '
+               f'VALUES ({", ".join(["%s"] * len(fields))})')
+        count = 0
+        with connection.cursor() as cursor:
+            for batch in iter(lambda: list(islice(rows, INSERT_BATCH_SIZE)), []):
+                cursor.executemany(sql, [
+                    [field.get_db_prep_save(field.to_python(value), connection) for field, value in zip(fields, values)]
+                    for values in batch
+                ])
+                count += len(batch)
+        return count
+
+    def delete_model_rows(self, manifest, item, model):
+        """
+        Удаление записей по файлу удаленных ключей инкрементальной копии вместе с их связями многие-ко-многим
+        (с обеих сторон: запись другой модели со связью не изменялась и в копию не попала)
+        """
+        with open_backup_file(os.path.join(manifest['dir'], item['deleted_file']), manifest['compression']) as file:
+            pks = [json.loads(line) for line in file if line.strip()]
+        if not pks:
+            return 0
+        for field in model._meta.get_fields(include_hidden=True):
+            if not field.many_to_many:
+                continue
+            if field.concrete:
+                through, column = field.remote_field.through, field.m2m_column_name()
+            else:
+                through, column = field.through, field.field.m2m_reverse_name()
+            if through._meta.auto_created:
+                self.delete_rows(through._meta.db_table, column, pks)
+        self.delete_rows(model._meta.db_table, model._meta.pk.column, pks)
+        return len(pks)
+
+    def delete_rows(self, table, column, pks):
+        """
+        Удаление строк таблицы по значениям столбца: связей многие-ко-многим восстановленных записей
+        и удаленных записей инкрементальной копии
+        """
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'DELETE FROM {quote(table)} WHERE {quote(column)} = ANY(%s)', [pks])
+                return
+            for start in range(0, len(pks), INSERT_BATCH_SIZE):
+                batch = pks[start:start + INSERT_BATCH_SIZE]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f'DELETE FROM {quote(table)} WHERE {quote(column)} IN ({placeholders})', batch)
+
+    def copy(self, table, columns, lines):
+        """
+        Загрузка строк в таблицу через COPY FROM STDIN, возвращает количество строк
+        """
+        quote = connection.ops.quote_name
+        sql = f'COPY {quote(table)} ({", ".join(quote(column) for column in columns)}) FROM STDIN'
+        with connection.cursor() as cursor:
+            raw_cursor = cursor.cursor
+            if hasattr(raw_cursor, 'copy_expert'):
+                raw_cursor.copy_expert(sql, CopyStream(lines), size=COPY_BUFFER_SIZE)
+            else:
+                # psycopg 3
+                with raw_cursor.copy(sql) as copy:
+                    for line in lines:
+                        copy.write(line)
+            return raw_cursor.rowcount
+
+    def upsert(self, model, fields, rows):
+        """
+        Загрузка строк через временную таблицу с обновлением существующих записей (инкрементальные копии)
+        """
+        quote = connection.ops.quote_name
+        table = model._meta.db_table
+        stage = f'{table}_restore'
+        pk_column = model._meta.pk.column
+        with connection.cursor() as cursor:
+            conflict_columns = connection.introspection.get_primary_key_columns(cursor, table) or [pk_column]
+        columns = [field.column for field in fields]
+        column_list = ', '.join(quote(column) for column in columns)
+        updates = ', '.join(f'{quote(column)} = EXCLUDED.{quote(column)}' for column in columns
+                            if column != pk_column)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'CREATE TEMPORARY TABLE {quote(stage)} (LIKE {quote(table)} INCLUDING DEFAULTS) '
+                               f'ON COMMIT DROP')
+            else:
+                cursor.execute(f'CREATE TEMPORARY TABLE {quote(stage)} AS SELECT * FROM {quote(table)} WHERE 1 = 0')
+        count = self.insert(stage, fields, rows)
+        self.check_unique_conflicts(model, stage)
+        with connection.cursor() as cursor:
+            if conflict_columns != [pk_column]:
+                # Первичный ключ секционированной таблицы включает ключ секционирования (blog_viewcount: id,
+                # viewed_on), а даты в копии сохранены с точностью до миллисекунд: ON CONFLICT не найдет
+                # существующую запись, поэтому записи заменяются по id (внешние ключи проверяются при фиксации)
+                cursor.execute(f'DELETE FROM {quote(table)} WHERE {quote(pk_column)} IN '
+                               f'(SELECT {quote(pk_column)} FROM {quote(stage)})')
+                cursor.execute(f'INSERT INTO {quote(table)} ({column_list}) SELECT {column_list} FROM {quote(stage)}')
+            else:
+                # WHERE TRUE: без условия SQLite не отличает ON CONFLICT от продолжения SELECT
+                cursor.execute(
+                    f'INSERT INTO {quote(table)} ({column_list}) SELECT {column_list} FROM {quote(stage)} WHERE TRUE '
+                    f'ON CONFLICT ({quote(pk_column)}) DO {"UPDATE SET " + updates if updates else "NOTHING"}')
+            cursor.execute(f'DROP TABLE {quote(stage)}')
+        return count
+
+    def check_unique_conflicts(self, model, stage):
+        """
+        Записи копии, которые совпадают с другими записями базы по уникальным полям (slug, имя пользователя):
+        ON CONFLICT обрабатывает только первичный ключ, поэтому такие записи прервали бы восстановление
+        ошибкой IntegrityError. Восстановление останавливается с описанием конфликтов
+        """
+        quote = connection.ops.quote_name
+        opts = model._meta
+        unique_sets = [[field.column] for field in opts.concrete_fields if field.unique and not field.primary_key]
+        unique_sets += [[opts.get_field(name).column for name in names]
+                        for names in [*opts.unique_together, *(constraint.fields for constraint in
+                                                               opts.total_unique_constraints)]]
+        pk = quote(opts.pk.column)
+        for columns in unique_sets:
+            condition = ' AND '.join(f'stage.{quote(column)} = target.{quote(column)}' for column in columns)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT stage.{pk}, target.{pk}, {", ".join(f"stage.{quote(column)}" for column in columns)} '
+                    f'FROM {quote(stage)} stage JOIN {quote(opts.db_table)} target ON {condition} '
+                    f'WHERE stage.{pk} <> target.{pk} ORDER BY stage.{pk} LIMIT %s', [UNIQUE_CONFLICTS_SHOWN])
+                conflicts = cursor.fetchall()
+            if conflicts:
+                details = '; '.join(f'backup pk={row[0]} vs existing pk={row[1]} ({", ".join(map(str, row[2:]))})'
+                                    for row in conflicts)
+                raise CommandError(
+                    f'{opts.label_lower}: rows of the backup collide with other rows on unique '
+                    f'{", ".join(columns)}: {details}. Use --truncate to restore into empty tables')
+
+    def finalize(self, restored_models):
+        """
+        Сброс последовательностей и однократное перестроение MPTT деревьев
+        """
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), restored_models):
+                cursor.execute(sql)
+        for model in restored_models:
+            if issubclass(model, MPTTModel):
+                self.stdout.write(f'Rebuilding tree: {model._meta.label_lower}')
+                model._tree_manager.rebuild()
@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+
+from modules.system.models import Profile
+from modules.services.images import save_default_avatar
+
+
+class Command(BaseCommand):
+    """
+    Команда для генерации аватаров по умолчанию для существующих профилей без загруженного аватара
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Перегенерировать уже существующие аватары')
+
+    def handle(self, *args, **options):
+        storage = Profile._meta.get_field('avatar').storage
+        count = 0
+        for slug in Profile.objects.filter(avatar='').values_list('slug', flat=True).iterator():
+            save_default_avatar(storage, slug, overwrite=options['force'])
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Default avatars are ready for {count} profiles'))
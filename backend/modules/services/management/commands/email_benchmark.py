@@ -0,0 +1,54 @@
+import time
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management import BaseCommand
+
+from modules.services.email import send_email_messages
+from modules.services.smtp import SMTPSink
+
+
+class Command(BaseCommand):
+    """
+    Команда для замера пропускной способности отправки писем:
+    отдельное SMTP соединение на каждое письмо против отправки всех писем через одно соединение
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help='Количество писем в каждом замере')
+        parser.add_argument('--host', default=None, help='SMTP сервер (по умолчанию - локальная заглушка)')
+        parser.add_argument('--port', type=int, default=25)
+
+    def get_connection(self, host, port):
+        return get_connection('django.core.mail.backends.smtp.EmailBackend', host=host, port=port, username='',
+                              password='', use_tls=False, use_ssl=False, fail_silently=False)
+
+    def build_messages(self, count):
+        return [EmailMessage(f'Benchmark {number}', 'Тестовое письмо', 'bench@localhost', [f'user{number}@localhost'])
+                for number in range(count)]
+
+    def measure(self, title, count, send):
+        started = time.perf_counter()
+        send()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{title}: {count} messages in {elapsed:.3f}s ({count / elapsed:.1f} msg/s)')
+        return elapsed
+
+    def run(self, host, port, count):
+        def per_message():
+            for message in self.build_messages(count):
+                self.get_connection(host, port).send_messages([message])
+
+        def pooled():
+            with self.get_connection(host, port) as connection:
+                send_email_messages(self.build_messages(count), connection=connection)
+
+        single = self.measure('Connection per message', count, per_message)
+        batched = self.measure('Pooled connection', count, pooled)
+        self.stdout.write(self.style.SUCCESS(f'Pooled sending is {single / batched:.1f}x faster'))
+
+    def handle(self, *args, **options):
+        if options['host']:
+            return self.run(options['host'], options['port'], options['count'])
+        with SMTPSink() as sink:
+            self.run('127.0.0.1', sink.port, options['count'])
+            self.stdout.write(f'SMTP sink received {len(sink.messages)} messages over {sink.connections} connections')
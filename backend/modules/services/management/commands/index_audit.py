@@ -0,0 +1,115 @@
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from django.db import connections, models
+from taggit.models import Tag
+
+from modules.blog.models import Article
+from modules.services.index_audit import (AUDIT_QUERIES, INDEX_SCAN_NODES, explain_queryset, find_covering_index,
+                                          get_project_tables, get_table_rows, get_unused_indexes, walk_plan)
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Команда для проверки индексов: EXPLAIN канонических запросов менеджеров, представлений и тегов шаблонов,
+    последовательные сканирования больших таблиц, неиспользуемые индексы и недостающие составные индексы.
+    Имеет смысл на реальных данных или данных seed_dataset (PostgreSQL)
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--only', default='', help='Имена запросов через запятую')
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Последовательное сканирование таблицы меньшего размера не считается проблемой')
+        parser.add_argument('--no-analyze', action='store_true', help='Только план без выполнения запросов')
+        parser.add_argument('--sql', action='store_true',
+                            help='Вывести CREATE INDEX CONCURRENTLY для предложенных индексов')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if connections[using].vendor != 'postgresql':
+            raise CommandError('Index audit requires PostgreSQL')
+        names = [name for name in options['only'].split(',') if name] or list(AUDIT_QUERIES)
+        unknown = set(names) - set(AUDIT_QUERIES)
+        if unknown:
+            raise CommandError(f'Unknown queries: {", ".join(sorted(unknown))}')
+
+        context = self.get_context(using)
+        tables = get_project_tables()
+        table_rows = get_table_rows(using, tables | {Tag._meta.db_table})
+        used_indexes = set()
+        proposals = {}
+
+        for name in names:
+            build, index = AUDIT_QUERIES[name]
+            queryset = build(context)
+            plan, execution_time = explain_queryset(queryset, analyze=not options['no_analyze'])
+            nodes = list(walk_plan(plan))
+            timing = f', {execution_time:.2f}ms' if execution_time is not None else ''
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name} (cost {plan["Total Cost"]}{timing})'))
+
+            for node in nodes:
+                if node['Node Type'] in INDEX_SCAN_NODES:
+                    used_indexes.add(node['Index Name'])
+                    self.stdout.write(f'  {node["Node Type"]} using {node["Index Name"]}')
+                elif node['Node Type'] == 'Seq Scan':
+                    rows = table_rows.get(node['Relation Name'], 0)
+                    message = f'  Seq Scan on {node["Relation Name"]} (~{rows} rows)'
+                    if node.get('Filter'):
+                        message += f' filter {node["Filter"]}'
+                    self.stdout.write(self.style.WARNING(message) if rows >= options['min_rows'] else message)
+
+            if index:
+                model = apps.get_model(index[0])
+                covering = find_covering_index(queryset.db, model, index[1])
+                if covering:
+                    self.stdout.write(f'  Expected index {index[1]} covered by {covering}')
+                else:
+                    self.stdout.write(self.style.ERROR(f'  Missing index {model.__name__}{index[1]}'))
+                    proposals.setdefault(model, []).append(tuple(index[1]))
+
+        self.report_unused_indexes(using, tables, used_indexes)
+        self.report_proposals(using, proposals, options['sql'])
+
+    def get_context(self, using):
+        """
+        Объекты для запросов: статья с тегами и пользователь с подписками
+        """
+        article = (Article.objects.using(using).filter(status='published', tags__isnull=False)
+                   .select_related('author', 'category').first())
+        user = (User.objects.using(using).filter(profile__following__isnull=False).select_related('profile').first())
+        if article is None or user is None:
+            raise CommandError('Not enough data for audit, run seed_dataset first')
+        return {'article': article, 'user': user, 'tag': article.tags.first()}
+
+    def report_unused_indexes(self, using, tables, used_indexes):
+        self.stdout.write(self.style.MIGRATE_HEADING('Unused indexes (pg_stat_user_indexes.idx_scan = 0)'))
+        unused = get_unused_indexes(using, tables)
+        for table, index_name, size in unused:
+            audited = ' (used by audited queries)' if index_name in used_indexes else ''
+            self.stdout.write(f'  {table}.{index_name}: {size // 1024} kB{audited}')
+        if not unused:
+            self.stdout.write('  None')
+
+    def report_proposals(self, using, proposals, sql):
+        """
+        Предложенные индексы в виде строк Meta.indexes (миграция создается командой makemigrations)
+        """
+        if not proposals:
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING('Proposed Meta.indexes (then run makemigrations)'))
+        statements = []
+        with connections[using].schema_editor(collect_sql=True, atomic=False) as schema_editor:
+            for model, field_sets in proposals.items():
+                self.stdout.write(f'  {model._meta.label}:')
+                for fields in dict.fromkeys(field_sets):
+                    index = models.Index(fields=list(fields))
+                    index.set_name_with_model(model)
+                    self.stdout.write(f'    models.Index(fields={list(fields)}, name={index.name!r}),')
+                    statements.append(f'{index.create_sql(model, schema_editor, concurrently=True)};')
+        if sql:
+            self.stdout.write(self.style.MIGRATE_HEADING('SQL'))
+            for statement in statements:
+                self.stdout.write(f'  {statement}')
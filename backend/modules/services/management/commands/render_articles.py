@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+
+from modules.blog.models import Article
+from modules.services.richtext import render_article_body
+
+
+class Command(BaseCommand):
+    """
+    Команда для пре-рендера полного описания статей (обработанный HTML и выдержка)
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Обработать все статьи, а не только необработанные')
+
+    def handle(self, *args, **options):
+        queryset = Article.objects.get_queryset()
+        if not options['all']:
+            queryset = queryset.filter(full_description_html='')
+
+        count = 0
+        for pk, source in queryset.values_list('pk', 'full_description').iterator():
+            full_description_html, excerpt = render_article_body(source)
+            Article.objects.filter(pk=pk).update(full_description_html=full_description_html, excerpt=excerpt)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Rendered {count} articles'))
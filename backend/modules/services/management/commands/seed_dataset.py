@@ -0,0 +1,221 @@
+import random
+import secrets
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from taggit.models import Tag, TaggedItem
+
+from modules.blog.models import Article, Category, Comment, Rating, ViewCount
+from modules.system.models import Profile
+
+User = get_user_model()
+
+# Префикс всех сгенерированных записей: по нему работает --flush
+SEED_PREFIX = 'seed'
+
+WORDS = (
+    'django', 'python', 'запрос', 'индекс', 'кэш', 'шаблон', 'модель', 'сервер', 'база', 'данные', 'очередь',
+    'задача', 'профиль', 'статья', 'категория', 'дерево', 'поиск', 'страница', 'выборка', 'реплика', 'пул',
+    'соединение', 'миграция', 'сигнал', 'менеджер', 'поле', 'форма', 'представление', 'маршрут', 'тест',
+)
+
+
+@contextmanager
+def disable_auto_now(*models):
+    """
+    Временное отключение auto_now/auto_now_add, чтобы сохранить сгенерированные даты при bulk_create
+    """
+    fields = [field for model in models for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    flags = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in flags:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def flush_dataset():
+    """
+    Удаление сгенерированных данных (статьи удаляются до пользователей: автор статьи SET_DEFAULT)
+    """
+    articles = Article.objects.filter(slug__startswith=f'{SEED_PREFIX}-')
+    TaggedItem.objects.filter(content_type=ContentType.objects.get_for_model(Article),
+                              object_id__in=articles.values('pk')).delete()
+    deleted, _ = articles.delete()
+    deleted += User.objects.filter(username__startswith=f'{SEED_PREFIX}_').delete()[0]
+    deleted += Category.objects.filter(slug__startswith=f'{SEED_PREFIX}-').delete()[0]
+    deleted += Tag.objects.filter(slug__startswith=f'{SEED_PREFIX}-').delete()[0]
+    return deleted
+
+
+class Command(BaseCommand):
+    """
+    Команда для заполнения базы синтетическими данными заданного объема (bulk_create, без сигналов моделей)
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--follows', type=int, default=10, help='Подписок на одного пользователя')
+        parser.add_argument('--categories', type=int, default=3, help='Дочерних категорий на каждом уровне')
+        parser.add_argument('--category-depth', type=int, default=4, help='Глубина дерева категорий')
+        parser.add_argument('--tags', type=int, default=100)
+        parser.add_argument('--articles', type=int, default=500)
+        parser.add_argument('--tags-per-article', type=int, default=4)
+        parser.add_argument('--comments', type=int, default=5, help='Комментариев на статью')
+        parser.add_argument('--comment-depth', type=int, default=4, help='Максимальная вложенность комментариев')
+        parser.add_argument('--ratings', type=int, default=10, help='Оценок на статью')
+        parser.add_argument('--views', type=int, default=20, help='Просмотров на статью')
+        parser.add_argument('--days', type=int, default=90, help='Период, на который распределяются даты записей')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=None, help='Начальное значение генератора случайных чисел')
+        parser.add_argument('--flush', action='store_true', help='Удалить ранее сгенерированные данные')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.days = options['days']
+        # Уникальная метка запуска: повторное заполнение не конфликтует с уникальными полями
+        self.token = secrets.token_hex(3)
+
+        if options['flush']:
+            self.stdout.write(f'Previous dataset removed ({flush_dataset()} objects)')
+
+        with transaction.atomic(), disable_auto_now(Article, Comment, Rating, ViewCount):
+            users = self.create_users(options['users'])
+            profiles = self.create_profiles(users, options['follows'])
+            categories = self.create_categories(options['categories'], options['category_depth'])
+            tags = self.create_tags(options['tags'])
+            articles = self.create_articles(options['articles'], users, categories)
+            self.create_tagged_items(articles, tags, options['tags_per_article'])
+            self.create_comments(articles, users, options['comments'], options['comment_depth'])
+            self.create_ratings(articles, users, options['ratings'])
+            self.create_views(articles, options['views'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Dataset {self.token} created: {len(users)} users, {len(profiles)} profiles, '
+            f'{len(categories)} categories, {len(tags)} tags, {len(articles)} articles'))
+
+    def random_date(self):
+        return self.now - timedelta(seconds=self.random.randint(0, self.days * 86400))
+
+    def ip_address(self, network, number):
+        return f'{network}.{number // 65536 % 256}.{number // 256 % 256}.{number % 256}'
+
+    def text(self, words):
+        return ' '.join(self.random.choice(WORDS) for _ in range(words))
+
+    def create_users(self, count):
+        # Один хеш на всех пользователей: хеширование пароля - самая медленная часть создания
+        password = make_password(f'{SEED_PREFIX}-password')
+        users = [User(username=f'{SEED_PREFIX}_{self.token}_{number}', email=f'{SEED_PREFIX}{number}@example.com',
+                      password=password, date_joined=self.random_date()) for number in range(count)]
+        return User.objects.bulk_create(users, batch_size=self.batch_size)
+
+    def create_profiles(self, users, follows):
+        profiles = Profile.objects.bulk_create(
+            [Profile(user=user, slug=user.username.replace('_', '-')) for user in users], batch_size=self.batch_size)
+        through = Profile.following.through
+        links = []
+        for profile in profiles:
+            for followed in self.random.sample(profiles, min(follows, len(profiles) - 1)):
+                if followed.pk != profile.pk:
+                    links.append(through(from_profile_id=profile.pk, to_profile_id=followed.pk))
+        through.objects.bulk_create(links, batch_size=self.batch_size, ignore_conflicts=True)
+        return profiles
+
+    def create_categories(self, children, depth):
+        """
+        Дерево категорий создается по уровням, поля MPTT заполняются одним перестроением
+        """
+        categories, parents = [], [None]
+        for level in range(depth):
+            level_categories = [
+                Category(title=f'{self.text(2)} {level}.{number}', slug=f'{SEED_PREFIX}-{self.token}-{level}-{number}',
+                         description=self.text(10), parent=parent, lft=0, rght=0, tree_id=0, level=0)
+                for number, parent in enumerate(parent for parent in parents for _ in range(children))
+            ]
+            parents = Category.objects.bulk_create(level_categories, batch_size=self.batch_size)
+            categories.extend(parents)
+        Category.objects.rebuild()
+        return categories
+
+    def create_tags(self, count):
+        tags = [Tag(name=f'{SEED_PREFIX} {self.token} {number}', slug=f'{SEED_PREFIX}-{self.token}-{number}')
+                for number in range(count)]
+        return Tag.objects.bulk_create(tags, batch_size=self.batch_size)
+
+    def create_articles(self, count, users, categories):
+        articles = []
+        for number in range(count):
+            time_create = self.random_date()
+            articles.append(Article(
+                title=self.text(5).capitalize(),
+                slug=f'{SEED_PREFIX}-{self.token}-{number}',
+                short_description=f'<p>{self.text(30)}</p>',
+                full_description=''.join(f'<p>{self.text(60)}</p>' for _ in range(5)),
+                status='published' if self.random.random() < 0.9 else 'draft',
+                fixed=self.random.random() < 0.01,
+                author=self.random.choice(users),
+                category=self.random.choice(categories),
+                time_create=time_create,
+                time_update=time_create,
+                # Сгенерированные статьи не должны попасть в рассылку подписчикам
+                followers_notified_at=time_create,
+            ))
+        return Article.objects.bulk_create(articles, batch_size=self.batch_size)
+
+    def create_tagged_items(self, articles, tags, per_article):
+        content_type = ContentType.objects.get_for_model(Article)
+        items = [TaggedItem(content_type=content_type, object_id=article.pk, tag=tag)
+                 for article in articles for tag in self.random.sample(tags, min(per_article, len(tags)))]
+        TaggedItem.objects.bulk_create(items, batch_size=self.batch_size)
+
+    def create_comments(self, articles, users, per_article, max_depth):
+        """
+        Вложенные комментарии: уровни создаются по очереди, чтобы у родителей уже были первичные ключи
+        """
+        levels = [[] for _ in range(max_depth + 1)]
+        for article in articles:
+            planned = []
+            for _ in range(per_article):
+                candidates = [item for item in planned if item[1] < max_depth]
+                parent = self.random.choice(candidates) if candidates and self.random.random() < 0.6 else None
+                comment = Comment(article=article, author=self.random.choice(users), content=self.text(20),
+                                  time_create=self.random_date(), lft=0, rght=0, tree_id=0, level=0)
+                comment.time_update = comment.time_create
+                item = (comment, parent[1] + 1 if parent else 0, parent[0] if parent else None)
+                planned.append(item)
+                levels[item[1]].append(item)
+        for level in levels:
+            for comment, _, parent in level:
+                comment.parent_id = parent.pk if parent else None
+            Comment.objects.bulk_create([comment for comment, _, _ in level], batch_size=self.batch_size)
+        Comment.objects.rebuild()
+
+    def create_ratings(self, articles, users, per_article):
+        ratings = [
+            Rating(article=article, user=self.random.choice(users), value=self.random.choice((1, 1, 1, -1)),
+                   ip_address=self.ip_address(10, number),
+                   time_create=self.random_date())
+            for article in articles for number in range(per_article)
+        ]
+        Rating.objects.bulk_create(ratings, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def create_views(self, articles, per_article):
+        views = []
+        for article in articles:
+            views.extend(ViewCount(article=article, ip_address=self.ip_address(172, number),
+                                   viewed_on=self.random_date()) for number in range(per_article))
+            if len(views) >= self.batch_size:
+                ViewCount.objects.bulk_create(views, batch_size=self.batch_size)
+                views = []
+        ViewCount.objects.bulk_create(views, batch_size=self.batch_size)
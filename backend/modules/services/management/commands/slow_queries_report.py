@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from modules.services.slow_queries import read_slow_queries
+
+
+class Command(BaseCommand):
+    """
+    Команда для отчета по журналу медленных запросов: отпечатки SQL с наибольшим суммарным временем
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Количество отпечатков в отчете')
+        parser.add_argument('--hours', type=float, default=None, help='Только записи за последние N часов')
+        parser.add_argument('--source', default=None, help='Только запросы указанного представления')
+        parser.add_argument('--explain', action='store_true', help='Показать последний план EXPLAIN отпечатка')
+        parser.add_argument('--log', default=None, help='Файл журнала (по умолчанию SLOW_QUERY_LOG)')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options['hours']) if options['hours'] else None
+        fingerprints = {}
+        for record in read_slow_queries(options['log'] or settings.SLOW_QUERY_LOG):
+            if since and datetime.fromisoformat(record['time']) < since:
+                continue
+            if options['source'] and record['source'] != options['source']:
+                continue
+            stats = fingerprints.setdefault(record['fingerprint'], {
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'sources': set(), 'explain': None,
+            })
+            stats['count'] += 1
+            stats['total_ms'] += record['duration_ms']
+            stats['max_ms'] = max(stats['max_ms'], record['duration_ms'])
+            stats['sources'].add(record['source'])
+            stats['explain'] = record.get('explain') or stats['explain']
+
+        if not fingerprints:
+            self.stdout.write('No slow queries found')
+            return
+
+        top = sorted(fingerprints.items(), key=lambda item: item[1]['total_ms'], reverse=True)[:options['top']]
+        for number, (fingerprint, stats) in enumerate(top, 1):
+            self.stdout.write(self.style.WARNING(
+                f'{number}. total {stats["total_ms"]:.0f}ms, {stats["count"]} calls, '
+                f'mean {stats["total_ms"] / stats["count"]:.1f}ms, max {stats["max_ms"]:.1f}ms'))
+            self.stdout.write(f'   views: {", ".join(sorted(stats["sources"]))}')
+            self.stdout.write(f'   {fingerprint}')
+            if options['explain'] and stats['explain']:
+                self.stdout.write('   ' + stats['explain'].replace('\n', '\n   '))
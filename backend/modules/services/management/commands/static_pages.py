@@ -0,0 +1,28 @@
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from modules.services.static_pages import get_all_pages, publish_pages, remove_stale_pages
+
+
+class Command(BaseCommand):
+    """
+    Команда для предварительной отрисовки всех страниц для анонимных посетителей (STATIC_PAGES_ROOT)
+    или удаления отрисованных страниц при отключении режима
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Удалить все отрисованные страницы')
+
+    def handle(self, *args, **options):
+        root = Path(settings.STATIC_PAGES_ROOT)
+        if options['clear']:
+            shutil.rmtree(root, ignore_errors=True)
+            self.stdout.write(f'Removed {root}')
+            return
+        pages = get_all_pages()
+        removed = remove_stale_pages(pages)
+        written = publish_pages(pages)
+        self.stdout.write(f'Rendered {written} of {len(pages)} pages to {root}, removed {removed} stale pages')
@@ -0,0 +1,339 @@
+import atexit
+import fcntl
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Все метрики процесса: имя -> метрика
+REGISTRY = {}
+
+# Границы интервалов гистограмм по умолчанию (секунды)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TASK_DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+# Общий файл метрик завершенных процессов: счетчики не уменьшаются после перезапуска воркеров
+RETIRED_SNAPSHOT = 'retired.json'
+
+_lock = threading.Lock()
+_last_flush = 0.0
+# Метрики процесса перенесены в RETIRED_SNAPSHOT: повторное сохранение удвоило бы значения
+_retired = False
+
+# Метрики текущего запроса: заполняются обертками базы, кэша и шаблонов
+_request_metrics = ContextVar('request_metrics', default=None)
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metric:
+    """
+    Базовая метрика в формате Prometheus: значения хранятся по кортежу меток
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        REGISTRY[name] = self
+
+    def get_key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def format_labels(self, key, **extra):
+        pairs = [*zip(self.labelnames, key), *extra.items()]
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for name, value in pairs) + '}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.get_key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(first, second):
+        return first + second
+
+    def expose(self, values):
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{self.format_labels(key)} {value}'
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.get_key(labels)
+        with _lock:
+            # Количество наблюдений по интервалам (последний - выше всех границ), сумма и общее количество
+            state = self.values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            index = next((number for number, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @staticmethod
+    def merge(first, second):
+        return [[a + b for a, b in zip(first[0], second[0])], first[1] + second[1], first[2] + second[2]]
+
+    def expose(self, values):
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{self.format_labels(key, le=bound)} {cumulative}'
+            yield f'{self.name}_sum{self.format_labels(key)} {total}'
+            yield f'{self.name}_count{self.format_labels(key)} {count}'
+
+
+def get_snapshot():
+    with _lock:
+        return {name: [[list(key), value] for key, value in metric.values.items()]
+                for name, metric in REGISTRY.items()}
+
+
+def get_snapshot_name(pid=None):
+    # Имя узла: процессы разных контейнеров с общим каталогом могут иметь одинаковый pid
+    return f'{socket.gethostname()}-{pid or os.getpid()}.json'
+
+
+def read_snapshot(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(directory, name, snapshot):
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(descriptor, 'w') as file:
+        json.dump(snapshot, file)
+    os.replace(temporary, os.path.join(directory, name))
+
+
+@contextmanager
+def snapshots_lock(directory, shared=False):
+    """
+    Блокировка каталога METRICS_DIR между процессами: перенос метрик в RETIRED_SNAPSHOT не виден читателям частично
+    """
+    with open(os.path.join(directory, '.lock'), 'a') as file:
+        fcntl.flock(file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+
+
+def merge_snapshots(snapshots):
+    """
+    Объединение сохраненных метрик процессов: имя метрики -> {метки: значение}
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for name, items in snapshot.items():
+            metric = REGISTRY.get(name)
+            if metric is None:
+                continue
+            values = merged.setdefault(name, {})
+            for key, value in items:
+                key = tuple(key)
+                values[key] = metric.merge(values[key], value) if key in values else value
+    return merged
+
+
+def flush_metrics(force=False):
+    """
+    Сохранение метрик процесса в METRICS_DIR (не чаще METRICS_FLUSH_INTERVAL секунд)
+    для объединения метрик всех процессов gunicorn и celery
+    """
+    global _last_flush
+    directory = settings.METRICS_DIR
+    if not directory or _retired or (not force and time.monotonic() - _last_flush < settings.METRICS_FLUSH_INTERVAL):
+        return
+    _last_flush = time.monotonic()
+    os.makedirs(directory, exist_ok=True)
+    write_snapshot(directory, get_snapshot_name(), get_snapshot())
+
+
+def retire_snapshot(name, snapshot=None):
+    """
+    Перенос метрик завершенного процесса из его файла (или переданных значений) в RETIRED_SNAPSHOT и удаление файла
+    """
+    directory = settings.METRICS_DIR
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with snapshots_lock(directory):
+        if snapshot is None:
+            snapshot = read_snapshot(path)
+        if snapshot and any(snapshot.values()):
+            retired = read_snapshot(os.path.join(directory, RETIRED_SNAPSHOT)) or {}
+            merged = merge_snapshots([retired, snapshot])
+            write_snapshot(directory, RETIRED_SNAPSHOT, {
+                name: [[list(key), value] for key, value in values.items()] for name, values in merged.items()
+            })
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def retire_metrics():
+    """
+    Завершение процесса (atexit, остановка процесса воркера celery): метрики переносятся в RETIRED_SNAPSHOT
+    """
+    global _retired
+    if _retired:
+        return
+    _retired = True
+    retire_snapshot(get_snapshot_name(), get_snapshot())
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def prune_snapshots(directory):
+    """
+    Перенос в RETIRED_SNAPSHOT файлов процессов, завершившихся без atexit (SIGKILL, падение контейнера):
+    процессы этого узла проверяются по pid, файлы других узлов - по возрасту METRICS_SNAPSHOT_MAX_AGE
+    """
+    hostname = socket.gethostname()
+    for name in os.listdir(directory):
+        if not name.endswith('.json') or name == RETIRED_SNAPSHOT:
+            continue
+        host, _, pid = name[:-len('.json')].rpartition('-')
+        if host == hostname and pid.isdigit():
+            stale = not is_process_alive(int(pid))
+        else:
+            try:
+                age = time.time() - os.path.getmtime(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue
+            stale = age > settings.METRICS_SNAPSHOT_MAX_AGE
+        if stale:
+            retire_snapshot(name)
+
+
+def collect_metrics():
+    """
+    Значения метрик текущего процесса, объединенные с сохраненными метриками остальных и завершенных процессов
+    """
+    snapshots = [get_snapshot()]
+    directory = settings.METRICS_DIR
+    if directory and os.path.isdir(directory):
+        prune_snapshots(directory)
+        own_file = get_snapshot_name()
+        with snapshots_lock(directory, shared=True):
+            for name in os.listdir(directory):
+                if name.endswith('.json') and name != own_file:
+                    snapshot = read_snapshot(os.path.join(directory, name))
+                    if snapshot is not None:
+                        snapshots.append(snapshot)
+    return merge_snapshots(snapshots)
+
+
+def render_metrics():
+    """
+    Метрики всех процессов в текстовом формате Prometheus
+    """
+    lines = []
+    for name, values in sorted(collect_metrics().items()):
+        metric = REGISTRY[name]
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        lines.extend(metric.expose(values))
+    return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """
+    Показатели одного запроса: SQL запросы, обращения к кэшу и рендер шаблонов
+    """
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Обертка выполнения SQL запросов (connection.execute_wrapper)
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def get_server_timing(self, total):
+        """
+        Значение заголовка Server-Timing (длительности в миллисекундах)
+        """
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+
+def start_request_metrics():
+    metrics = RequestMetrics()
+    return metrics, _request_metrics.set(metrics)
+
+
+def finish_request_metrics(token):
+    _request_metrics.reset(token)
+
+
+def get_request_metrics():
+    return _request_metrics.get()
+
+
+http_requests = Counter('django_http_requests_total', 'Количество запросов', ('route', 'method', 'status'))
+http_request_duration = Histogram('django_http_request_duration_seconds', 'Время обработки запроса',
+                                  ('route', 'method'))
+http_db_queries = Histogram('django_http_db_queries', 'Количество SQL запросов на запрос', ('route',),
+                            buckets=QUERY_COUNT_BUCKETS)
+http_db_duration = Histogram('django_http_db_duration_seconds', 'Время SQL запросов на запрос', ('route',))
+http_template_duration = Histogram('django_http_template_render_seconds', 'Время рендера шаблона', ('route',))
+cache_operations = Counter('django_cache_operations_total', 'Обращения к кэшу', ('result',))
+visitor_requests = Counter('django_visitor_requests_total', 'Классифицированные запросы по классу посетителя',
+                           ('visitor_class',))
+
+celery_tasks = Counter('celery_tasks_total', 'Количество выполненных задач', ('task', 'state'))
+celery_task_queue_wait = Histogram('celery_task_queue_wait_seconds', 'Время от постановки задачи в очередь до запуска',
+                                   ('task',), buckets=TASK_DURATION_BUCKETS)
+celery_task_runtime = Histogram('celery_task_runtime_seconds', 'Время выполнения задачи', ('task',),
+                                buckets=TASK_DURATION_BUCKETS)
+
+atexit.register(retire_metrics)
@@ -7,6 +7,12 @@ from django.shortcuts import redirect
 
 class AuthorRequiredMixin(AccessMixin):
 
+    def get_object(self, queryset=None):
+        # Объект уже загружен при проверке автора в dispatch, повторный запрос не нужен
+        if queryset is not None or not hasattr(self, '_author_checked_object'):
+            self._author_checked_object = super().get_object(queryset)
+        return self._author_checked_object
+
     def dispatch(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return self.handle_no_permission()
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+def get_estimated_count(model, using='default'):
+    """
+    Оценка количества строк таблицы по статистике PostgreSQL (pg_class.reltuples), для секционированной
+    таблицы - сумма по секциям (autovacuum анализирует только секции). None для других СУБД и таблиц без статистики
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT SUM(GREATEST(reltuples, 0)), MAX(reltuples) FROM pg_class
+            WHERE relkind <> 'p' AND (oid = to_regclass(%s)
+                OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s)))
+        """, [model._meta.db_table] * 2)
+        estimate, analyzed = cursor.fetchone()
+    # reltuples = -1: таблица еще не анализировалась
+    if analyzed is None or analyzed < 0:
+        return None
+    return int(estimate)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц: без фильтров количество строк выше порога берется из статистики,
+    с фильтрами считается не больше порога строк (дальние страницы недоступны).
+    Порог - threshold или ESTIMATED_COUNT_THRESHOLD, если threshold не задан
+    """
+    threshold = None
+    # Количество строк взято из статистики и может отличаться от точного
+    estimated = False
+
+    def get_threshold(self):
+        return settings.ESTIMATED_COUNT_THRESHOLD if self.threshold is None else self.threshold
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet) or queryset.query.distinct:
+            return super().count
+        threshold = self.get_threshold()
+        if not queryset.query.has_filters():
+            estimate = get_estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= threshold:
+                self.estimated = True
+                return estimate
+        return queryset.order_by()[:threshold].count()
+
+    def page(self, number):
+        """
+        Статистика отстает от таблицы: если страница в пределах оценки оказалась пустой или номер больше оценки,
+        количество строк считается точно, а номер после последней страницы заменяется последней страницей
+        (ссылки на страницы построены по оценке, ошибка на них сбросила бы список админ-панели на первую страницу)
+        """
+        page = None
+        try:
+            page = super().page(number)
+        except EmptyPage:
+            if not self.estimated or int(number) < 1:
+                raise
+        if page is not None and (not self.estimated or page.object_list):
+            return page
+        self.count = self.object_list.order_by().count()
+        self.estimated = False
+        self.__dict__.pop('num_pages', None)
+        return super().page(min(int(number), self.num_pages))
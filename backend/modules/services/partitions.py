@@ -0,0 +1,129 @@
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+# Месячные секции таблицы: <таблица>_pГГГГ_ММ, строки вне секций попадают в <таблица>_default
+PARTITION_SUFFIX = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+def get_month_start(value=None, months=0):
+    """
+    Начало месяца (UTC) со сдвигом на months месяцев
+    """
+    value = (value or timezone.now()).astimezone(dt_timezone.utc)
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def get_partition_name(table, month):
+    return f'{table}_p{month:%Y_%m}'
+
+
+def is_partitioned(table, using=connection):
+    if using.vendor != 'postgresql':
+        return False
+    with using.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [table])
+        return cursor.fetchone() is not None
+
+
+def get_partitions(table, using=connection):
+    """
+    Месячные секции таблицы: начало месяца -> имя секции
+    """
+    with using.cursor() as cursor:
+        cursor.execute("""
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s)
+        """, [table])
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = PARTITION_SUFFIX.search(name)
+        if match:
+            partitions[datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)] = name
+    return partitions
+
+
+def create_partition(table, column, month, using=connection):
+    """
+    Создание секции месяца. Строки этого месяца, попавшие в секцию по умолчанию, переносятся в новую секцию,
+    иначе присоединение секции завершится ошибкой
+    """
+    quote = using.ops.quote_name
+    name = get_partition_name(table, month)
+    default = f'{table}_default'
+    with transaction.atomic(using=using.alias), using.cursor() as cursor:
+        # Порядок столбцов секции по умолчанию может отличаться от родительской таблицы: столбцы перечисляются явно
+        columns = ', '.join(quote(info.name) for info in using.introspection.get_table_description(cursor, table))
+        cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {quote(default)} WHERE {quote(column)} >= %s AND {quote(column)} < %s '
+            f'RETURNING {columns}) INSERT INTO {quote(name)} ({columns}) SELECT {columns} FROM moved',
+            [month, get_month_start(month, 1)])
+        cursor.execute(f'ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)',
+                       [month, get_month_start(month, 1)])
+    return name
+
+
+def ensure_partitions(table, column, months_ahead, using=connection):
+    """
+    Секции текущего месяца и months_ahead следующих месяцев
+    """
+    existing = get_partitions(table, using)
+    created = []
+    for offset in range(months_ahead + 1):
+        month = get_month_start(months=offset)
+        if month not in existing:
+            created.append(create_partition(table, column, month, using))
+    return created
+
+
+def rollup_views(start, end):
+    """
+    Добавление просмотров периода к помесячным итогам статей. Вызывается в транзакции удаления просмотров
+    """
+    from modules.blog.models import ArticleViewRollup, ViewCount
+
+    month = get_month_start(start).date()
+    counts = list(ViewCount.objects.filter(viewed_on__gte=start, viewed_on__lt=end).order_by()
+                  .values_list('article').annotate(count=Count('id')))
+    existing = dict(ArticleViewRollup.objects.filter(month=month).values_list('article', 'views'))
+    rollups = [ArticleViewRollup(article_id=article_id, month=month, views=existing.get(article_id, 0) + count)
+               for article_id, count in counts]
+    ArticleViewRollup.objects.bulk_create(rollups, batch_size=1000, update_conflicts=True,
+                                          unique_fields=['article', 'month'], update_fields=['views'])
+    return sum(count for _, count in counts)
+
+
+def expire_views(retention_months):
+    """
+    Просмотры старше retention_months месяцев переносятся в помесячные итоги: секции PostgreSQL удаляются целиком,
+    остальные строки (секция по умолчанию, другие СУБД) - по месяцам
+    """
+    from modules.blog.models import ViewCount
+
+    table = ViewCount._meta.db_table
+    cutoff = get_month_start(months=-retention_months)
+    expired = 0
+    if is_partitioned(table):
+        for month, name in sorted(get_partitions(table).items()):
+            if month >= cutoff:
+                continue
+            with transaction.atomic():
+                expired += rollup_views(month, get_month_start(month, 1))
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP TABLE {connection.ops.quote_name(name)}')
+
+    oldest = ViewCount.objects.filter(viewed_on__lt=cutoff).order_by('viewed_on').values_list('viewed_on', flat=True)
+    while (first := oldest.first()) is not None:
+        month = get_month_start(first)
+        end = min(get_month_start(month, 1), cutoff)
+        with transaction.atomic():
+            expired += rollup_views(month, end)
+            ViewCount.objects.filter(viewed_on__gte=month, viewed_on__lt=end).delete()
+    return expired
@@ -0,0 +1,129 @@
+import html
+import re
+from html.parser import HTMLParser
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+from PIL import Image
+
+from .images import get_or_generate_image_variants
+
+
+class ArticleHtmlProcessor(HTMLParser):
+    """
+    Однократная обработка HTML из CKEditor при сохранении статьи:
+    ленивая загрузка изображений, их собственные размеры и уменьшенные варианты для больших изображений.
+    Остальная разметка переносится без изменений
+    """
+
+    def __init__(self, storage=None, max_width=None, widths=None, sizes=None):
+        super().__init__(convert_charrefs=False)
+        self.storage = storage or default_storage
+        self.max_width = max_width or settings.ARTICLE_IMAGE_MAX_WIDTH
+        self.widths = widths or settings.ARTICLE_IMAGE_VARIANT_WIDTHS
+        self.sizes = sizes or settings.ARTICLE_IMAGE_SIZES
+        self.output = []
+
+    def process(self, content):
+        self.output = []
+        self.feed(content)
+        self.close()
+        return ''.join(self.output)
+
+    def get_storage_name(self, src):
+        """
+        Имя файла в медиа хранилище по адресу изображения (None для внешних изображений)
+        """
+        if not src or not src.startswith(settings.MEDIA_URL):
+            return None
+        name = unquote(src[len(settings.MEDIA_URL):].split('?')[0])
+        return name if self.storage.exists(name) else None
+
+    def render_tag(self, tag, attrs, self_closing=False):
+        rendered = ''.join(f' {key}' if value is None else f' {key}="{html.escape(value)}"' for key, value in attrs)
+        return f'<{tag}{rendered}{" /" if self_closing else ""}>'
+
+    def process_image(self, attrs):
+        attrs = dict(attrs)
+        attrs.setdefault('loading', 'lazy')
+        attrs.setdefault('decoding', 'async')
+
+        name = self.get_storage_name(attrs.get('src'))
+        if name is None:
+            return self.render_tag('img', attrs.items())
+
+        try:
+            with self.storage.open(name, 'rb') as file:
+                width, height = Image.open(file).size
+        except (OSError, Image.DecompressionBombError):
+            return self.render_tag('img', attrs.items())
+
+        if width <= self.max_width:
+            attrs.setdefault('width', str(width))
+            attrs.setdefault('height', str(height))
+            return self.render_tag('img', attrs.items())
+
+        manifest = get_or_generate_image_variants(self.storage, name, self.widths)
+        variants = manifest.get('variants')
+        if not variants:
+            return self.render_tag('img', attrs.items())
+
+        # Большое изображение заменяется набором уменьшенных вариантов (WebP + JPEG)
+        fallback = variants[-1]
+        attrs.update({
+            'src': self.storage.url(fallback['jpeg']),
+            'srcset': ', '.join(f'{self.storage.url(item["jpeg"])} {item["width"]}w' for item in variants),
+            'sizes': self.sizes,
+            'width': str(fallback['width']),
+            'height': str(fallback['height']),
+        })
+        webp_srcset = ', '.join(f'{self.storage.url(item["webp"])} {item["width"]}w' for item in variants)
+        return (f'<picture><source type="image/webp" srcset="{html.escape(webp_srcset)}" '
+                f'sizes="{html.escape(self.sizes)}">{self.render_tag("img", attrs.items())}</picture>')
+
+    def handle_starttag(self, tag, attrs):
+        self.output.append(self.process_image(attrs) if tag == 'img' else self.get_starttag_text())
+
+    def handle_startendtag(self, tag, attrs):
+        self.output.append(self.process_image(attrs) if tag == 'img' else self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        self.output.append(f'</{tag}>')
+
+    def handle_data(self, data):
+        self.output.append(data)
+
+    def handle_entityref(self, name):
+        self.output.append(f'&{name};')
+
+    def handle_charref(self, name):
+        self.output.append(f'&#{name};')
+
+    def handle_comment(self, data):
+        self.output.append(f'<!--{data}-->')
+
+    def handle_decl(self, decl):
+        self.output.append(f'<!{decl}>')
+
+    def handle_pi(self, data):
+        self.output.append(f'<?{data}>')
+
+
+def make_excerpt(content, words=None):
+    """
+    Текстовая выдержка из HTML описания статьи
+    """
+    # Пробел перед тегами, чтобы текст соседних блоков не склеивался
+    text = strip_tags((content or '').replace('<', ' <'))
+    text = re.sub(r'\s+', ' ', html.unescape(text)).strip()
+    return Truncator(text).words(words or settings.ARTICLE_EXCERPT_WORDS)
+
+
+def render_article_body(content):
+    """
+    Пре-рендер полного описания статьи: обработанный HTML и выдержка
+    """
+    return ArticleHtmlProcessor().process(content or ''), make_excerpt(content)
@@ -0,0 +1,61 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Состояние текущего запроса: закрепление за основной базой и признак записи
+_request_state = ContextVar('database_request_state', default=None)
+
+
+def get_read_database():
+    """
+    База для чтения тяжелых выборок (списки, поиск, ленты, карта сайта, блоки шаблонов):
+    случайная реплика или основная база, если реплик нет или запрос закреплен за ней после записи
+    """
+    state = _request_state.get()
+    if not settings.REPLICA_DATABASES or (state and state['pinned']):
+        return 'default'
+    return random.choice(settings.REPLICA_DATABASES)
+
+
+@contextmanager
+def database_request_state(pinned=False):
+    """
+    Контекст запроса для роутера: хранит закрепление за основной базой и отмечает выполненные записи
+    """
+    state = {'pinned': pinned, 'wrote': False}
+    token = _request_state.set(state)
+    try:
+        yield state
+    finally:
+        _request_state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Роутер основной базы и реплик только для чтения.
+    Реплики используются только явно через get_read_database(), все записи и миграции - в основной базе
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state and state['pinned']:
+            return 'default'
+        # Связанные объекты читаются из той же базы, что и исходный объект
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.REPLICA_DATABASES
@@ -0,0 +1,117 @@
+import json
+import logging
+import random
+import time
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .utils import get_sql_fingerprint
+
+logger = logging.getLogger('slow_queries')
+
+
+def explain_query(connection, sql, params, analyze=False):
+    """
+    План медленного SELECT запроса (только PostgreSQL): оценочный EXPLAIN или EXPLAIN (ANALYZE, BUFFERS),
+    который выполняет запрос еще раз.
+    Запрос выполняется отдельным курсором драйвера в обход оберток Django, ошибка откатывается до точки сохранения,
+    чтобы не прервать транзакцию запроса
+    """
+    explain = 'EXPLAIN (ANALYZE, BUFFERS)' if analyze else 'EXPLAIN'
+    in_transaction = connection.in_atomic_block
+    with connection.connection.cursor() as cursor:
+        if in_transaction:
+            cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            cursor.execute(f'{explain} {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        except Exception as error:
+            if in_transaction:
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            return f'EXPLAIN failed: {error}'
+        if in_transaction:
+            cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+    return plan
+
+
+class SlowQueryLogger:
+    """
+    Обертка выполнения SQL запросов (connection.execute_wrapper): запросы дольше SLOW_QUERY_THRESHOLD_MS
+    записываются в журнал slow_queries строкой JSON, для доли SLOW_QUERY_EXPLAIN_RATE из них добавляется план.
+    EXPLAIN ANALYZE запроса из представления выполняется задачей Celery после ответа, в задачах Celery - сразу
+    """
+
+    def __init__(self, source):
+        # Источник запросов: запрос Django (имя представления определяется при записи) или имя задачи
+        self.source = source
+        self.in_request = not isinstance(source, str)
+
+    def get_source_name(self):
+        match = getattr(self.source, 'resolver_match', None)
+        if match is not None:
+            return match.view_name or match.route
+        return self.source if isinstance(self.source, str) else 'unmatched'
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - started) * 1000
+        if duration >= settings.SLOW_QUERY_THRESHOLD_MS:
+            self.log(sql, params, many, context['connection'], duration)
+        return result
+
+    def log(self, sql, params, many, connection, duration):
+        record = {
+            'time': timezone.now().isoformat(),
+            'source': self.get_source_name(),
+            'database': connection.alias,
+            'duration_ms': round(duration, 2),
+            'fingerprint': get_sql_fingerprint(sql),
+            'sql': sql,
+        }
+        if (connection.vendor == 'postgresql' and not many and sql.lstrip()[:6].upper() == 'SELECT'
+                and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE):
+            analyze = settings.SLOW_QUERY_EXPLAIN_ANALYZE
+            if analyze and self.in_request:
+                # Параметры подставляются в SQL на стороне клиента (без обращения к базе): задаче передается строка
+                composed = connection.ops.compose_sql(sql, params)
+                transaction.on_commit(partial(explain_later, record, composed), using=connection.alias)
+                return
+            record['explain'] = explain_query(connection, sql, params, analyze=analyze)
+        logger.warning(json.dumps(record, ensure_ascii=False))
+
+
+def explain_later(record, sql):
+    from .tasks import explain_slow_query_task
+
+    explain_slow_query_task.delay(record, sql)
+
+
+def log_explained_query(record, sql):
+    """
+    Запись журнала медленного запроса с планом EXPLAIN ANALYZE (sql с подставленными параметрами)
+    """
+    connection = connections[record['database']]
+    connection.ensure_connection()
+    record = dict(record, explain=explain_query(connection, sql, None, analyze=True))
+    logger.warning(json.dumps(record, ensure_ascii=False))
+
+
+def read_slow_queries(path):
+    """
+    Записи журнала медленных запросов, включая ротированные файлы (path.1, path.2, ...)
+    """
+    paths = [path, *(f'{path}.{number}' for number in range(1, settings.SLOW_QUERY_LOG_BACKUPS + 1))]
+    for current in reversed(paths):
+        try:
+            with open(current, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            continue
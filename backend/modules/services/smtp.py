@@ -0,0 +1,89 @@
+import socket
+import socketserver
+import threading
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Обработчик минимального SMTP протокола: принимает письма и сохраняет их в памяти сервера
+    """
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.reply('220 localhost SMTP sink')
+        with self.server.lock:
+            self.server.connections += 1
+            self.server.clients.add(self.connection)
+        try:
+            self.serve_commands()
+        except OSError:
+            # Соединение разорвано сервером (drop_connections)
+            pass
+        finally:
+            with self.server.lock:
+                self.server.clients.discard(self.connection)
+
+    def serve_commands(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith('DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for data_line in self.rfile:
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(data_line)
+                with self.server.lock:
+                    self.server.messages.append(b''.join(data))
+                self.reply('250 OK')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            elif command.startswith(('EHLO', 'HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP')):
+                self.reply('250 OK')
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Локальная замена SMTP сервера для тестов и замеров пропускной способности отправки писем
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.messages = []
+        self.connections = 0
+        self.clients = set()
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def drop_connections(self):
+        """
+        Разрыв всех открытых клиентских соединений (имитация таймаута или перезапуска SMTP сервера)
+        """
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
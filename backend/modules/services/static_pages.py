@@ -0,0 +1,138 @@
+import os
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import unquote_to_bytes, urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sites.models import Site
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.handlers.wsgi import WSGIRequest
+from django.http import Http404
+from django.urls import resolve, reverse
+
+from .staticfiles import get_compressed_variants
+
+# Файлы страниц: <STATIC_PAGES_ROOT>/<путь>/index.html, страница N списка - index<N>.html (nginx: index$arg_page.html)
+PAGE_SUFFIXES = ('', '.gz', '.br')
+
+
+def get_page_file(path, page=1):
+    return Path(settings.STATIC_PAGES_ROOT) / path.strip('/') / f'index{page if page > 1 else ""}.html'
+
+
+def get_list_pages(path):
+    return [(path, page) for page in range(1, settings.STATIC_PAGES_LIST_PAGES + 1)]
+
+
+def get_article_pages(article):
+    """
+    Страницы, на которых выводится статья: сама статья, главная, категория и теги (первые страницы списков)
+    """
+    pages = [(article.get_absolute_url(), 1)]
+    pages += get_list_pages(reverse('home'))
+    pages += get_list_pages(article.category.get_absolute_url())
+    for slug in article.tags.values_list('slug', flat=True):
+        pages += get_list_pages(reverse('articles_by_tags', args=[slug]))
+    return pages
+
+
+def get_all_pages():
+    """
+    Все предварительно отрисовываемые страницы: опубликованные статьи и первые страницы списков
+    """
+    from taggit.models import Tag
+    from modules.blog.models import Article, Category
+
+    pages = [(article.get_absolute_url(), 1) for article in Article.objects.links()]
+    pages += get_list_pages(reverse('home'))
+    for category in Category.objects.only('slug'):
+        pages += get_list_pages(category.get_absolute_url())
+    for slug in Tag.objects.filter(article__status='published').distinct().values_list('slug', flat=True):
+        pages += get_list_pages(reverse('articles_by_tags', args=[slug]))
+    return pages
+
+
+def build_page_request(path, page=1):
+    """
+    GET запрос анонимного посетителя к странице сайта по HTTPS (окружение WSGI, как у запроса от gunicorn)
+    """
+    domain = Site.objects.get_current().domain
+    request = WSGIRequest({
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        # PATH_INFO по PEP 3333: байты UTF-8 в строке latin-1
+        'PATH_INFO': unquote_to_bytes(path).decode('iso-8859-1'),
+        'QUERY_STRING': urlencode({'page': page}) if page > 1 else '',
+        'SERVER_NAME': domain,
+        'SERVER_PORT': '443',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': domain,
+        'wsgi.url_scheme': 'https',
+        'wsgi.input': BytesIO(),
+    })
+    request.user = AnonymousUser()
+    return request
+
+
+def render_page(path, page=1):
+    """
+    HTML страницы для анонимного посетителя или None, если страницы нет (404, страница списка вне диапазона)
+    """
+    request = build_page_request(path, page)
+    # Признак для шаблонов и ViewCountMixin: отрисовка не является просмотром
+    request.prerender = True
+    match = resolve(path)
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+    except (Http404, ObjectDoesNotExist):
+        return None
+    return response.content if response.status_code == 200 else None
+
+
+def write_page(file, content):
+    """
+    Запись страницы и сжатых копий (gzip_static/brotli_static в nginx) через временный файл
+    """
+    file.parent.mkdir(parents=True, exist_ok=True)
+    variants = {'': content, **get_compressed_variants(content)}
+    for suffix, data in variants.items():
+        target = file.with_name(file.name + suffix)
+        temporary = target.with_name(target.name + '.tmp')
+        temporary.write_bytes(data)
+        os.replace(temporary, target)
+
+
+def remove_page(file):
+    for suffix in PAGE_SUFFIXES:
+        file.with_name(file.name + suffix).unlink(missing_ok=True)
+
+
+def publish_pages(pages):
+    """
+    Отрисовка страниц в STATIC_PAGES_ROOT; файлы исчезнувших страниц удаляются
+    """
+    written = 0
+    for path, page in dict.fromkeys(pages):
+        content = render_page(path, page)
+        if content is None:
+            remove_page(get_page_file(path, page))
+        else:
+            write_page(get_page_file(path, page), content)
+            written += 1
+    return written
+
+
+def remove_stale_pages(pages):
+    """
+    Удаление файлов страниц, которых нет в списке (удаленные статьи, категории и теги)
+    """
+    current = {get_page_file(path, page) for path, page in pages}
+    removed = 0
+    for file in Path(settings.STATIC_PAGES_ROOT).rglob('*.html'):
+        if file not in current:
+            remove_page(file)
+            removed += 1
+    return removed
@@ -0,0 +1,123 @@
+import gzip
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+# Типы файлов, для которых collectstatic создает сжатые копии (gzip_static/brotli_static в nginx)
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.txt', '.json', '.xml', '.html')
+# Файлы меньше этого размера (байт) не сжимаются: выигрыш меньше заголовков
+COMPRESS_MIN_SIZE = 1000
+
+
+def get_compressed_variants(content):
+    """
+    Сжатые копии содержимого: суффикс файла -> данные (.br только при установленном brotli)
+    """
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content)
+    return variants
+
+
+def minify_js(source):
+    """
+    Минификация JS через rjsmin (requirements.txt). Без него исходный код не изменяется:
+    построчная обработка портила бы многострочные шаблонные строки и комментарии
+    """
+    if rjsmin is None:
+        return source
+    return rjsmin.jsmin(source)
+
+
+class ScriptBundleFinder(finders.BaseFinder):
+    """
+    Сборки STATIC_BUNDLES: исходные файлы склеиваются и минифицируются при обращении (runserver, collectstatic)
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.storage = FileSystemStorage(location=Path(tempfile.gettempdir()) / 'static_bundles')
+
+    def build(self, name):
+        sources = []
+        for path in settings.STATIC_BUNDLES[name]:
+            source = finders.find(path)
+            if source is None:
+                raise ImproperlyConfigured(f'STATIC_BUNDLES[{name!r}]: static file {path!r} not found')
+            sources.append(minify_js(Path(source).read_text(encoding='utf-8')))
+        file = Path(self.storage.path(name))
+        file.parent.mkdir(parents=True, exist_ok=True)
+        # Запись во временный файл и замена: параллельные процессы (runserver, collectstatic)
+        # не читают недописанную сборку
+        fd, temp_name = tempfile.mkstemp(dir=file.parent, prefix=f'.{file.name}.')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as temp:
+                temp.write(';\n'.join(sources) + '\n')
+            os.replace(temp_name, file)
+        except BaseException:
+            os.unlink(temp_name)
+            raise
+        return str(file)
+
+    def find(self, path, all=False):
+        if path not in settings.STATIC_BUNDLES:
+            return []
+        file = self.build(path)
+        return [file] if all else file
+
+    def list(self, ignore_patterns):
+        for name in settings.STATIC_BUNDLES:
+            self.build(name)
+            yield name, self.storage
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Файлы с хэшем содержимого в имени (кэширование на год) и их сжатые копии рядом с ними
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+        if not dry_run:
+            for hashed_name in sorted(hashed_names):
+                self.compress(hashed_name)
+
+    def compress(self, name):
+        file = Path(self.path(name))
+        if not file.name.endswith(COMPRESSED_EXTENSIONS) or file.stat().st_size < COMPRESS_MIN_SIZE:
+            return
+        # Имя содержит хэш содержимого: существующие сжатые копии актуальны
+        suffixes = ('.gz', '.br') if brotli is not None else ('.gz',)
+        if all(file.with_name(file.name + suffix).exists() for suffix in suffixes):
+            return
+        for suffix, data in get_compressed_variants(file.read_bytes()).items():
+            file.with_name(file.name + suffix).write_bytes(data)
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Без collectstatic (разработка, тесты) манифеста нет: используется исходное имя.
+            # В production файл без записи в манифесте - ошибка, а не отдача без хэша и долгого кэширования
+            if settings.STATIC_MANIFEST_STRICT:
+                raise
+            return name
@@ -1,7 +1,25 @@
-from celery import shared_task
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from datetime import timedelta
+
+from celery import group, shared_task
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_process_shutdown
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
 from django.core.management import call_command
+from django.db import connections
+from django.utils import timezone
 
-from .email import send_activate_email_message, send_contact_email_message
+from .email import send_activate_email_message, send_contact_email_message, send_password_reset_email_message, \
+    send_email_messages, build_email_messages, close_pooled_connection, render_followers_notification
+from .images import generate_image_variants, delete_image_variants
+from .partitions import ensure_partitions, expire_views, is_partitioned
+from . import metrics
+from .richtext import render_article_body
+from .slow_queries import SlowQueryLogger, log_explained_query
+from .static_pages import get_all_pages, get_article_pages, publish_pages, remove_stale_pages
 
 @shared_task
 def send_activate_email_message_task(user_id):
@@ -21,9 +39,273 @@ def send_contact_email_message_tasks(subject, email, content, ip, user_id):
     return send_contact_email_message(subject, email, content, ip, user_id)
 
 
+@shared_task
+def send_password_reset_email_message_task(subject_template_name, email_template_name, context, from_email,
+                                           to_email, html_email_template_name=None):
+    """
+    1. Задача обрабатывается в форме: UserForgotPasswordForm
+    2. Отправка письма для восстановления пароля осуществляется через функцию: send_password_reset_email_message
+    """
+    return send_password_reset_email_message(subject_template_name, email_template_name, context, from_email,
+                                             to_email, html_email_template_name)
+
+
+def fan_out_followers_notification(author_id, article_ids):
+    """
+    Рассылка письма о статьях всем подписчикам автора группой задач по FOLLOWERS_NOTIFICATION_CHUNK_SIZE получателей
+    """
+    payload = render_followers_notification(article_ids)
+    if payload is None:
+        return 0
+    recipients = (apps.get_model('system.Profile').objects
+                  .filter(following__user_id=author_id, user__is_active=True).exclude(user__email='')
+                  .order_by('user_id').values_list('user__email', flat=True))
+    chunk_size = settings.FOLLOWERS_NOTIFICATION_CHUNK_SIZE
+    signatures, chunk, total = [], [], 0
+    for email in recipients.iterator(chunk_size=chunk_size):
+        chunk.append(email)
+        if len(chunk) == chunk_size:
+            signatures.append(send_followers_notification_task.s(payload, chunk))
+            total, chunk = total + len(chunk), []
+    if chunk:
+        signatures.append(send_followers_notification_task.s(payload, chunk))
+        total += len(chunk)
+    if signatures:
+        group(signatures).apply_async()
+    return total
+
+
+@shared_task()
+def notify_followers_task(article_id):
+    """
+    1. Задача ставится в очередь при публикации статьи: Article.save
+    2. Для авторов, опубликовавших больше FOLLOWERS_DIGEST_THRESHOLD статей за сутки,
+       уведомление откладывается до дайджеста: send_followers_digest_task
+    """
+    model = apps.get_model('blog.Article')
+    author_id = model.objects.filter(pk=article_id, status='published', followers_notified_at__isnull=True) \
+        .values_list('author_id', flat=True).first()
+    if author_id is None:
+        return 0
+    published_today = model.objects.filter(author_id=author_id, status='published',
+                                            time_create__gte=timezone.now() - timedelta(days=1)).count()
+    if published_today > settings.FOLLOWERS_DIGEST_THRESHOLD:
+        return 0
+    # Отметка до рассылки: повторный запуск задачи не отправит письма второй раз
+    if not model.objects.filter(pk=article_id, followers_notified_at__isnull=True) \
+            .update(followers_notified_at=timezone.now()):
+        return 0
+    return fan_out_followers_notification(author_id, [article_id])
+
+
 @shared_task()
-def dbackup_task():
+def send_followers_digest_task():
+    """
+    Дайджест опубликованных статей, о которых подписчики еще не уведомлены: одно письмо на автора
     """
-    Выполнение резервного копирования базы данных
+    model = apps.get_model('blog.Article')
+    pending = defaultdict(list)
+    for author_id, article_id in model.objects.filter(status='published', followers_notified_at__isnull=True) \
+            .order_by('author_id', 'time_create').values_list('author_id', 'pk'):
+        pending[author_id].append(article_id)
+    total = 0
+    for author_id, article_ids in pending.items():
+        if model.objects.filter(pk__in=article_ids, followers_notified_at__isnull=True) \
+                .update(followers_notified_at=timezone.now()):
+            total += fan_out_followers_notification(author_id, article_ids)
+    return total
+
+
+@shared_task()
+def send_followers_notification_task(payload, emails):
+    """
+    Отправка готового письма пачке подписчиков: каждому получателю отдельное письмо через одно SMTP соединение
+    """
+    return send_email_messages(build_email_messages(dict(payload, to=[email]) for email in emails))
+
+
+@worker_process_shutdown.connect
+def close_email_connection(**kwargs):
+    """
+    Закрытие постоянного SMTP соединения при остановке процесса воркера
+    """
+    close_pooled_connection()
+
+
+# Время запуска выполняемых задач процесса воркера: id задачи -> perf_counter
+_task_started = {}
+
+
+@before_task_publish.connect
+def add_published_at_header(headers=None, **kwargs):
+    """
+    Время постановки задачи в очередь в заголовке сообщения (для времени ожидания в очереди)
+    """
+    if headers is not None:
+        headers.setdefault('published_at', time.time())
+
+
+@task_prerun.connect
+def record_task_queue_wait(task_id=None, task=None, **kwargs):
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at:
+        metrics.celery_task_queue_wait.observe(max(time.time() - published_at, 0), task=task.name)
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def record_task_runtime(task_id=None, task=None, state=None, **kwargs):
+    """
+    Время выполнения и результат задачи (SUCCESS, FAILURE, RETRY) по имени задачи
+    """
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        metrics.celery_task_runtime.observe(time.perf_counter() - started, task=task.name)
+    metrics.celery_tasks.inc(task=task.name, state=state or 'UNKNOWN')
+    metrics.flush_metrics()
+
+
+@worker_process_shutdown.connect
+def retire_task_metrics(**kwargs):
+    metrics.retire_metrics()
+
+
+# Обертки журнала медленных запросов выполняющихся задач (task_id -> ExitStack)
+_task_slow_query_logs = {}
+
+
+@task_prerun.connect
+def start_task_slow_query_log(task_id=None, task=None, **kwargs):
     """
-    call_command('dbackup')
+    Журнал медленных SQL запросов задачи с ее именем в качестве источника (аналог SlowQueryMiddleware)
+    """
+    # Задача без брокера выполняется внутри запроса, запросы которого уже записывает SlowQueryMiddleware
+    if not settings.SLOW_QUERY_THRESHOLD_MS or task.request.is_eager:
+        return
+    slow_query_logger = SlowQueryLogger(task.name)
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(slow_query_logger))
+    _task_slow_query_logs[task_id] = stack
+
+
+@task_postrun.connect
+def stop_task_slow_query_log(task_id=None, **kwargs):
+    stack = _task_slow_query_logs.pop(task_id, None)
+    if stack is not None:
+        stack.close()
+
+
+@shared_task()
+def explain_slow_query_task(record, sql):
+    """
+    1. Задача ставится в очередь журналом медленных запросов: SlowQueryLogger.log
+    2. EXPLAIN ANALYZE выполняет запрос представления повторно вне запроса пользователя: log_explained_query
+    """
+    return log_explained_query(record, sql)
+
+
+@shared_task()
+def dbackup_task(incremental=False):
+    """
+    Выполнение резервного копирования базы данных (полного или только измененных записей)
+    """
+    call_command('dbackup', incremental=incremental)
+
+
+@shared_task()
+def generate_image_variants_task(model_label, pk, field_name, widths):
+    """
+    Генерация адаптивных вариантов изображения (WebP + JPEG) для поля модели.
+    Манифест сохраняется в поле <field_name>_variants
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).only(field_name, f'{field_name}_variants').first()
+    if instance is None:
+        return
+    image = getattr(instance, field_name)
+    if not image:
+        return
+    delete_image_variants(image.storage, getattr(instance, f'{field_name}_variants'))
+    manifest = generate_image_variants(image.storage, image.name, widths)
+    # Обновляем только если изображение не было заменено за время обработки
+    model.objects.filter(pk=pk, **{field_name: image.name}).update(**{f'{field_name}_variants': manifest})
+    if model_label == 'blog.Article':
+        schedule_static_pages_render([pk])
+
+
+@shared_task()
+def render_article_body_task(article_id):
+    """
+    Пре-рендер полного описания статьи после сохранения: обработка изображений и выдержка
+    """
+    model = apps.get_model('blog.Article')
+    source = model.objects.filter(pk=article_id).values_list('full_description', flat=True).first()
+    if source is None:
+        return
+    full_description_html, excerpt = render_article_body(source)
+    # Текст мог измениться за время обработки, тогда результат устарел
+    updated = model.objects.filter(pk=article_id, full_description=source).update(
+        full_description_html=full_description_html, excerpt=excerpt)
+    if updated:
+        schedule_static_pages_render([article_id])
+
+
+@shared_task()
+def maintain_viewcount_partitions_task():
+    """
+    Создание месячных секций просмотров на VIEWCOUNT_PARTITIONS_AHEAD месяцев вперед и перенос просмотров
+    старше VIEWCOUNT_RETENTION_MONTHS в помесячные итоги статей (с удалением старых секций)
+    """
+    model = apps.get_model('blog.ViewCount')
+    if is_partitioned(model._meta.db_table):
+        ensure_partitions(model._meta.db_table, 'viewed_on', settings.VIEWCOUNT_PARTITIONS_AHEAD)
+    return expire_views(settings.VIEWCOUNT_RETENTION_MONTHS)
+
+
+# Запас времени жизни ключа отложенной перерисовки сверх STATIC_PAGES_DEBOUNCE (секунды): задача может ждать
+# в очереди bulk дольше задержки, до ее запуска повторные изменения статьи не планируют новую задачу
+STATIC_PAGES_PENDING_MARGIN = 300
+
+
+def get_static_pages_pending_key(article_id):
+    return f'static-pages-pending:{article_id}'
+
+
+def schedule_static_pages_render(article_ids):
+    """
+    Отложенная на STATIC_PAGES_DEBOUNCE секунд перерисовка страниц статей: изменения статьи
+    за это время (комментарии, оценки, сохранения) перерисовываются одной задачей.
+    Ключ снимает задача перед отрисовкой; запас времени жизни ключа покрывает ожидание задачи в очереди,
+    а истечение ключа без задачи (потерянное сообщение) снова разрешает перерисовку
+    """
+    if not settings.STATIC_PAGES_ENABLED:
+        return
+    timeout = settings.STATIC_PAGES_DEBOUNCE + STATIC_PAGES_PENDING_MARGIN
+    pending = [pk for pk in article_ids if cache.add(get_static_pages_pending_key(pk), True, timeout)]
+    if pending:
+        render_static_pages_task.apply_async(args=[pending], countdown=settings.STATIC_PAGES_DEBOUNCE)
+
+
+@shared_task()
+def render_static_pages_task(article_ids=None, pages=()):
+    """
+    Предварительная отрисовка страниц для анонимных посетителей (nginx отдает их без Django):
+    страницы статей article_ids и pages, без аргументов - все страницы с удалением устаревших файлов
+    """
+    if not settings.STATIC_PAGES_ENABLED:
+        return 0
+    if article_ids is None and not pages:
+        pages = get_all_pages()
+        remove_stale_pages(pages)
+        return publish_pages(pages)
+
+    pages = [tuple(page) for page in pages]
+    if article_ids:
+        # Изменения после этой точки снова планируют перерисовку
+        cache.delete_many([get_static_pages_pending_key(pk) for pk in article_ids])
+        model = apps.get_model('blog.Article')
+        articles = model.objects.filter(pk__in=article_ids).select_related('category').only('slug', 'category__slug')
+        for article in articles:
+            pages += get_article_pages(article)
+    return publish_pages(pages)
@@ -0,0 +1,30 @@
+from django import template
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, variants=None, sizes='100vw', alt='', css_class='', default='', loading='lazy'):
+    """
+    Вывод изображения с адаптивными вариантами: <picture> с WebP srcset и JPEG запасным вариантом.
+    Пока варианты не сгенерированы, выводится оригинал (или изображение по умолчанию)
+    """
+    variants = (variants or {}).get('variants') if image else None
+    if not variants:
+        src = image.url if image else default
+        return format_html('<img src="{}" class="{}" alt="{}" loading="{}" decoding="async">',
+                           src, css_class, alt, loading)
+
+    storage = image.storage
+    webp_srcset = ', '.join(f'{storage.url(variant["webp"])} {variant["width"]}w' for variant in variants)
+    jpeg_srcset = ', '.join(f'{storage.url(variant["jpeg"])} {variant["width"]}w' for variant in variants)
+    # Атрибуты width/height задают пропорции и исключают сдвиг макета при загрузке
+    fallback = variants[len(variants) // 2]
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" class="{}" alt="{}" loading="{}" decoding="async">'
+        '</picture>',
+        webp_srcset, sizes, storage.url(fallback['jpeg']), jpeg_srcset, sizes,
+        fallback['width'], fallback['height'], css_class, alt, loading,
+    )
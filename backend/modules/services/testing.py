@@ -0,0 +1,80 @@
+from collections import Counter
+from contextlib import contextmanager
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from backend.celery import app as celery_app
+from .utils import get_sql_fingerprint
+
+# Повторов одного запроса с разными параметрами, начиная с которых запросы считаются N+1
+N_PLUS_ONE_THRESHOLD = 3
+
+# Объем данных для тестов (параметры команды seed_dataset)
+QUERY_BUDGET_DATASET = {
+    'users': 12,
+    'follows': 5,
+    'categories': 2,
+    'category_depth': 3,
+    'tags': 15,
+    'articles': 25,
+    'tags_per_article': 3,
+    'comments': 6,
+    'comment_depth': 3,
+    'ratings': 4,
+    'views': 5,
+    'seed': 1,
+}
+
+
+@contextmanager
+def eager_celery():
+    """
+    Задачи Celery выполняются сразу в процессе теста, без брокера; исключения задач пробрасываются
+    """
+    previous = {key: celery_app.conf[key] for key in ('task_always_eager', 'task_eager_propagates')}
+    celery_app.conf.update(task_always_eager=True, task_eager_propagates=True)
+    try:
+        yield
+    finally:
+        celery_app.conf.update(previous)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryBudgetTestCase(TestCase):
+    """
+    Базовый класс тестов бюджета SQL запросов на сгенерированных данных.
+    Кэш отключен: бюджет проверяет запросы, которые выполняются при пустом кэше.
+    Время запросов не проверяется: на медленных машинах CI такая проверка давала бы случайные падения
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_dataset', stdout=StringIO(), **QUERY_BUDGET_DATASET)
+
+    def assertQueryBudget(self, url, max_queries, method='get', data=None, client=None, status_code=200, **extra):
+        """
+        Запрос к адресу с проверкой количества запросов и отсутствия N+1
+        """
+        client = client or self.client
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(client, method)(url, data, **extra)
+        self.assertEqual(response.status_code, status_code, f'{method.upper()} {url}')
+
+        queries = context.captured_queries
+        duplicates = [
+            (count, fingerprint) for fingerprint, count in
+            Counter(get_sql_fingerprint(query['sql']) for query in queries).most_common()
+            if count >= N_PLUS_ONE_THRESHOLD
+        ]
+        report = '\n'.join(f'  {count}x {fingerprint}' for count, fingerprint in duplicates)
+        self.assertFalse(duplicates, f'{method.upper()} {url}: repeated queries (N+1)\n{report}')
+
+        self.assertLessEqual(
+            len(queries), max_queries,
+            f'{method.upper()} {url}: {len(queries)} queries, budget {max_queries}\n' +
+            '\n'.join(f'  {query["sql"]}' for query in queries))
+        return response
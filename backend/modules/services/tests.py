@@ -0,0 +1,1090 @@
+import gzip
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from email import message_from_bytes, policy
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import serializers
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import CommandError, call_command
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.mail.backends.smtp import EmailBackend
+from django.core.paginator import EmptyPage
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from taggit.models import Tag, TaggedItem
+
+from modules.blog.models import Article, ArticleViewRollup, Category, Comment, Rating, ViewCount, \
+    get_view_count_expression
+from modules.system.forms import UserForgotPasswordForm
+from modules.system.middleware import ReplicaPinningMiddleware
+from modules.system.models import Feedback, Profile
+from .email import close_pooled_connection, send_email_messages
+from . import metrics
+from .bots import BOT, HUMAN, SEARCH_ENGINE, BotMatcher, get_bot_matcher
+from .images import delete_image_variants, generate_image_variants, get_or_generate_image_variants
+from .paginators import EstimatedCountPaginator
+from .partitions import expire_views, get_month_start
+from .richtext import ArticleHtmlProcessor, make_excerpt
+from .routers import get_read_database
+from .slow_queries import SlowQueryLogger, explain_query
+from .staticfiles import COMPRESS_MIN_SIZE, CompressedManifestStaticFilesStorage, ScriptBundleFinder
+from .smtp import SMTPSink
+from .tasks import notify_followers_task, send_followers_digest_task, send_followers_notification_task
+from .testing import eager_celery
+from .utils import CkeditorHashedStorage
+
+# Create your tests here.
+
+
+def make_image(size=(800, 600), mode='RGB', image_format='PNG', **params):
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 100, 50, 128)[:len(mode)]).save(buffer, format=image_format, **params)
+    return ContentFile(buffer.getvalue())
+
+
+class ImageVariantsTest(SimpleTestCase):
+    """
+    Генерация и удаление уменьшенных копий изображений (WebP и JPEG)
+    """
+
+    def setUp(self):
+        self.storage = FileSystemStorage(location=self.enterContext(tempfile.TemporaryDirectory()))
+
+    def test_generate(self):
+        name = self.storage.save('images/photo.png', make_image(mode='RGBA'))
+        manifest = generate_image_variants(self.storage, name, (240, 480, 960))
+
+        # Ширина больше оригинала заменяется шириной оригинала
+        self.assertEqual([(variant['width'], variant['height']) for variant in manifest['variants']],
+                         [(240, 180), (480, 360), (800, 600)])
+        self.assertEqual((manifest['source'], manifest['width'], manifest['height']), (name, 800, 600))
+        for variant in manifest['variants']:
+            with self.storage.open(variant['webp']) as webp, self.storage.open(variant['jpeg']) as jpeg:
+                self.assertEqual(Image.open(webp).format, 'WEBP')
+                # Прозрачность JPEG заменяется фоном
+                self.assertEqual(Image.open(jpeg).mode, 'RGB')
+        self.assertEqual(manifest['variants'][0]['webp'], 'images/photo-240w.webp')
+
+    def test_animated_image_is_skipped(self):
+        frames = [Image.new('RGB', (100, 100), color) for color in ('red', 'blue')]
+        buffer = BytesIO()
+        frames[0].save(buffer, format='GIF', save_all=True, append_images=frames[1:])
+        name = self.storage.save('images/animation.gif', ContentFile(buffer.getvalue()))
+        self.assertEqual(generate_image_variants(self.storage, name, (240,)), {})
+
+    def test_existing_variants_are_reused(self):
+        name = self.storage.save('images/photo.jpg', make_image(image_format='JPEG'))
+        manifest = generate_image_variants(self.storage, name, (240, 480))
+        modified = self.storage.get_modified_time(manifest['variants'][0]['webp'])
+
+        self.assertEqual(get_or_generate_image_variants(self.storage, name, (240, 480)), manifest)
+        self.assertEqual(self.storage.get_modified_time(manifest['variants'][0]['webp']), modified)
+
+        # Недостающий вариант генерируется заново
+        self.storage.delete(manifest['variants'][1]['jpeg'])
+        self.assertEqual(get_or_generate_image_variants(self.storage, name, (240, 480)), manifest)
+        self.assertTrue(self.storage.exists(manifest['variants'][1]['jpeg']))
+
+    def test_delete(self):
+        name = self.storage.save('images/photo.png', make_image())
+        manifest = generate_image_variants(self.storage, name, (240, 480))
+        delete_image_variants(self.storage, manifest)
+        for variant in manifest['variants']:
+            self.assertFalse(self.storage.exists(variant['webp']))
+            self.assertFalse(self.storage.exists(variant['jpeg']))
+        self.assertTrue(self.storage.exists(name))
+        # Пустой манифест (вариантов нет)
+        delete_image_variants(self.storage, {})
+
+
+class CkeditorHashedStorageTest(TestCase):
+    """
+    Загрузки редактора с адресацией по содержимому и удаление неиспользуемых файлов
+    """
+
+    def setUp(self):
+        location = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(mock.patch.object(CkeditorHashedStorage, 'location', location))
+        self.storage = CkeditorHashedStorage()
+
+    def make_old(self, name, hours=48):
+        timestamp = time.time() - hours * 3600
+        os.utime(self.storage.path(name), (timestamp, timestamp))
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save('photo.PNG', ContentFile(b'image'))
+        self.assertRegex(first, r'^blobs/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.make_old(first)
+        old_mtime = os.path.getmtime(self.storage.path(first))
+
+        self.assertEqual(self.storage.save('copy.png', ContentFile(b'image')), first)
+        self.assertEqual(self.storage.listdir(os.path.dirname(first))[1], [os.path.basename(first)])
+        # Повторная загрузка обновляет время изменения файла
+        self.assertGreater(os.path.getmtime(self.storage.path(first)), old_mtime)
+
+    def test_cleanup_keeps_reuploaded_blob(self):
+        reuploaded = self.storage.save('a.png', ContentFile(b'reuploaded'))
+        orphaned = self.storage.save('b.png', ContentFile(b'orphaned'))
+        self.make_old(reuploaded)
+        self.make_old(orphaned)
+        # Файл снова вставлен в редактор, статья еще не сохранена
+        self.storage.save('a.png', ContentFile(b'reuploaded'))
+
+        call_command('ckeditor_cleanup', stdout=StringIO())
+        self.assertTrue(self.storage.exists(reuploaded))
+        self.assertFalse(self.storage.exists(orphaned))
+
+
+class ArticleHtmlProcessorTest(SimpleTestCase):
+    """
+    Обработка HTML описания статьи: размеры и ленивая загрузка изображений, варианты больших изображений
+    """
+
+    def setUp(self):
+        location = self.enterContext(tempfile.TemporaryDirectory())
+        self.storage = FileSystemStorage(location=location, base_url=settings.MEDIA_URL)
+        self.processor = ArticleHtmlProcessor(storage=self.storage, max_width=960, widths=(480, 960), sizes='100vw')
+
+    def test_small_image(self):
+        name = self.storage.save('uploads/small.png', make_image(size=(300, 200)))
+        html = self.processor.process(f'<p>Текст &amp; <b>разметка</b></p><img src="{settings.MEDIA_URL}{name}">')
+        self.assertEqual(html, '<p>Текст &amp; <b>разметка</b></p><img src="{}" loading="lazy" decoding="async" '
+                               'width="300" height="200">'.format(settings.MEDIA_URL + name))
+
+    def test_large_image(self):
+        name = self.storage.save('uploads/large.png', make_image(size=(2000, 1000)))
+        html = self.processor.process(f'<img src="{settings.MEDIA_URL}{name}" alt="Схема">')
+        self.assertTrue(html.startswith('<picture><source type="image/webp" srcset="'))
+        srcset = f'{settings.MEDIA_URL}uploads/large-480w.jpg 480w, {settings.MEDIA_URL}uploads/large-960w.jpg 960w'
+        self.assertIn(f'srcset="{srcset}"', html)
+        self.assertIn('alt="Схема"', html)
+        self.assertIn('width="960" height="480"', html)
+        self.assertTrue(self.storage.exists('uploads/large-960w.webp'))
+
+    def test_external_and_missing_images(self):
+        html = self.processor.process(
+            f'<img src="https://example.com/a.png"><img src="{settings.MEDIA_URL}uploads/missing.png" loading="eager">')
+        self.assertEqual(html, '<img src="https://example.com/a.png" loading="lazy" decoding="async">'
+                               f'<img src="{settings.MEDIA_URL}uploads/missing.png" loading="eager" decoding="async">')
+
+    def test_excerpt(self):
+        self.assertEqual(make_excerpt('<p>Первый&nbsp;абзац</p><p>второй   абзац</p>', words=3), 'Первый абзац второй…')
+
+
+class IncrementalBackupTest(TestCase):
+    """
+    Манифест инкрементальной резервной копии: база, момент отсчета и только измененные записи
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user('backup-author', 'backup@example.com', 'password')
+        category = Category.objects.create(title='Копии', slug='backups', description='Резервные копии')
+        cls.articles = [
+            Article.objects.create(title=f'Статья {number}', author=author, category=category, status='draft',
+                                   short_description='Кратко', full_description='Текст')
+            for number in range(2)
+        ]
+
+    def setUp(self):
+        self.output_dir = self.enterContext(tempfile.TemporaryDirectory())
+
+    def backup(self, **options):
+        call_command('dbackup', output_dir=self.output_dir, stdout=StringIO(), **options)
+        manifests = sorted(os.path.join(self.output_dir, name, 'manifest.json') for name in os.listdir(self.output_dir))
+        with open(manifests[-1], encoding='utf-8') as file:
+            manifest = json.load(file)
+        manifest['dir'] = os.path.dirname(manifests[-1])
+        manifest['models'] = {item['model']: item for item in manifest['models']}
+        return manifest
+
+    def read_pks(self, manifest, label):
+        with gzip.open(os.path.join(manifest['dir'], manifest['models'][label]['file']), 'rt') as file:
+            return [json.loads(line)['pk'] for line in file]
+
+    def test_incremental_manifest(self):
+        full = self.backup()
+        self.assertEqual((full['mode'], full['base'], full['since']), ('full', None, None))
+        self.assertEqual(full['models']['blog.article']['objects'], 2)
+
+        changed = self.articles[1]
+        changed.title = 'Измененная статья'
+        changed.save()
+        Feedback.objects.create(subject='Вопрос', email='reader@example.com', content='Текст')
+
+        incremental = self.backup(incremental=True)
+        self.assertEqual(incremental['mode'], 'incremental')
+        self.assertEqual(incremental['base'], os.path.join(os.path.basename(full['dir']), 'manifest.json'))
+        self.assertEqual(incremental['since'], full['started_at'])
+
+        # Изменяемые записи отбираются по time_update, добавляемые - по дате создания
+        self.assertEqual(incremental['models']['blog.article']['incremental'], True)
+        self.assertEqual(self.read_pks(incremental, 'blog.article'), [changed.pk])
+        self.assertEqual(incremental['models']['system.feedback']['objects'], 1)
+        # Таблицы без поля времени выгружаются целиком
+        self.assertEqual(incremental['models']['blog.category']['incremental'], False)
+        self.assertEqual(incremental['models']['blog.category']['objects'], Category.objects.count())
+
+    def test_incremental_without_previous_backup_is_full(self):
+        self.assertEqual(self.backup(incremental=True)['mode'], 'full')
+
+    def test_deleted_rows(self):
+        full = self.backup()
+        self.assertEqual(full['version'], 2)
+        self.assertIsNone(full['models']['blog.article']['deleted'])
+        self.assertEqual(self.read_pks(full, 'blog.article'), [article.pk for article in self.articles])
+
+        removed = self.articles[0].pk
+        self.articles[0].delete()
+        incremental = self.backup(incremental=True, compress='none')
+        item = incremental['models']['blog.article']
+        self.assertEqual(item['deleted'], 1)
+        # Базовая копия сжата gzip, инкрементальная - без сжатия: ключи читаются в формате каждой копии
+        with open(os.path.join(incremental['dir'], item['deleted_file']), encoding='utf-8') as file:
+            self.assertEqual([json.loads(line) for line in file], [removed])
+        self.assertEqual(incremental['models']['blog.category']['deleted'], 0)
+
+
+class DatabaseRestoreTest(TransactionTestCase):
+    """
+    Восстановление копии dbackup командой dbrestore (COPY в PostgreSQL, INSERT в SQLite).
+    Команда выполняется в собственной транзакции, как при восстановлении на сервере
+    """
+    restored_models = (get_user_model(), Profile, Category, Article, Comment, Rating, ViewCount, Tag, TaggedItem)
+
+    def setUp(self):
+        call_command('seed_dataset', users=6, follows=2, categories=2, category_depth=2, tags=6, articles=8,
+                     tags_per_article=2, comments=3, comment_depth=2, ratings=2, views=3, seed=7, stdout=StringIO())
+        self.output_dir = self.enterContext(tempfile.TemporaryDirectory())
+
+    def snapshot(self):
+        return {model._meta.label_lower: serializers.serialize('json', model._default_manager.order_by('pk'))
+                for model in self.restored_models}
+
+    def backup(self, **options):
+        call_command('dbackup', output_dir=self.output_dir, stdout=StringIO(), **options)
+        return os.path.join(self.output_dir, sorted(os.listdir(self.output_dir))[-1], 'manifest.json')
+
+    def restore(self, manifest, **options):
+        call_command('dbrestore', manifest, stdout=StringIO(), **options)
+
+    def test_full_round_trip(self):
+        expected = self.snapshot()
+        manifest = self.backup()
+        Article.objects.filter(pk__in=Article.objects.order_by('pk').values('pk')[:3]).delete()
+        Profile.objects.update(bio='Изменено после копии')
+
+        self.restore(manifest, truncate=True)
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_incremental_chain(self):
+        self.backup()
+        article = Article.objects.order_by('pk').first()
+        article.title = 'Версия инкрементальной копии'
+        article.save()
+        article.tags.add(Tag.objects.create(name='Новый тег', slug='new-tag'))
+        manifest = self.backup(incremental=True)
+        expected = self.snapshot()
+
+        Article.objects.filter(pk=article.pk).update(title='Изменено после копии')
+        article.tags.clear()
+        self.restore(manifest)
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_incremental_chain_with_deletions(self):
+        self.backup()
+        article = Article.objects.order_by('pk').first()
+        follower, followed = Profile.objects.order_by('pk')[:2]
+        follower.following.add(followed)
+        # Связь подписки удаляется вместе с профилем, профиль подписчика при этом не изменяется
+        followed.delete()
+        article.delete()
+        manifest = self.backup(incremental=True)
+        # dbrestore перестраивает деревья комментариев: номера деревьев удаленной статьи освобождаются
+        Comment.objects.rebuild()
+        expected = self.snapshot()
+
+        self.restore(manifest, truncate=True)
+        self.assertEqual(self.snapshot(), expected)
+        self.assertFalse(Article.objects.filter(pk=article.pk).exists())
+        self.assertFalse(follower.following.filter(pk=followed.pk).exists())
+
+    def test_unique_conflict(self):
+        manifest = self.backup()
+        article = Article.objects.order_by('pk').first()
+        slug = article.slug
+        article.delete()
+        # Та же статья создана заново: новый первичный ключ, прежний slug
+        article.pk = None
+        article.save()
+
+        with self.assertRaisesMessage(CommandError, f'blog.article: rows of the backup collide with other rows on '
+                                                    f'unique slug: backup pk='):
+            self.restore(manifest)
+        self.assertEqual(Article.objects.get(slug=slug).pk, article.pk)
+
+
+class PooledEmailSendingTest(TestCase):
+    """
+    Отправка писем через постоянное SMTP соединение процесса на локальный SMTPSink
+    """
+
+    def setUp(self):
+        self.sink = self.enterContext(SMTPSink())
+        self.enterContext(override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.sink.port, EMAIL_USE_SSL=False, EMAIL_USE_TLS=False, EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+        ))
+        self.addCleanup(close_pooled_connection)
+
+    def messages(self, count, prefix='Письмо'):
+        return [EmailMessage(f'{prefix} {number}', 'Текст', 'robot@example.com', [f'user{number}@example.com'])
+                for number in range(count)]
+
+    def received_subjects(self):
+        return [message_from_bytes(data, policy=policy.default)['Subject'] for data in self.sink.messages]
+
+    def test_calls_share_connection(self):
+        self.assertEqual(send_email_messages(self.messages(7)), 7)
+        self.assertEqual(send_email_messages(self.messages(2, prefix='Еще')), 2)
+
+        # Письма обоих вызовов идут через одно соединение
+        self.assertEqual(self.sink.connections, 1)
+        self.assertEqual(len(self.sink.messages), 9)
+
+    def test_reconnect_after_server_drop(self):
+        send_email_messages(self.messages(1))
+        self.sink.drop_connections()
+
+        self.assertEqual(send_email_messages(self.messages(4)), 4)
+        self.assertEqual(self.sink.connections, 2)
+        self.assertEqual(len(self.sink.messages), 5)
+
+    def test_retry_when_drop_is_not_detected(self):
+        send_email_messages(self.messages(1))
+        self.sink.drop_connections()
+
+        # Разрыв между проверкой NOOP и отправкой: письмо повторяется через новое соединение
+        with mock.patch('modules.services.email.is_connection_alive', return_value=True):
+            self.assertEqual(send_email_messages(self.messages(2, prefix='Повтор')), 2)
+        self.assertEqual(self.sink.connections, 2)
+        self.assertEqual(self.received_subjects(), ['Письмо 0', 'Повтор 0', 'Повтор 1'])
+
+    def test_drop_in_the_middle_of_sending(self):
+        send_messages = EmailBackend.send_messages
+
+        def send_and_drop(backend, messages):
+            sent = send_messages(backend, messages)
+            if len(self.sink.messages) == 2:
+                self.sink.drop_connections()
+            return sent
+
+        # Отправленные до разрыва письма не повторяются: подписчики не получают дубликаты
+        with mock.patch.object(EmailBackend, 'send_messages', send_and_drop):
+            self.assertEqual(send_email_messages(self.messages(4)), 4)
+        self.assertEqual(self.sink.connections, 2)
+        self.assertEqual(self.received_subjects(), [f'Письмо {number}' for number in range(4)])
+
+    def test_password_reset_through_celery(self):
+        user = get_user_model().objects.create_user('reader', 'reader@example.com', 'secret-password')
+        form = UserForgotPasswordForm({'email': user.email})
+        self.assertTrue(form.is_valid())
+
+        with eager_celery():
+            form.save(domain_override='example.com', from_email='robot@example.com',
+                      subject_template_name='system/email/password_subject_reset_mail.txt',
+                      email_template_name='system/email/password_reset_mail.html')
+
+        self.assertEqual(len(self.sink.messages), 1)
+        message = message_from_bytes(self.sink.messages[0], policy=policy.default)
+        self.assertEqual(message['To'], user.email)
+        self.assertIn('example.com/', message.get_content())
+
+
+@override_settings(FOLLOWERS_NOTIFICATION_CHUNK_SIZE=2, FOLLOWERS_DIGEST_THRESHOLD=2)
+class FollowersNotificationTest(TestCase):
+    """
+    Рассылка подписчикам автора: пачки получателей по FOLLOWERS_NOTIFICATION_CHUNK_SIZE и дайджест
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        users = get_user_model().objects
+        cls.author = users.create_user('author', 'author@example.com', first_name='Анна', last_name='Авторова')
+        cls.category = Category.objects.create(title='Заметки', slug='notes', description='Заметки')
+        followers = [users.create_user(f'follower{number}', f'follower{number}@example.com') for number in range(3)]
+        # Неактивный пользователь и пользователь без адреса писем не получают
+        followers.append(users.create_user('inactive', 'inactive@example.com', is_active=False))
+        followers.append(users.create_user('no-email', ''))
+        cls.author.profile.followers.set(follower.profile for follower in followers)
+        users.create_user('stranger', 'stranger@example.com')
+
+    def setUp(self):
+        self.enterContext(eager_celery())
+        self.addCleanup(close_pooled_connection)
+
+    def publish(self, title):
+        return Article.objects.create(title=title, slug=f'article-{Article.objects.count()}', author=self.author,
+                                      category=self.category, status='published', short_description='Кратко',
+                                      full_description='<p>Текст</p>')
+
+    def test_fan_out_in_chunks(self):
+        with mock.patch('modules.services.tasks.send_email_messages', wraps=send_email_messages) as send, \
+                self.captureOnCommitCallbacks(execute=True):
+            article = self.publish('Первая статья')
+
+        self.assertEqual([len(call.args[0]) for call in send.call_args_list], [2, 1])
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['follower0@example.com', 'follower1@example.com', 'follower2@example.com'])
+        self.assertTrue(all(len(message.to) == 1 for message in mail.outbox))
+        self.assertEqual(mail.outbox[0].subject, 'Новая статья от Анна Авторова: Первая статья')
+
+        # Повторный запуск задачи не отправляет письма второй раз
+        self.assertEqual(notify_followers_task(article.pk), 0)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_digest_after_threshold(self):
+        for number in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.publish(f'Статья {number}')
+        self.assertEqual(len(mail.outbox), 6)
+
+        # Третья статья за сутки откладывается до дайджеста вместе с четвертой
+        mail.outbox.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            pending = [self.publish('Третья статья'), self.publish('Четвертая статья')]
+        self.assertEqual(mail.outbox, [])
+        self.assertFalse(Article.objects.filter(pk__in=[article.pk for article in pending],
+                                                followers_notified_at__isnull=False).exists())
+
+        self.assertEqual(send_followers_digest_task(), 3)
+        self.assertEqual({message.subject for message in mail.outbox}, {'Новые статьи от Анна Авторова (2)'})
+        self.assertIn('Четвертая статья', mail.outbox[0].body)
+        self.assertFalse(Article.objects.filter(followers_notified_at__isnull=True).exists())
+        self.assertEqual(send_followers_digest_task(), 0)
+
+
+@override_settings(REPLICA_DATABASES=['replica'],
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class PrimaryReplicaRouterTest(TransactionTestCase):
+    """
+    Чтение из реплики и закрепление за основной базой после записи.
+    Реплика - второй псевдоним той же тестовой базы: данные видны через зафиксированные транзакции
+    """
+
+    def setUp(self):
+        connections.settings['replica'] = dict(connections['default'].settings_dict)
+        self.addCleanup(self.remove_replica)
+        author = get_user_model().objects.create_user('replica-author')
+        category = Category.objects.create(title='Реплики', slug='replicas', description='Реплики')
+        Article.objects.create(title='Статья с реплики', slug='replica-article', author=author, category=category,
+                               status='published', short_description='Кратко', full_description='Текст')
+        self.primary = self.enterContext(CaptureQueriesContext(connections['default']))
+        self.replica = self.enterContext(CaptureQueriesContext(connections['replica']))
+
+    @staticmethod
+    def remove_replica():
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def middleware_request(self, view, method='get', cookies=None):
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaPinningMiddleware(view)(request)
+
+    def test_list_reads_from_replica(self):
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Статья с реплики')
+        self.assertTrue(any(Article._meta.db_table in query['sql'] for query in self.replica.captured_queries))
+
+    def test_write_goes_to_primary_and_pins_reads(self):
+        def create_category(request):
+            Category.objects.create(title='Новая', slug='new', description='Новая')
+            return HttpResponse()
+
+        response = self.middleware_request(create_category, method='post')
+        self.assertEqual(response.cookies['pin_primary'].value, '1')
+        self.assertEqual(response.cookies['pin_primary']['max-age'], settings.REPLICA_PIN_SECONDS)
+        self.assertEqual(self.replica.captured_queries, [])
+        self.assertTrue(any('INSERT' in query['sql'] for query in self.primary.captured_queries))
+
+        def read_articles(request):
+            self.assertEqual(get_read_database(), 'default')
+            article = Article.objects.using(get_read_database()).get()
+            return HttpResponse(f'{article.title} / {article.category.title}')
+
+        response = self.middleware_request(read_articles, cookies={'pin_primary': '1'})
+        self.assertEqual(response.content.decode(), 'Статья с реплики / Реплики')
+        self.assertEqual(self.replica.captured_queries, [])
+        # Чтение без записи не продлевает закрепление
+        self.assertNotIn('pin_primary', response.cookies)
+
+    def test_safe_request_does_not_pin(self):
+        def read_article(request):
+            article = Article.objects.using(get_read_database()).get()
+            # Связанные объекты читаются из базы исходного объекта
+            return HttpResponse(f'{article.title} / {article.category.title}')
+
+        response = self.middleware_request(read_article)
+        self.assertEqual(response.content.decode(), 'Статья с реплики / Реплики')
+        self.assertEqual(len(self.replica.captured_queries), 2)
+        self.assertEqual(self.primary.captured_queries, [])
+        self.assertNotIn('pin_primary', response.cookies)
+
+
+class MetricsSnapshotsTest(TestCase):
+    """
+    Объединение метрик процессов из METRICS_DIR, формат /metrics и перенос файлов завершенных процессов
+    """
+
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(
+            METRICS_DIR=self.directory, METRICS_SNAPSHOT_MAX_AGE=3600,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        ))
+        # Отдельный реестр: значения метрик других тестов не попадают в результат
+        self.enterContext(mock.patch.dict(metrics.REGISTRY, clear=True))
+        self.enterContext(mock.patch.object(metrics, '_retired', False))
+        self.requests = metrics.Counter('test_requests_total', 'Запросы', ('route', 'status'))
+        self.duration = metrics.Histogram('test_duration_seconds', 'Время', ('route',), buckets=(0.1, 1))
+
+    def save_process(self, name, requests, durations, age=0):
+        """
+        Файл метрик другого процесса с заданными значениями и возрастом (секунды)
+        """
+        with mock.patch.object(self.requests, 'values', {}), mock.patch.object(self.duration, 'values', {}):
+            for route, status in requests:
+                self.requests.inc(route=route, status=status)
+            for value in durations:
+                self.duration.observe(value, route='home')
+            metrics.write_snapshot(self.directory, name, metrics.get_snapshot())
+        path = os.path.join(self.directory, name)
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def dead_pid(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        return process.pid
+
+    def test_merge_and_format(self):
+        self.requests.inc(route='home', status=200)
+        self.duration.observe(0.05, route='home')
+        self.save_process('web-2-10.json', [('home', 200), ('home', 404)], [0.5, 3])
+
+        self.assertEqual(metrics.render_metrics(), '\n'.join((
+            '# HELP test_duration_seconds Время',
+            '# TYPE test_duration_seconds histogram',
+            'test_duration_seconds_bucket{route="home",le="0.1"} 1',
+            'test_duration_seconds_bucket{route="home",le="1"} 2',
+            'test_duration_seconds_bucket{route="home",le="+Inf"} 3',
+            'test_duration_seconds_sum{route="home"} 3.55',
+            'test_duration_seconds_count{route="home"} 3',
+            '# HELP test_requests_total Запросы',
+            '# TYPE test_requests_total counter',
+            'test_requests_total{route="home",status="200"} 2',
+            'test_requests_total{route="home",status="404"} 1',
+        )) + '\n')
+
+    def test_metrics_view(self):
+        self.requests.inc(route='say "hi"\n', status=200)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn('test_requests_total{route="say \\"hi\\"\\n",status="200"} 1',
+                      response.content.decode())
+
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, 403)
+
+    def test_stale_snapshots_are_retired(self):
+        hostname = socket.gethostname()
+        dead = self.save_process(f'{hostname}-{self.dead_pid()}.json', [('home', 200)], [0.2])
+        old = self.save_process('web-old-20.json', [('home', 500)], [2], age=7200)
+        fresh = self.save_process('web-new-30.json', [('home', 200)], [0.01], age=60)
+        expected = metrics.collect_metrics()
+
+        # Итоги не меняются: значения завершенных процессов перенесены в общий файл
+        self.assertEqual(metrics.collect_metrics(), expected)
+        self.assertEqual((os.path.exists(dead), os.path.exists(old), os.path.exists(fresh)), (False, False, True))
+        retired = metrics.merge_snapshots([metrics.read_snapshot(os.path.join(self.directory,
+                                                                              metrics.RETIRED_SNAPSHOT))])
+        self.assertEqual(retired['test_requests_total'], {('home', '200'): 1, ('home', '500'): 1})
+        self.assertEqual(retired['test_duration_seconds'][('home',)][0], [0, 1, 1])
+
+    def test_retire_own_metrics_once(self):
+        self.requests.inc(route='home', status=200)
+        metrics.flush_metrics(force=True)
+        metrics.retire_metrics()
+        metrics.retire_metrics()
+        metrics.flush_metrics(force=True)
+
+        # Файл процесса удален, значения перенесены один раз, сохранение после переноса не выполняется
+        self.assertEqual(sorted(os.listdir(self.directory)), ['.lock', metrics.RETIRED_SNAPSHOT])
+        retired = metrics.read_snapshot(os.path.join(self.directory, metrics.RETIRED_SNAPSHOT))
+        self.assertEqual(retired['test_requests_total'], [[['home', '200'], 1]])
+
+
+class SlowQueryLoggerTest(TestCase):
+    """
+    Порог журнала медленных запросов и выборочное добавление плана EXPLAIN
+    """
+
+    def logged(self, source='task.sample'):
+        """
+        Записи журнала, добавленные при выполнении двух запросов к базе
+        """
+        with mock.patch('modules.services.slow_queries.logger') as logger, \
+                connection.execute_wrapper(SlowQueryLogger(source)):
+            list(Category.objects.all())
+            Category.objects.filter(slug='missing').exists()
+        return [json.loads(call.args[0]) for call in logger.warning.call_args_list]
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=60 * 1000)
+    def test_fast_queries_are_not_logged(self):
+        self.assertEqual(self.logged(), [])
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_EXPLAIN_RATE=1)
+    def test_slow_queries_are_logged(self):
+        records = self.logged()
+        self.assertEqual(len(records), 2)
+        self.assertEqual({record['source'] for record in records}, {'task.sample'})
+        self.assertEqual(records[0]['database'], 'default')
+        self.assertIn(Category._meta.db_table, records[0]['sql'])
+        self.assertGreaterEqual(records[0]['duration_ms'], 0)
+        # План запрашивается только в PostgreSQL
+        self.assertEqual(['explain' in record for record in records], [connection.vendor == 'postgresql'] * 2)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=100, SLOW_QUERY_EXPLAIN_RATE=0.25)
+    def test_explain_sampling(self):
+        postgresql = mock.Mock(alias='default', vendor='postgresql')
+
+        def log(sql, random_value, many=False):
+            with mock.patch('modules.services.slow_queries.logger') as logger, \
+                    mock.patch('modules.services.slow_queries.random.random', return_value=random_value), \
+                    mock.patch('modules.services.slow_queries.explain_query', return_value='Seq Scan') as explain, \
+                    mock.patch('modules.services.slow_queries.time') as clock:
+                # Запрос длится 150 мс
+                clock.perf_counter.side_effect = [10.0, 10.15]
+                SlowQueryLogger('task.sample')(lambda *args: None, sql, (), many, {'connection': postgresql})
+            record = json.loads(logger.warning.call_args.args[0])
+            return record.get('explain'), explain.called
+
+        self.assertEqual(log('SELECT 1', 0.1), ('Seq Scan', True))
+        self.assertEqual(log('SELECT 1', 0.5), (None, False))
+        # Изменяющие запросы и пакетные запросы не выполняются повторно
+        self.assertEqual(log('UPDATE app_categories SET title = %s', 0.1), (None, False))
+        self.assertEqual(log('SELECT 1', 0.1, many=True), (None, False))
+
+    @skipUnless(connection.vendor == 'postgresql', 'План запроса записывается только в PostgreSQL')
+    def test_explain_without_analyze(self):
+        sql = f'SELECT * FROM {Category._meta.db_table} WHERE slug = %s'
+        connection.ensure_connection()
+        self.assertIn('actual time', explain_query(connection, sql, ['missing'], analyze=True))
+        self.assertNotIn('actual time', explain_query(connection, sql, ['missing']))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=100, SLOW_QUERY_EXPLAIN_RATE=1)
+    def test_request_explain_analyze_is_deferred(self):
+        request = RequestFactory().get('/')
+        request.resolver_match = mock.Mock(view_name='home')
+        postgresql = mock.Mock(alias='default', vendor='postgresql')
+        postgresql.ops.compose_sql.return_value = "SELECT * FROM app_categories WHERE slug = 'missing'"
+        with mock.patch('modules.services.slow_queries.logger') as logger, \
+                mock.patch('modules.services.slow_queries.explain_query', return_value='Seq Scan') as explain, \
+                mock.patch('modules.services.slow_queries.time') as clock, eager_celery():
+            clock.perf_counter.side_effect = [10.0, 10.15]
+            with self.captureOnCommitCallbacks() as callbacks:
+                SlowQueryLogger(request)(lambda *args: None, 'SELECT * FROM app_categories WHERE slug = %s',
+                                         ('missing',), False, {'connection': postgresql})
+            # В запросе пользователя план не запрашивается и запись откладывается до задачи
+            self.assertFalse(explain.called)
+            self.assertFalse(logger.warning.called)
+            callbacks[0]()
+
+        explain.assert_called_once_with(connection, postgresql.ops.compose_sql.return_value, None, analyze=True)
+        record = json.loads(logger.warning.call_args.args[0])
+        self.assertEqual((record['source'], record['explain'], record['duration_ms']), ('home', 'Seq Scan', 150.0))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0.001)
+    def test_task_queries_are_logged(self):
+        task = mock.Mock(request=mock.Mock(is_eager=False, published_at=None))
+        task.name = 'modules.services.tasks.sample_task'
+        for metric in (metrics.celery_task_runtime, metrics.celery_tasks):
+            self.enterContext(mock.patch.object(metric, 'values', {}))
+        self.enterContext(mock.patch.object(metrics, 'flush_metrics'))
+        with mock.patch('modules.services.slow_queries.logger') as logger:
+            task_prerun.send(sender=task, task_id='slow-task', task=task, args=(), kwargs={})
+            try:
+                Category.objects.filter(slug='missing').exists()
+            finally:
+                task_postrun.send(sender=task, task_id='slow-task', task=task, args=(), kwargs={}, state='SUCCESS')
+            # После завершения задачи обертка снята
+            Category.objects.exists()
+        records = [json.loads(call.args[0]) for call in logger.warning.call_args_list]
+        self.assertEqual([record['source'] for record in records], [task.name])
+        self.assertEqual(connection.execute_wrappers, [])
+
+
+class TaskQueueWaitTest(SimpleTestCase):
+    """
+    Заголовок published_at при публикации задачи и гистограмма времени ожидания в очереди
+    """
+
+    def setUp(self):
+        for metric in (metrics.celery_task_queue_wait, metrics.celery_task_runtime, metrics.celery_tasks):
+            self.enterContext(mock.patch.object(metric, 'values', {}))
+        self.published_headers = []
+        # Приемник подключается после add_published_at_header и получает заголовки уже с published_at
+        before_task_publish.connect(self.capture_headers)
+        self.addCleanup(before_task_publish.disconnect, self.capture_headers)
+
+    def capture_headers(self, headers=None, **kwargs):
+        self.published_headers.append(dict(headers))
+
+    def run_in_worker(self, task, headers):
+        """
+        Выполнение задачи как в воркере: заголовки сообщения становятся атрибутами task.request
+        """
+        task.push_request(**headers)
+        try:
+            task_prerun.send(sender=task, task_id=headers['id'], task=task, args=(), kwargs={})
+            task_postrun.send(sender=task, task_id=headers['id'], task=task, args=(), kwargs={}, state='SUCCESS')
+        finally:
+            task.pop_request()
+
+    def test_published_at_header(self):
+        before = time.time()
+        send_followers_notification_task.delay({}, [])
+        headers = self.published_headers[-1]
+        self.assertEqual(headers['task'], send_followers_notification_task.name)
+        self.assertGreaterEqual(headers['published_at'], before)
+        self.assertLessEqual(headers['published_at'], time.time())
+
+        # Заданное отправителем значение не перезаписывается
+        send_followers_notification_task.apply_async(({}, []), headers={'published_at': 1000.0})
+        self.assertEqual(self.published_headers[-1]['published_at'], 1000.0)
+
+    def test_queue_wait_is_observed(self):
+        send_followers_notification_task.delay({}, [])
+        headers = dict(self.published_headers[-1], published_at=time.time() - 3)
+        self.run_in_worker(send_followers_notification_task, headers)
+
+        task = (send_followers_notification_task.name,)
+        counts, total, count = metrics.celery_task_queue_wait.values[task]
+        self.assertEqual(count, 1)
+        self.assertAlmostEqual(total, 3, delta=1)
+        self.assertEqual(counts[metrics.TASK_DURATION_BUCKETS.index(5)], 1)
+        self.assertEqual(metrics.celery_task_runtime.values[task][2], 1)
+        self.assertEqual(metrics.celery_tasks.values, {(send_followers_notification_task.name, 'SUCCESS'): 1})
+
+    def test_eager_task_without_header(self):
+        # Задача без публикации через брокер: время ожидания не записывается, время выполнения - записывается
+        with eager_celery():
+            send_followers_notification_task.delay({}, [])
+        self.assertEqual(self.published_headers, [])
+        self.assertEqual(metrics.celery_task_queue_wait.values, {})
+        self.assertEqual(metrics.celery_tasks.values, {(send_followers_notification_task.name, 'SUCCESS'): 1})
+
+
+class BotMatcherTest(SimpleTestCase):
+    """
+    Классификация посетителей по User-Agent и сетям поисковых роботов без ложных срабатываний на браузерах
+    """
+    user_agents = {
+        SEARCH_ENGINE: (
+            'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+            'Mozilla/5.0 (compatible; YandexBot/3.0; +http://yandex.com/bots)',
+            'Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)',
+            'Mozilla/5.0 (compatible; Baiduspider/2.0; +http://www.baidu.com/search/spider.html)',
+        ),
+        BOT: (
+            '',
+            'Mozilla/5.0 (compatible; AhrefsBot/7.0; +http://ahrefs.com/robot/)',
+            'Mozilla/5.0 (compatible; SemrushBot/7~bl; +http://www.semrush.com/bot.html)',
+            'Slackbot-LinkExpanding 1.0 (+https://api.slack.com/robots)',
+            'TelegramBot (like TwitterBot)',
+            'facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)',
+            'WhatsApp/2.23.20.0 A',
+            'Mozilla/5.0 (compatible; UptimeRobot/2.0; http://www.uptimerobot.com/)',
+            'Feedly/1.0 (+http://www.feedly.com/fetcher.html; 12 subscribers; like FeedFetcher-Google)',
+            'curl/8.4.0',
+            'python-requests/2.31.0',
+            'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) HeadlessChrome/120.0.0.0 '
+            'Safari/537.36',
+        ),
+        HUMAN: (
+            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 '
+            'Safari/537.36',
+            # Производитель телефонов CUBOT, браузер приложения Яндекса, монитор и ТВ Samsung
+            'Mozilla/5.0 (Linux; Android 11; CUBOT KINGKONG 5 Pro) AppleWebKit/537.36 (KHTML, like Gecko) '
+            'Chrome/120.0.0.0 Mobile Safari/537.36',
+            'Mozilla/5.0 (Linux; Android 13; SM-A536B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 '
+            'YaBrowser/23.11.1.107.00 SA/3 YandexSearch/23.111 Mobile Safari/537.36',
+            'Mozilla/5.0 (SMART-TV; LINUX; Tizen 6.5) AppleWebKit/537.36 (KHTML, like Gecko) 85.0.4183.93/6.5 '
+            'TV Safari/537.36 Samsung Smart Monitor M7',
+            'Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+            'Version/17.2 Mobile/15E148 Safari/604.1 RSS Reader Preview',
+        ),
+    }
+
+    def test_user_agents(self):
+        matcher = get_bot_matcher()
+        for visitor_class, user_agents in self.user_agents.items():
+            for user_agent in user_agents:
+                with self.subTest(user_agent=user_agent):
+                    self.assertEqual(matcher.classify(user_agent, '203.0.113.10'), visitor_class)
+
+    def test_search_engine_network_and_extra_tokens(self):
+        browser = self.user_agents[HUMAN][0]
+        self.assertEqual(get_bot_matcher().classify(browser, '66.249.66.1'), SEARCH_ENGINE)
+        self.assertEqual(get_bot_matcher().classify(browser, 'not-an-ip'), HUMAN)
+        # Общие сети Яндекса не считаются сетями роботов: браузер из них - посетитель
+        for ip in ('87.250.250.242', '95.108.213.1', '5.255.253.10'):
+            self.assertEqual(get_bot_matcher().classify(browser, ip), HUMAN)
+        self.assertEqual(get_bot_matcher().classify(self.user_agents[SEARCH_ENGINE][1], '95.108.213.1'), SEARCH_ENGINE)
+
+        matcher = BotMatcher(['examplesearch'], ['internal-checker'], ['198.51.100.0/24'])
+        self.assertEqual(matcher.classify('ExampleSearch 1.0', '203.0.113.10'), SEARCH_ENGINE)
+        self.assertEqual(matcher.classify('Internal-Checker', '203.0.113.10'), BOT)
+        self.assertEqual(matcher.classify(browser, '198.51.100.7'), SEARCH_ENGINE)
+
+
+class ViewExpirationTest(TestCase):
+    """
+    Перенос просмотров старше срока хранения в помесячные итоги: общее количество просмотров не меняется
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user('viewed-author')
+        category = Category.objects.create(title='Просмотры', slug='views', description='Просмотры')
+        cls.articles = [
+            Article.objects.create(title=f'Статья {number}', slug=f'viewed-{number}', author=author,
+                                   category=category, status='published', short_description='Кратко',
+                                   full_description='Текст')
+            for number in range(2)
+        ]
+        cls.cutoff = get_month_start(months=-2)
+        first, second = cls.articles
+        cls.add_views(first, get_month_start(months=-5) + timedelta(days=3), 3)
+        cls.add_views(second, get_month_start(months=-5) + timedelta(days=10), 1)
+        cls.add_views(first, cls.cutoff - timedelta(seconds=1), 2)
+        cls.add_views(first, cls.cutoff, 1)
+        cls.add_views(second, timezone.now(), 4)
+        # Итог месяца, просмотры которого удалены раньше
+        ArticleViewRollup.objects.create(article=first, month=get_month_start(months=-5).date(), views=10)
+
+    @classmethod
+    def add_views(cls, article, viewed_on, count):
+        views = ViewCount.objects.bulk_create([ViewCount(article=article, ip_address=f'198.51.100.{number}')
+                                               for number in range(count)])
+        # viewed_on заполняется auto_now_add, дата просмотра задается после создания
+        ViewCount.objects.filter(pk__in=[view.pk for view in views]).update(viewed_on=viewed_on)
+
+    def view_counts(self):
+        annotated = dict(Article.objects.annotate(total=get_view_count_expression()).values_list('pk', 'total'))
+        counts = {article.pk: Article.objects.get(pk=article.pk).get_view_count() for article in self.articles}
+        self.assertEqual(annotated, counts)
+        return counts
+
+    def test_expire_keeps_totals(self):
+        first, second = self.articles
+        expected = self.view_counts()
+        self.assertEqual(expected, {first.pk: 16, second.pk: 5})
+
+        self.assertEqual(expire_views(retention_months=2), 6)
+        self.assertEqual(self.view_counts(), expected)
+        self.assertFalse(ViewCount.objects.filter(viewed_on__lt=self.cutoff).exists())
+        self.assertEqual(ViewCount.objects.count(), 5)
+        self.assertEqual(sorted(ArticleViewRollup.objects.values_list('article', 'month', 'views')), sorted([
+            (first.pk, get_month_start(months=-5).date(), 13),
+            (first.pk, get_month_start(months=-3).date(), 2),
+            (second.pk, get_month_start(months=-5).date(), 1),
+        ]))
+
+        # Повторный запуск ничего не переносит
+        self.assertEqual(expire_views(retention_months=2), 0)
+        self.assertEqual(self.view_counts(), expected)
+
+
+@override_settings(ESTIMATED_COUNT_THRESHOLD=5,
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class EstimatedCountPaginatorTest(TestCase):
+    """
+    Количество строк больших таблиц: ограниченный подсчет с фильтрами и устаревшая оценка из статистики
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user('rated-author')
+        category = Category.objects.create(title='Оценки', slug='ratings', description='Оценки')
+        article = Article.objects.create(title='Оцениваемая', slug='rated', author=author, category=category,
+                                         status='published', short_description='Кратко', full_description='Текст')
+        Rating.objects.bulk_create(Rating(article=article, ip_address=f'203.0.113.{number}', value=1)
+                                   for number in range(7))
+        cls.superuser = get_user_model().objects.create_superuser('paginator-admin', 'admin@example.com', 'password')
+
+    def paginator(self, estimate, queryset=None):
+        self.enterContext(mock.patch('modules.services.paginators.get_estimated_count', return_value=estimate))
+        return EstimatedCountPaginator(queryset or Rating.objects.order_by('pk'), 3)
+
+    def test_capped_count_with_filters(self):
+        paginator = self.paginator(None, Rating.objects.filter(value=1).order_by('pk'))
+        self.assertEqual(paginator.count, 5)
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertFalse(paginator.estimated)
+
+        # Порог читается при подсчете, а не при импорте модуля
+        with override_settings(ESTIMATED_COUNT_THRESHOLD=100):
+            self.assertEqual(EstimatedCountPaginator(Rating.objects.filter(value=1), 3).count, 7)
+
+    def test_estimate_below_threshold_is_ignored(self):
+        # Оценка ниже порога не используется: подсчет строк, ограниченный порогом
+        paginator = self.paginator(4)
+        self.assertEqual((paginator.count, paginator.estimated), (5, False))
+
+    def test_stale_estimate_above_real_count(self):
+        paginator = self.paginator(40)
+        self.assertEqual((paginator.count, paginator.num_pages), (40, 14))
+        self.assertEqual(len(paginator.page(2)), 3)
+        self.assertTrue(paginator.estimated)
+
+        # Пустая страница в пределах оценки: точный подсчет и последняя страница
+        page = paginator.page(10)
+        self.assertEqual((page.number, len(page)), (3, 1))
+        self.assertEqual((paginator.count, paginator.num_pages, paginator.estimated), (7, 3, False))
+        with self.assertRaises(EmptyPage):
+            paginator.page(10)
+
+    def test_stale_estimate_below_real_count(self):
+        paginator = self.paginator(5)
+        self.assertEqual(paginator.num_pages, 2)
+        page = paginator.page(3)
+        self.assertEqual((page.number, len(page), paginator.count), (3, 1, 7))
+
+    def test_admin_last_estimated_page(self):
+        self.client.force_login(self.superuser)
+        url = reverse('admin:blog_rating_changelist')
+        with mock.patch('modules.services.paginators.get_estimated_count', return_value=500):
+            response = self.client.get(url, {'p': 9})
+        # Без исправления пустая страница приводила к перенаправлению на ?e=1
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 7)
+        self.assertEqual((response.context['cl'].page_num, response.context['cl'].result_count), (1, 7))
+
+
+class StaticFilesTest(SimpleTestCase):
+    """
+    Сборки JS и collectstatic: файлы с хэшем в имени и их сжатые копии
+    """
+
+    def setUp(self):
+        self.root = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.source = self.root / 'src'
+        for name, content in {
+            'js/first.js': '// Первый файл\nfunction first() {\n    return 1;\n}\n',
+            'js/second.js': 'second(`\n    строка шаблона\n`);\n',
+            'js/large.js': 'var value = 1;\n' * COMPRESS_MIN_SIZE,
+            'css/small.css': 'body { margin: 0; }\n',
+            'img/large.png': 'x' * COMPRESS_MIN_SIZE * 2,
+        }.items():
+            (self.source / name).parent.mkdir(parents=True, exist_ok=True)
+            (self.source / name).write_text(content, encoding='utf-8')
+        self.enterContext(override_settings(
+            STATICFILES_DIRS=[self.source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STATIC_BUNDLES={'bundle/site.js': ['js/first.js', 'js/second.js']},
+            STATIC_ROOT=self.root / 'static',
+        ))
+        self.finder = ScriptBundleFinder()
+        self.finder.storage = FileSystemStorage(location=self.root / 'bundles')
+
+    def test_bundle_finder(self):
+        with mock.patch('modules.services.staticfiles.rjsmin', mock.Mock(jsmin=str.strip)):
+            file = Path(self.finder.find('bundle/site.js'))
+        self.assertEqual(file.read_text(encoding='utf-8'),
+                         '// Первый файл\nfunction first() {\n    return 1;\n};\nsecond(`\n    строка шаблона\n`);\n')
+        self.assertEqual(self.finder.find('bundle/site.js', all=True), [str(file)])
+        self.assertEqual(self.finder.find('js/first.js'), [])
+        self.assertEqual([name for name, _ in self.finder.list([])], ['bundle/site.js'])
+        # Временные файлы заменены сборкой
+        self.assertEqual(os.listdir(file.parent), ['site.js'])
+
+        with override_settings(STATIC_BUNDLES={'bundle/site.js': ['js/missing.js']}), \
+                self.assertRaisesMessage(ImproperlyConfigured, "'js/missing.js' not found"):
+            self.finder.find('bundle/site.js')
+
+    def test_bundle_without_minifier(self):
+        # Без rjsmin исходный код только склеивается: отступы внутри шаблонных строк сохраняются
+        with mock.patch('modules.services.staticfiles.rjsmin', None):
+            file = Path(self.finder.find('bundle/site.js'))
+        self.assertIn('second(`\n    строка шаблона\n`);', file.read_text(encoding='utf-8'))
+        self.assertIn('// Первый файл', file.read_text(encoding='utf-8'))
+
+    def test_failed_build_keeps_previous_bundle(self):
+        file = Path(self.finder.find('bundle/site.js'))
+        (self.source / 'js/second.js').write_text('changed();\n', encoding='utf-8')
+        with mock.patch('modules.services.staticfiles.os.replace', side_effect=OSError), \
+                self.assertRaises(OSError):
+            self.finder.build('bundle/site.js')
+        self.assertIn('строка шаблона', file.read_text(encoding='utf-8'))
+        self.assertEqual(os.listdir(file.parent), ['site.js'])
+
+    def collectstatic(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        manifest = json.loads((self.root / 'static/staticfiles.json').read_text())['paths']
+        return {name: self.root / 'static' / hashed_name for name, hashed_name in manifest.items()}
+
+    def test_compressed_copies_without_brotli(self):
+        with mock.patch('modules.services.staticfiles.brotli', None):
+            files = self.collectstatic()
+        large = files['js/large.js']
+        self.assertEqual(gzip.decompress(large.with_name(large.name + '.gz').read_bytes()), large.read_bytes())
+        self.assertFalse(large.with_name(large.name + '.br').exists())
+        # Маленькие файлы и типы без выигрыша от сжатия остаются без копий
+        for name in ('css/small.css', 'img/large.png'):
+            self.assertFalse(files[name].with_name(files[name].name + '.gz').exists())
+
+    def test_compressed_copies_with_brotli(self):
+        brotli = mock.Mock(compress=lambda content: b'br:' + content[:10])
+        with mock.patch('modules.services.staticfiles.brotli', brotli):
+            large = self.collectstatic()['js/large.js']
+        self.assertEqual(large.with_name(large.name + '.br').read_bytes(), b'br:var value ')
+        self.assertTrue(large.with_name(large.name + '.gz').exists())
+
+    def test_stored_name_without_manifest(self):
+        with override_settings(STATIC_MANIFEST_STRICT=False):
+            self.assertEqual(CompressedManifestStaticFilesStorage().url('js/first.js'), '/static/js/first.js')
+        with override_settings(STATIC_MANIFEST_STRICT=True), self.assertRaises(ValueError):
+            CompressedManifestStaticFilesStorage().url('js/first.js')
+
+    @override_settings(STATIC_MANIFEST_STRICT=True)
+    def test_stored_name_from_manifest(self):
+        self.collectstatic()
+        storage = CompressedManifestStaticFilesStorage()
+        self.assertRegex(storage.url('js/first.js'), r'^/static/js/first\.[0-9a-f]{12}\.js$')
+        # Файл, не попавший в манифест, в production не отдается без хэша
+        with self.assertRaisesMessage(ValueError, 'Missing staticfiles manifest entry'):
+            storage.url('js/added-later.js')
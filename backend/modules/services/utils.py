@@ -1,12 +1,14 @@
+import re
 from uuid import uuid4
 from pytils.translit import slugify
+import hashlib
 import os
+from django.core.files import File
 from django.core.files.storage import FileSystemStorage
 # from backend import settings
 from django.conf import settings
 from urllib.parse import urljoin
 from datetime import datetime
-from PIL import Image, ImageOps
 
 
 class CkeditorCustomStorage(FileSystemStorage):
@@ -28,6 +30,62 @@ class CkeditorCustomStorage(FileSystemStorage):
     base_url = urljoin(settings.MEDIA_URL, 'uploads/')
 
 
+class CkeditorHashedStorage(FileSystemStorage):
+    """
+    Хранилище медиа файлов редактора с адресацией по содержимому:
+    файл сохраняется один раз под именем blobs/<2 символа хэша>/<sha256>.<расширение>,
+    при повторной загрузке возвращается уже существующий файл
+    """
+    blobs_folder = 'blobs'
+
+    location = CkeditorCustomStorage.location
+    base_url = CkeditorCustomStorage.base_url
+
+    def get_content_digest(self, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        content.seek(0)
+        return sha256.hexdigest()
+
+    def get_blob_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        return f'{self.blobs_folder}/{digest[:2]}/{digest}{extension}'
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        blob_name = self.get_blob_name(self.get_content_digest(content), name or content.name)
+        if self.exists(blob_name):
+            # Повторная загрузка обновляет время изменения: ckeditor_cleanup не удалит файл,
+            # который используется в еще не сохраненной статье
+            os.utime(self.path(blob_name))
+            return blob_name
+        saved_name = self._save(blob_name, content)
+        if saved_name != blob_name:
+            # Тот же файл параллельно сохранил другой запрос, оставляем только его копию
+            self.delete(saved_name)
+        return blob_name
+
+
+# Литералы SQL запроса: строки, числа и списки значений IN (...)
+SQL_LITERALS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?)'),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+def get_sql_fingerprint(sql):
+    """
+    Отпечаток SQL запроса без значений параметров: одинаковые запросы с разными значениями совпадают (поиск N+1)
+    """
+    for pattern, replacement in SQL_LITERALS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
 def unique_slugify(instance, slug):
     """
     Генератор уникальных SLUG для моделей, в случае существования такого SLUG
@@ -47,17 +105,3 @@ def get_client_ip(request):
     ip = x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
     return ip
 
-
-def image_compress(image_path, height, width):
-    """
-    Оптимизация изображений
-    """
-    img = Image.open(image_path)
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
-    if img.height > height or img.width > width:
-        output_size = (height, width)
-        img.thumbnail(output_size)
-    img = ImageOps.exif_transpose(img)
-    img.save(image_path, format='JPEG', quality=90, optimize=True)
-
@@ -7,6 +7,7 @@ from django_recaptcha.fields import ReCaptchaField
 from django_recaptcha.widgets import ReCaptchaV2Checkbox
 
 from .models import Profile, Feedback
+from ..services.tasks import send_password_reset_email_message_task
 
 
 class UserUpdateForm(forms.ModelForm):
@@ -149,6 +150,17 @@ class UserForgotPasswordForm(PasswordResetForm):
                 'autocomplete': 'off'
             })
 
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        """
+        Отправка письма через Celery вместо SMTP соединения внутри запроса
+        """
+        context_user = context['user']
+        context = {key: value for key, value in context.items() if key != 'user'}
+        context['user_id'] = context_user.pk
+        send_password_reset_email_message_task.delay(subject_template_name, email_template_name, context,
+                                                     from_email, to_email, html_email_template_name)
+
 
 class UserSetNewPasswordForm(SetPasswordForm):
     """
@@ -1,8 +1,17 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import cache
+from django.db import connections
 from django.utils import timezone
 from django.utils.deprecation import MiddlewareMixin
 
+from modules.services import metrics
+from modules.services.routers import database_request_state
+from modules.services.slow_queries import SlowQueryLogger
+
 
 class ActiveUserMiddleware(MiddlewareMixin):
     """
@@ -18,3 +27,96 @@ class ActiveUserMiddleware(MiddlewareMixin):
                 User.objects.filter(id=request.user.id).update(last_login=timezone.now())
                 # Устанавливаем кэширование на 300 секунд с текущей датой по ключу Last-seen-id-пользователя
                 cache.set(cache_key, timezone.now(), 300)
+
+
+class ReplicaPinningMiddleware:
+    """
+    Закрепление запросов за основной базой на REPLICA_PIN_SECONDS после записи,
+    чтобы пользователь сразу видел свои изменения, а не отстающую реплику
+    """
+    cookie_name = 'pin_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with database_request_state(pinned=self.cookie_name in request.COOKIES) as state:
+            # Шаблонные ответы рендерятся обработчиком внутри контекста, ленивые выборки учитывают закрепление
+            response = self.get_response(request)
+        if state['wrote'] and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(self.cookie_name, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+                                samesite='Lax')
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Метрики запроса: количество и время SQL запросов, попадания в кэш и время рендера шаблона.
+    Персоналу сайта показатели отдаются в заголовке Server-Timing, все запросы попадают в гистограммы /metrics
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        request_metrics, token = metrics.start_request_metrics()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(request_metrics))
+                response = self.get_response(request)
+        finally:
+            metrics.finish_request_metrics(token)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        # Маршрут по имени представления, а не по адресу: количество меток не зависит от slug и id
+        route = (match.view_name or match.route) if match else 'unmatched'
+        metrics.http_requests.inc(route=route, method=request.method, status=response.status_code)
+        metrics.http_request_duration.observe(duration, route=route, method=request.method)
+        metrics.http_db_queries.observe(request_metrics.db_queries, route=route)
+        metrics.http_db_duration.observe(request_metrics.db_time, route=route)
+        if request_metrics.template_time:
+            metrics.http_template_duration.observe(request_metrics.template_time, route=route)
+
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            server_timing = request_metrics.get_server_timing(duration)
+            if response.has_header('Server-Timing'):
+                server_timing = f'{response["Server-Timing"]}, {server_timing}'
+            response['Server-Timing'] = server_timing
+        metrics.flush_metrics()
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Шаблон рендерится после всех process_template_response: время считается до post-render callback
+        """
+        request_metrics = metrics.get_request_metrics()
+        if request_metrics is not None:
+            started = time.perf_counter()
+
+            def record_render_time(rendered_response):
+                request_metrics.template_time += time.perf_counter() - started
+
+            response.add_post_render_callback(record_render_time)
+        return response
+
+
+class SlowQueryMiddleware:
+    """
+    Журнал медленных SQL запросов с именем представления (SLOW_QUERY_THRESHOLD_MS, 0 - отключено)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SLOW_QUERY_THRESHOLD_MS:
+            return self.get_response(request)
+        slow_query_logger = SlowQueryLogger(request)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(slow_query_logger))
+            return self.get_response(request)
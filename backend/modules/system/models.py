@@ -1,8 +1,9 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import FileExtensionValidator
 from django.urls import reverse
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from datetime import date, timedelta
 from django.contrib.auth.models import User
@@ -10,6 +11,8 @@ from django.utils import timezone
 from django.core.cache import cache
 
 from modules.services.utils import unique_slugify
+from modules.services.images import delete_image_variants, get_default_avatar_name, save_default_avatar
+from modules.services.tasks import generate_image_variants_task
 
 # Create your models here.
 
@@ -27,6 +30,7 @@ class Profile(models.Model):
         blank=True,
         validators=[FileExtensionValidator(allowed_extensions=['png', 'jpg', 'jpeg', 'gif'])]
     )
+    avatar_variants = models.JSONField(verbose_name='Варианты аватара', default=dict, blank=True, editable=False)
     bio = models.TextField(max_length=500, blank=True, verbose_name='Информация о себе')
     birth_date = models.DateField(null=True, blank=True, verbose_name='Дата рождения')
 
@@ -39,14 +43,43 @@ class Profile(models.Model):
         verbose_name_plural = 'Профили'
         ordering = ('user',)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__avatar = self.avatar.name if self.pk and 'avatar' not in self.get_deferred_fields() else None
+        self.__slug = self.slug if self.pk and 'slug' not in self.get_deferred_fields() else None
+
     def save(self, *args, **kwargs):
         """
         Сохранение полей модели при их отсутствии заполнения
         """
         if not self.slug:
             self.slug = unique_slugify(self, self.user.username)
+
+        avatar_changed = 'avatar' not in self.get_deferred_fields() and self.__avatar != self.avatar.name
+        if avatar_changed and self.avatar_variants:
+            old_variants, storage = self.avatar_variants, self.avatar.storage
+            transaction.on_commit(lambda: delete_image_variants(storage, old_variants))
+            self.avatar_variants = {}
         super().save(*args, **kwargs)
 
+        if avatar_changed and self.avatar:
+            transaction.on_commit(lambda: generate_image_variants_task.delay(
+                'system.Profile', self.pk, 'avatar', settings.AVATAR_VARIANT_WIDTHS))
+        if avatar_changed:
+            self.__avatar = self.avatar.name
+
+        slug_changed = 'slug' not in self.get_deferred_fields() and self.__slug != self.slug
+        if slug_changed or avatar_changed:
+            # Аватар по умолчанию генерируется только для профиля без загруженного аватара:
+            # при создании профиля, смене slug или удалении аватара
+            slug, storage = self.slug, self.avatar.storage
+            if not self.avatar:
+                transaction.on_commit(lambda: save_default_avatar(storage, slug))
+            if slug_changed and self.__slug:
+                old_slug = self.__slug
+                transaction.on_commit(lambda: storage.delete(get_default_avatar_name(old_slug)))
+            self.__slug = self.slug
+
     def __str__(self):
         """
         Возвращение строки
@@ -61,9 +94,13 @@ class Profile(models.Model):
 
     @property
     def get_avatar(self):
+        if self.avatar_variants.get('variants'):
+            # Вариант, ближайший к размеру вывода аватара (150px)
+            variant = min(self.avatar_variants['variants'], key=lambda item: abs(item['width'] - 150))
+            return self.avatar.storage.url(variant['jpeg'])
         if self.avatar:
             return self.avatar.url
-        return f'https://ui-avatars.com/api/?size=150&background=random&name={self.slug}'
+        return self.avatar.storage.url(get_default_avatar_name(self.slug))
 
     def is_online(self):
         last_seen = cache.get(f'last-seen-{self.user.id}')
@@ -83,6 +120,14 @@ def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
 
 
+@receiver(post_delete, sender=Profile)
+def delete_profile_avatar_variants(sender, instance, **kwargs):
+    storage = instance.avatar.storage
+    if instance.avatar_variants:
+        transaction.on_commit(lambda: delete_image_variants(storage, instance.avatar_variants))
+    transaction.on_commit(lambda: storage.delete(get_default_avatar_name(instance.slug)))
+
+
 class Feedback(models.Model):
     """
     Модель обратной связи
@@ -1,3 +1,170 @@
-from django.test import TestCase
+import tempfile
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from PIL import Image
+
+from modules.services.images import get_default_avatar_name
+from modules.services.testing import QueryBudgetTestCase, eager_celery
+from .models import Profile
+from .urls import urlpatterns
 
 # Create your tests here.
+
+# Максимальное количество SQL запросов для каждого адреса system/urls.py
+QUERY_BUDGETS = {
+    'profile_edit': 8,
+    'profile_detail': 9,
+    'follow': 8,
+    'register': 4,
+    'login': 5,
+    'logout': 5,
+    'password_change': 8,
+    'password_reset': 4,
+    'password_reset_confirm': 5,
+    'email_confirmation_sent': 4,
+    'confirm_email': 13,
+    'email_confirmed': 4,
+    'email_confirmation_failed': 4,
+    'feedback': 4,
+}
+
+
+class SystemQueryBudgetTest(QueryBudgetTestCase):
+    """
+    Бюджет SQL запросов для представлений пользователей и обратной связи
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.profile = (Profile.objects.select_related('user').annotate(follower_count=Count('followers'))
+                       .order_by('-follower_count', 'pk').first())
+        cls.user = cls.profile.user
+        cls.other_profile = Profile.objects.exclude(pk=cls.profile.pk).select_related('user').first()
+
+    def get_token_kwargs(self):
+        return {'uidb64': urlsafe_base64_encode(force_bytes(self.user.pk)),
+                'token': default_token_generator.make_token(self.user)}
+
+    def test_every_url_has_budget(self):
+        self.assertEqual({pattern.name for pattern in urlpatterns}, set(QUERY_BUDGETS))
+
+    def test_profile_detail(self):
+        self.assertQueryBudget(self.profile.get_absolute_url(), QUERY_BUDGETS['profile_detail'])
+
+    def test_profile_edit(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('profile_edit'), QUERY_BUDGETS['profile_edit'])
+
+    def test_follow(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('follow', args=[self.other_profile.slug]), QUERY_BUDGETS['follow'],
+                               method='post', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_register(self):
+        self.assertQueryBudget(reverse('register'), QUERY_BUDGETS['register'])
+
+    def test_login(self):
+        self.assertQueryBudget(reverse('login'), QUERY_BUDGETS['login'])
+
+    def test_logout(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('logout'), QUERY_BUDGETS['logout'], method='post', status_code=302)
+
+    def test_password_change(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(reverse('password_change'), QUERY_BUDGETS['password_change'])
+
+    def test_password_reset(self):
+        self.assertQueryBudget(reverse('password_reset'), QUERY_BUDGETS['password_reset'])
+
+    def test_password_reset_confirm(self):
+        self.assertQueryBudget(reverse('password_reset_confirm', kwargs=self.get_token_kwargs()),
+                               QUERY_BUDGETS['password_reset_confirm'], status_code=302)
+
+    def test_email_confirmation_sent(self):
+        self.assertQueryBudget(reverse('email_confirmation_sent'), QUERY_BUDGETS['email_confirmation_sent'])
+
+    def test_confirm_email(self):
+        self.assertQueryBudget(reverse('confirm_email', kwargs=self.get_token_kwargs()),
+                               QUERY_BUDGETS['confirm_email'], status_code=302)
+
+    def test_email_confirmed(self):
+        self.assertQueryBudget(reverse('email_confirmed'), QUERY_BUDGETS['email_confirmed'])
+
+    def test_email_confirmation_failed(self):
+        self.assertQueryBudget(reverse('email_confirmation_failed'), QUERY_BUDGETS['email_confirmation_failed'])
+
+    def test_feedback(self):
+        self.assertQueryBudget(reverse('feedback'), QUERY_BUDGETS['feedback'])
+
+
+class ProfileDefaultAvatarTest(TestCase):
+    """
+    Аватар по умолчанию: создается только для профиля без загруженного аватара, удаляется при смене slug
+    """
+
+    def setUp(self):
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.enterContext(eager_celery())
+
+    def create_user(self, username):
+        with self.captureOnCommitCallbacks(execute=True):
+            return get_user_model().objects.create_user(username, f'{username}@example.com', 'password')
+
+    def get_uploaded_avatar(self):
+        buffer = BytesIO()
+        Image.new('RGB', (320, 320), (30, 120, 200)).save(buffer, format='JPEG')
+        return SimpleUploadedFile('avatar.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def assertDefaultAvatar(self, slug, exists=True):
+        self.assertEqual(default_storage.exists(get_default_avatar_name(slug)), exists, slug)
+
+    def test_profile_without_avatar(self):
+        profile = self.create_user('ivan-petrov').profile
+        self.assertDefaultAvatar(profile.slug)
+        self.assertEqual(profile.get_avatar, default_storage.url(get_default_avatar_name(profile.slug)))
+
+    def test_profile_with_uploaded_avatar(self):
+        user = self.create_user('anna')
+        with self.captureOnCommitCallbacks(execute=True):
+            user.profile.delete()
+        self.assertDefaultAvatar('anna', exists=False)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = Profile.objects.create(user=user, avatar=self.get_uploaded_avatar())
+        self.assertDefaultAvatar(profile.slug, exists=False)
+        self.assertTrue(Profile.objects.get(pk=profile.pk).avatar_variants['variants'])
+
+        # Аватар удален: выводится аватар по умолчанию, он должен существовать
+        profile.avatar = ''
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertDefaultAvatar(profile.slug)
+
+    def test_slug_rename(self):
+        profile = self.create_user('sergey').profile
+        profile.slug = 'sergey-renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertDefaultAvatar('sergey', exists=False)
+        self.assertDefaultAvatar('sergey-renamed')
+
+        profile.avatar = self.get_uploaded_avatar()
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        profile.slug = 'sergey-with-avatar'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertDefaultAvatar('sergey-renamed', exists=False)
+        self.assertDefaultAvatar('sergey-with-avatar', exists=False)
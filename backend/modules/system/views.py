@@ -13,7 +13,9 @@ from django.db import transaction
 from django.contrib.messages.views import SuccessMessageMixin
 from django.contrib.auth.views import LoginView, LogoutView, PasswordChangeView, PasswordResetView, \
     PasswordResetConfirmView
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
 
 from .models import Profile, Feedback
 from .forms import UserUpdateForm, ProfileUpdateForm, UserRegisterForm, UserLoginForm, UserPasswordChangeForm, \
@@ -21,6 +23,7 @@ from .forms import UserUpdateForm, ProfileUpdateForm, UserRegisterForm, UserLogi
 from ..services.mixins import UserIsNotAuthenticated
 # from ..services.email import send_contact_email_message
 from ..services.utils import get_client_ip
+from ..services.metrics import render_metrics
 from ..services.tasks import send_contact_email_message_tasks, send_activate_email_message_task
 
 # Create your views here.
@@ -309,3 +312,15 @@ class ProfileFollowingCreateView(View):
             'status': status,
         }
         return JsonResponse(data, status=200)
+
+
+class MetricsView(View):
+    """
+    Метрики в формате Prometheus: доступны с адресов METRICS_ALLOWED_IPS и персоналу сайта
+    """
+
+    def get(self, request):
+        # Адрес соединения, а не X-Forwarded-For: заголовок может подставить клиент
+        if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+            raise PermissionDenied
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
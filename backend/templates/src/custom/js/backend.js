@@ -14,4 +14,5 @@ const getCookie = (name) => {
     return cookieValue;
 };
 
-const csrftoken = getCookie("csrftoken");
\ No newline at end of file
+// Изменяется после получения cookie на страницах, отрисованных заранее (includes/page_view_beacon.html)
+let csrftoken = getCookie("csrftoken");
\ No newline at end of file
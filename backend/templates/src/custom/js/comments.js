@@ -1,12 +1,14 @@
 const commentForm = document.forms.commentForm;
-const commentFormContent = commentForm.content;
-const commentFormParentInput = commentForm.parent;
-const commentFormSubmit = commentForm.commentSubmit;
-const commentArticleId = commentForm.getAttribute('data-article-id');
+const commentFormContent = commentForm?.content;
+const commentFormParentInput = commentForm?.parent;
+const commentFormSubmit = commentForm?.commentSubmit;
+const commentArticleId = commentForm?.getAttribute('data-article-id');
 
-commentForm.addEventListener('submit', createComment);
-
-replyUser()
+// Скрипт входит в общую сборку custom/js/site.js: форма комментариев есть только на странице статьи
+if (commentForm) {
+  commentForm.addEventListener('submit', createComment);
+  replyUser()
+}
 
 function replyUser() {
   document.querySelectorAll('.btn-reply').forEach(e => {
@@ -1,7 +1,8 @@
 const followBtn = document.querySelector('.btn-follow');
 const followerBox = document.querySelector('.followers-box');
 
-followBtn.addEventListener('click', event => {
+// Скрипт входит в общую сборку custom/js/site.js: кнопка подписки есть только на странице профиля
+followBtn?.addEventListener('click', event => {
     const userSlug = event.target.dataset.slug;
     fetch(`/user/follow/${userSlug}/`, {
         method: 'POST',